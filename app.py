@@ -3,15 +3,41 @@ import pymysql
 import bcrypt
 import json
 from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qsl
 from functools import wraps
 import logging
 import traceback
 import sys
 import threading
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
+from collections import OrderedDict, deque
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import pyotp
 import ntplib
 import time
+import math
+import statistics
+import random
+import re
+import csv
+import zlib
+import uuid
+import shutil
+import tempfile
+import heapq
+import hashlib
+import gzip
+import sqlite3
+import base64
+import io
+import marshal
+import zipfile
+import tarfile
+import fcntl
+import multiprocessing
 
 import os
 from dotenv import load_dotenv
@@ -25,6 +51,28 @@ RUNNING_HOST = os.getenv("RUNNING_HOST")
 RUNNING_PORT = os.getenv("RUNNING_PORT")
 SSL_CERT_PATH = os.getenv("SSL_CERT_PATH")
 SSL_KEY_PATH = os.getenv("SSL_KEY_PATH")
+# Optional lightweight listener serving only /httpcode and /sequence-endpoint mocks
+MOCK_SERVER_HOST = os.getenv("MOCK_SERVER_HOST", RUNNING_HOST)
+MOCK_SERVER_PORT = os.getenv("MOCK_SERVER_PORT")
+# Working directory for server-side log comparisons (partitions and result sets)
+LOG_COMPARE_DIR = os.getenv("LOG_COMPARE_DIR", os.path.join(tempfile.gettempdir(), "thewebhook-log-compare"))
+LOG_COMPARE_RESULT_TTL_HOURS = int(os.getenv("LOG_COMPARE_RESULT_TTL_HOURS", "24"))
+# Worker processes diffing partition pairs in parallel (1 diffs inline in the request)
+LOG_COMPARE_WORKERS = int(os.getenv("LOG_COMPARE_WORKERS", str(os.cpu_count() or 1)))
+# Disk budget for cached comparison results (least recently used results are evicted first)
+LOG_COMPARE_CACHE_MAX_MB = int(os.getenv("LOG_COMPARE_CACHE_MAX_MB", "5120"))
+# Worker processes diffing document pairs of a batch JSON comparison (1 diffs inline)
+JSON_BATCH_WORKERS = int(os.getenv("JSON_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# Memory budget for cached code formatter results (least recently used evicted first)
+CODE_FORMAT_CACHE_MAX_MB = int(os.getenv("CODE_FORMAT_CACHE_MAX_MB", "64"))
+# Memory budget for cached webhook request diffs (least recently used evicted first)
+WEBHOOK_DIFF_CACHE_MAX_MB = int(os.getenv("WEBHOOK_DIFF_CACHE_MAX_MB", "32"))
+# Worker processes formatting the large snippets of a batch (1 formats inline)
+CODE_FORMAT_WORKERS = int(os.getenv("CODE_FORMAT_WORKERS", str(os.cpu_count() or 1)))
+# Working directory for webhook drift job state (shared by the server processes of one host)
+WEBHOOK_DRIFT_DIR = os.getenv("WEBHOOK_DRIFT_DIR", os.path.join(tempfile.gettempdir(), "thewebhook-webhook-drift"))
+# Drift jobs run at once per server process, each on its own database connection
+WEBHOOK_DRIFT_WORKERS = int(os.getenv("WEBHOOK_DRIFT_WORKERS", "2"))
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -92,47 +140,141 @@ NTP_SERVERS = [
     'time.cloudflare.com',
     'time.nist.gov'
 ]
-NTP_CACHE_DURATION = 300  # Cache NTP time for 5 minutes
-ntp_offset_cache = {'offset': 0, 'timestamp': 0}
+NTP_CACHE_DURATION = 300  # An offset older than this is stale (still served while a refresh runs)
+NTP_REFRESH_INTERVAL = 240  # Background refresh period, ahead of expiry
+NTP_RETRY_INTERVAL = 30  # Wait after all servers failed before trying again
+# Every refresh queries all servers concurrently, several samples each. A server's offset is
+# that of its lowest-delay sample (the least skewed by network queuing); the offset used is
+# the median across servers, ignoring those too far from it.
+NTP_QUERY_TIMEOUT = 2
+NTP_SAMPLES_PER_SERVER = 4
+NTP_SAMPLE_SPACING = 0.25  # seconds between samples from one server
+NTP_OUTLIER_SECONDS = 0.25  # servers further than this plus their delay from the median are ignored
+NTP_DRIFT_HISTORY = 16  # measured offsets kept to estimate the drift of the system clock
+NTP_MAX_DRIFT = 500e-6  # clamp for the drift estimate (500 ppm, the NTP frequency tolerance)
+ntp_offset_cache = {'offset': 0, 'timestamp': 0, 'drift': 0.0, 'servers': {}}
+ntp_offset_history = deque(maxlen=NTP_DRIFT_HISTORY)  # (timestamp, offset) per successful refresh
 ntp_cache_lock = threading.Lock()
+# Only the refresher thread queries NTP servers, so concurrent requests never stampede them
+ntp_refresh_requested = threading.Event()
+ntp_refresher_started = False
+ntp_refresher_lock = threading.Lock()
 
 
-def get_ntp_offset():
+def sample_ntp_server(server):
     """
-    Get the time offset from NTP servers.
-    Returns the offset in seconds between system time and NTP time.
-    Uses cached value if available and recent.
+    Take NTP_SAMPLES_PER_SERVER samples from one server. Returns its stats, with the offset and
+    delay of the lowest-delay sample. An unreachable server is given up after its first failure.
     """
-    global ntp_offset_cache
+    ntp_client = ntplib.NTPClient()
+    samples, errors = [], []
+    for attempt in range(NTP_SAMPLES_PER_SERVER):
+        if attempt:
+            time.sleep(NTP_SAMPLE_SPACING)
+        try:
+            response = ntp_client.request(server, version=3, timeout=NTP_QUERY_TIMEOUT)
+            samples.append((response.delay, response.offset, response.stratum))
+        except Exception as e:
+            errors.append(str(e))
+            if not samples:
+                break
 
-    with ntp_cache_lock:
-        # Check if we have a recent cached offset
-        if time.time() - ntp_offset_cache['timestamp'] < NTP_CACHE_DURATION:
-            return ntp_offset_cache['offset']
+    stats = {'server': server, 'samples': len(samples), 'failures': len(errors),
+             'error': errors[-1] if errors else None}
+    if samples:
+        delay, offset, stratum = min(samples)
+        stats.update(offset=offset, delay=delay, median_delay=statistics.median(sample[0] for sample in samples),
+                     stratum=stratum, outlier=False)
+    return stats
 
-    # Try multiple NTP servers
-    ntp_client = ntplib.NTPClient()
 
-    for server in NTP_SERVERS:
+def sample_ntp_offset():
+    """
+    Sample all NTP_SERVERS concurrently. Returns (offset, servers): the median offset of the
+    servers that agree with each other (None if no server answered) and per-server stats.
+    """
+    with ThreadPoolExecutor(max_workers=len(NTP_SERVERS)) as pool:
+        servers = list(pool.map(sample_ntp_server, NTP_SERVERS))
+
+    answered = [stats for stats in servers if 'offset' in stats]
+    if not answered:
+        return None, servers
+    median = statistics.median(stats['offset'] for stats in answered)
+    for stats in answered:
+        stats['outlier'] = abs(stats['offset'] - median) > NTP_OUTLIER_SECONDS + stats['delay']
+    agreeing = [stats for stats in answered if not stats['outlier']] or answered
+    return statistics.median(stats['offset'] for stats in agreeing), servers
+
+
+def ntp_drift_rate(history):
+    """Least-squares slope of offset over time (seconds per second), 0 until there are 3 points a minute apart"""
+    if len(history) < 3 or history[-1][0] - history[0][0] < 60:
+        return 0.0
+    mean_time = sum(point[0] for point in history) / len(history)
+    mean_offset = sum(point[1] for point in history) / len(history)
+    variance = sum((point[0] - mean_time) ** 2 for point in history)
+    slope = sum((point[0] - mean_time) * (point[1] - mean_offset) for point in history) / variance
+    return max(-NTP_MAX_DRIFT, min(NTP_MAX_DRIFT, slope))
+
+
+def refresh_ntp_offset():
+    """Sample NTP and store the new offset and drift; on failure the previous offset is kept"""
+    offset, servers = sample_ntp_offset()
+    now = time.time()
+    with ntp_cache_lock:
+        ntp_offset_cache['servers'] = {stats['server']: stats for stats in servers}
+        if offset is None:
+            log("All NTP servers failed, keeping the previous offset")
+            return False
+        ntp_offset_history.append((now, offset))
+        ntp_offset_cache.update(offset=offset, timestamp=now, drift=ntp_drift_rate(ntp_offset_history))
+        drift = ntp_offset_cache['drift']
+    used = sum(1 for stats in servers if 'offset' in stats and not stats['outlier'])
+    log(f"NTP sync: offset {offset:.4f}s from {used}/{len(servers)} servers, drift {drift * 1e6:.1f} ppm")
+    return True
+
+
+def ntp_refresher():
+    """Keep the NTP offset fresh: refresh every NTP_REFRESH_INTERVAL, or early when a request finds it stale"""
+    while True:
         try:
-            response = ntp_client.request(server, version=3, timeout=2)
-            offset = response.offset
+            refreshed = refresh_ntp_offset()
+        except Exception as e:
+            log(f"Error refreshing NTP offset: {e}")
+            refreshed = False
+        # Requests that found the offset stale while this refresh ran are answered by it
+        ntp_refresh_requested.clear()
+        if refreshed:
+            ntp_refresh_requested.wait(NTP_REFRESH_INTERVAL)
+        else:
+            time.sleep(NTP_RETRY_INTERVAL)
 
-            with ntp_cache_lock:
-                ntp_offset_cache = {
-                    'offset': offset,
-                    'timestamp': time.time()
-                }
 
-            log(f"NTP sync successful with {server}, offset: {offset:.3f}s")
-            return offset
-        except Exception as e:
-            log(f"NTP sync failed with {server}: {e}")
-            continue
+def start_ntp_refresher():
+    """Start the background refresher once"""
+    global ntp_refresher_started
+    with ntp_refresher_lock:
+        if ntp_refresher_started:
+            return
+        ntp_refresher_started = True
+        threading.Thread(target=ntp_refresher, daemon=True).start()
+
 
-    # If all servers fail, return 0 (use system time)
-    log("All NTP servers failed, using system time")
-    return 0
+def get_ntp_offset():
+    """
+    Get the time offset from NTP servers.
+    Returns the offset in seconds between system time and NTP time, as cached by the background
+    refresher and corrected for clock drift. Never waits on the network: a stale offset is
+    returned while a refresh is requested, and 0 (system time) until the first sync.
+    """
+    start_ntp_refresher()
+    with ntp_cache_lock:
+        offset, timestamp, drift = ntp_offset_cache['offset'], ntp_offset_cache['timestamp'], ntp_offset_cache['drift']
+    age = time.time() - timestamp
+    if age >= NTP_CACHE_DURATION:
+        ntp_refresh_requested.set()
+    # Carry the offset forward by the measured drift since it was sampled
+    return offset + drift * min(age, NTP_CACHE_DURATION) if timestamp else offset
 
 
 def get_ntp_time():
@@ -895,6 +1037,7 @@ def delete_request(request_id):
         cursor.execute("DELETE FROM webhook_responses WHERE id = %s AND user_id = %s",
                        (request_id, user_id))
         conn.commit()
+        forget_webhook_diffs(request_id)
 
         # Notify connected clients about the deletion
         event_data = {
@@ -1169,6 +1312,28 @@ def load_karate_work():
         conn.close()
 
 
+# Standard status messages returned by /httpcode/<code> (built once, not per request)
+HTTPCODE_STATUS_MESSAGES = {
+    200: "OK", 201: "Created", 204: "No Content",
+    301: "Moved Permanently", 302: "Found", 304: "Not Modified",
+    400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 422: "Unprocessable Entity",
+    429: "Too Many Requests", 500: "Internal Server Error",
+    502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout"
+}
+
+# Extra headers sent with certain simulated status codes
+STATUS_CODE_EXTRA_HEADERS = {
+    401: [('WWW-Authenticate', 'Basic realm="Authentication Required"')],
+    301: [('Location', '/')],
+    302: [('Location', '/')],
+    307: [('Location', '/')],
+    308: [('Location', '/')],
+    429: [('Retry-After', '60')],
+    503: [('Retry-After', '120')]
+}
+
+
 @app.route("/httpcode/<int:code>", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"])
 def http_status_test(code):
     """
@@ -1187,17 +1352,7 @@ def http_status_test(code):
         else:
             request_data = request.data.decode("utf-8") if request.data else None
 
-    # Standard status messages
-    status_messages = {
-        200: "OK", 201: "Created", 204: "No Content",
-        301: "Moved Permanently", 302: "Found", 304: "Not Modified",
-        400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
-        404: "Not Found", 405: "Method Not Allowed", 422: "Unprocessable Entity",
-        429: "Too Many Requests", 500: "Internal Server Error",
-        502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout"
-    }
-
-    status_message = status_messages.get(code, "Custom Status Code")
+    status_message = HTTPCODE_STATUS_MESSAGES.get(code, "Custom Status Code")
 
     # Handle special cases
     if code == 204:  # No Content - return empty response
@@ -1218,40 +1373,192 @@ def http_status_test(code):
 
     # Add special headers for certain status codes
     response = jsonify(response_body)
-
-    if code == 401:
-        response.headers['WWW-Authenticate'] = 'Basic realm="Authentication Required"'
-    elif code in [301, 302, 307, 308]:
-        response.headers['Location'] = '/'
-    elif code == 429:
-        response.headers['Retry-After'] = '60'
-    elif code == 503:
-        response.headers['Retry-After'] = '120'
+    response.headers.extend(STATUS_CODE_EXTRA_HEADERS.get(code, []))
 
     return response, code
 
 
+# Standard HTTP status messages used by sequence endpoints
+HTTP_STATUS_MESSAGES = {
+    100: "Continue", 101: "Switching Protocols",
+    200: "OK", 201: "Created", 202: "Accepted", 203: "Non-Authoritative Information",
+    204: "No Content", 205: "Reset Content", 206: "Partial Content",
+    300: "Multiple Choices", 301: "Moved Permanently", 302: "Found", 303: "See Other",
+    304: "Not Modified", 307: "Temporary Redirect", 308: "Permanent Redirect",
+    400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 406: "Not Acceptable", 408: "Request Timeout",
+    409: "Conflict", 410: "Gone", 422: "Unprocessable Entity", 429: "Too Many Requests",
+    500: "Internal Server Error", 501: "Not Implemented", 502: "Bad Gateway",
+    503: "Service Unavailable", 504: "Gateway Timeout"
+}
+
+
 def get_http_status_message(code):
     """Get standard HTTP status message for a given code"""
-    status_messages = {
-        100: "Continue", 101: "Switching Protocols",
-        200: "OK", 201: "Created", 202: "Accepted", 203: "Non-Authoritative Information",
-        204: "No Content", 205: "Reset Content", 206: "Partial Content",
-        300: "Multiple Choices", 301: "Moved Permanently", 302: "Found", 303: "See Other",
-        304: "Not Modified", 307: "Temporary Redirect", 308: "Permanent Redirect",
-        400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
-        405: "Method Not Allowed", 406: "Not Acceptable", 408: "Request Timeout",
-        409: "Conflict", 410: "Gone", 422: "Unprocessable Entity", 429: "Too Many Requests",
-        500: "Internal Server Error", 501: "Not Implemented", 502: "Bad Gateway",
-        503: "Service Unavailable", 504: "Gateway Timeout"
-    }
-    return status_messages.get(code, "Unknown Status")
+    return HTTP_STATUS_MESSAGES.get(code, "Unknown Status")
 
 
 # ==================== SEQUENCE ENDPOINTS API ====================
 # Combines features from Special Endpoints (delays, custom codes) and
 # Rotating Endpoints (sequence rotation) for advanced testing scenarios
 
+# Step selection modes:
+#   round_robin - cycles through steps in order, persisting current_index per call
+#   weighted    - picks a step at random by weight; keeps no mutable state in the DB
+SEQUENCE_SELECTION_MODES = ("round_robin", "weighted")
+SEQUENCE_LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "percentile")
+SEQUENCE_MAX_DELAY_MS = 60000
+# z-score of the 99th percentile, used to fit a log-normal to p50/p99 targets
+P99_Z_SCORE = 2.3263
+
+
+def parse_sequence_config(sequence_config):
+    """
+    Split a stored sequence_config into (selection_mode, steps).
+    Accepts the legacy plain step array as well as {"mode": ..., "steps": [...]}.
+    """
+    if isinstance(sequence_config, str):
+        sequence_config = json.loads(sequence_config)
+    if isinstance(sequence_config, dict):
+        return sequence_config.get("mode", "round_robin"), sequence_config.get("steps") or []
+    return "round_robin", sequence_config
+
+
+def validate_step_selection(i, step, selection_mode):
+    """Validate the weight/latency fields of a step. Returns an error message or None."""
+    if selection_mode == "weighted":
+        try:
+            weight = float(step.get("weight", 1))
+        except (ValueError, TypeError):
+            return f"Step {i+1}: Invalid weight"
+        if not math.isfinite(weight):
+            return f"Step {i+1}: Weight must be a finite number"
+        if weight < 0:
+            return f"Step {i+1}: Weight must not be negative"
+
+    latency = step.get("latency")
+    if latency is None:
+        return None
+    if not isinstance(latency, dict):
+        return f"Step {i+1}: Latency must be an object"
+
+    distribution = latency.get("distribution", "fixed")
+    if distribution not in SEQUENCE_LATENCY_DISTRIBUTIONS:
+        return f"Step {i+1}: Latency distribution must be one of {', '.join(SEQUENCE_LATENCY_DISTRIBUTIONS)}"
+
+    required = {
+        "fixed": ["ms"],
+        "uniform": ["min_ms", "max_ms"],
+        "normal": ["mean_ms", "stddev_ms"],
+        "percentile": ["p50_ms", "p99_ms"]
+    }[distribution]
+    values = {}
+    for field in required:
+        if field not in latency:
+            return f"Step {i+1}: Latency missing {field}"
+        try:
+            values[field] = float(latency[field])
+        except (ValueError, TypeError):
+            return f"Step {i+1}: Invalid latency {field}"
+        if values[field] < 0 or values[field] > SEQUENCE_MAX_DELAY_MS:
+            return f"Step {i+1}: Latency {field} must be between 0 and {SEQUENCE_MAX_DELAY_MS} ms"
+
+    if distribution == "uniform" and values["min_ms"] > values["max_ms"]:
+        return f"Step {i+1}: Latency min_ms must not exceed max_ms"
+    if distribution == "percentile" and (values["p50_ms"] <= 0 or values["p99_ms"] < values["p50_ms"]):
+        return f"Step {i+1}: Latency p50_ms must be positive and not exceed p99_ms"
+    return None
+
+
+def sample_step_delay_ms(step):
+    """Draw the delay for a step from its latency distribution (falls back to the fixed delay_ms)"""
+    latency = step.get("latency")
+    if not latency:
+        return int(step["delay_ms"])
+
+    distribution = latency.get("distribution", "fixed")
+    if distribution == "uniform":
+        delay = random.uniform(float(latency["min_ms"]), float(latency["max_ms"]))
+    elif distribution == "normal":
+        delay = random.gauss(float(latency["mean_ms"]), float(latency["stddev_ms"]))
+    elif distribution == "percentile":
+        # Log-normal with median p50 and 99th percentile p99 gives a realistic long tail
+        mu = math.log(float(latency["p50_ms"]))
+        sigma = (math.log(float(latency["p99_ms"])) - mu) / P99_Z_SCORE
+        delay = random.lognormvariate(mu, sigma)
+    else:
+        delay = float(latency["ms"])
+
+    return int(min(max(delay, 0), SEQUENCE_MAX_DELAY_MS))
+
+
+def validate_sequence_config(sequence_config):
+    """
+    Validate a sequence_config (plain step array or {"mode": ..., "steps": [...]}).
+    Shared by single create/update and bulk import. Returns an error message or None.
+    """
+    selection_mode, steps = parse_sequence_config(sequence_config)
+    if selection_mode not in SEQUENCE_SELECTION_MODES:
+        return f"Selection mode must be one of {', '.join(SEQUENCE_SELECTION_MODES)}"
+    if not isinstance(steps, list) or len(steps) == 0:
+        return "At least one sequence step is required"
+
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            return f"Step {i+1} must be an object"
+
+        # Validate HTTP code
+        if "http_code" not in step:
+            return f"Step {i+1} missing http_code"
+        try:
+            code_int = int(step["http_code"])
+            if code_int < 100 or code_int > 599:
+                return f"Step {i+1}: HTTP code must be between 100 and 599"
+        except (ValueError, TypeError):
+            return f"Step {i+1}: Invalid HTTP code"
+
+        # Validate delay_ms
+        if "delay_ms" not in step:
+            return f"Step {i+1} missing delay_ms"
+        try:
+            delay_int = int(step["delay_ms"])
+            if delay_int < 0 or delay_int > SEQUENCE_MAX_DELAY_MS:
+                return f"Step {i+1}: Delay must be between 0 and {SEQUENCE_MAX_DELAY_MS} ms"
+        except (ValueError, TypeError):
+            return f"Step {i+1}: Invalid delay value"
+
+        # Validate payload if provided
+        if "payload" in step and step["payload"]:
+            if isinstance(step["payload"], str):
+                try:
+                    json.loads(step["payload"])
+                except json.JSONDecodeError:
+                    return f"Step {i+1}: Invalid JSON payload"
+
+        # Validate weight and latency distribution
+        selection_error = validate_step_selection(i, step, selection_mode)
+        if selection_error:
+            return selection_error
+
+    if selection_mode == "weighted":
+        total_weight = sum(float(step.get("weight", 1)) for step in steps)
+        if not 0 < total_weight < math.inf:
+            return "Step weights must add up to a positive, finite number"
+    return None
+
+
+def choose_weighted_step(steps):
+    """
+    Pick a step index at random, proportionally to each step's weight. Saving and importing
+    reject weights that can't be drawn from; a config stored before that was checked (all zero,
+    or not finite) falls back to picking uniformly.
+    """
+    weights = [float(step.get("weight", 1)) for step in steps]
+    if not 0 < sum(weights) < math.inf:
+        return random.randrange(len(steps))
+    return random.choices(range(len(steps)), weights=weights)[0]
+
+
 @app.route("/api/sequence-endpoints", methods=["GET"])
 @login_required
 def get_sequence_endpoints():
@@ -1286,44 +1593,13 @@ def create_sequence_endpoint():
     # Validate required fields
     if not data.get("endpoint_name"):
         return jsonify({"success": False, "error": "Endpoint name is required"}), 400
-    if not data.get("sequence_config") or not isinstance(data.get("sequence_config"), list):
+    if not data.get("sequence_config") or not isinstance(data.get("sequence_config"), (list, dict)):
         return jsonify({"success": False, "error": "Sequence configuration array is required"}), 400
-    if len(data.get("sequence_config")) == 0:
-        return jsonify({"success": False, "error": "At least one sequence step is required"}), 400
 
-    # Validate sequence steps
     sequence_config = data.get("sequence_config")
-    for i, step in enumerate(sequence_config):
-        if not isinstance(step, dict):
-            return jsonify({"success": False, "error": f"Step {i+1} must be an object"}), 400
-
-        # Validate HTTP code
-        if "http_code" not in step:
-            return jsonify({"success": False, "error": f"Step {i+1} missing http_code"}), 400
-        try:
-            code_int = int(step["http_code"])
-            if code_int < 100 or code_int > 599:
-                return jsonify({"success": False, "error": f"Step {i+1}: HTTP code must be between 100 and 599"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": f"Step {i+1}: Invalid HTTP code"}), 400
-
-        # Validate delay_ms
-        if "delay_ms" not in step:
-            return jsonify({"success": False, "error": f"Step {i+1} missing delay_ms"}), 400
-        try:
-            delay_int = int(step["delay_ms"])
-            if delay_int < 0 or delay_int > 60000:
-                return jsonify({"success": False, "error": f"Step {i+1}: Delay must be between 0 and 60000 ms"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": f"Step {i+1}: Invalid delay value"}), 400
-
-        # Validate payload if provided
-        if "payload" in step and step["payload"]:
-            if isinstance(step["payload"], str):
-                try:
-                    json.loads(step["payload"])
-                except json.JSONDecodeError:
-                    return jsonify({"success": False, "error": f"Step {i+1}: Invalid JSON payload"}), 400
+    validation_error = validate_sequence_config(sequence_config)
+    if validation_error:
+        return jsonify({"success": False, "error": validation_error}), 400
 
     conn = get_db_connection()
     try:
@@ -1355,43 +1631,12 @@ def update_sequence_endpoint(endpoint_id):
 
     # Validate sequence_config if provided
     if data.get("sequence_config"):
-        if not isinstance(data.get("sequence_config"), list):
+        if not isinstance(data.get("sequence_config"), (list, dict)):
             return jsonify({"success": False, "error": "Sequence configuration must be an array"}), 400
-        if len(data.get("sequence_config")) == 0:
-            return jsonify({"success": False, "error": "At least one sequence step is required"}), 400
-
-        sequence_config = data.get("sequence_config")
-        for i, step in enumerate(sequence_config):
-            if not isinstance(step, dict):
-                return jsonify({"success": False, "error": f"Step {i+1} must be an object"}), 400
 
-            # Validate HTTP code
-            if "http_code" not in step:
-                return jsonify({"success": False, "error": f"Step {i+1} missing http_code"}), 400
-            try:
-                code_int = int(step["http_code"])
-                if code_int < 100 or code_int > 599:
-                    return jsonify({"success": False, "error": f"Step {i+1}: HTTP code must be between 100 and 599"}), 400
-            except (ValueError, TypeError):
-                return jsonify({"success": False, "error": f"Step {i+1}: Invalid HTTP code"}), 400
-
-            # Validate delay_ms
-            if "delay_ms" not in step:
-                return jsonify({"success": False, "error": f"Step {i+1} missing delay_ms"}), 400
-            try:
-                delay_int = int(step["delay_ms"])
-                if delay_int < 0 or delay_int > 60000:
-                    return jsonify({"success": False, "error": f"Step {i+1}: Delay must be between 0 and 60000 ms"}), 400
-            except (ValueError, TypeError):
-                return jsonify({"success": False, "error": f"Step {i+1}: Invalid delay value"}), 400
-
-            # Validate payload if provided
-            if "payload" in step and step["payload"]:
-                if isinstance(step["payload"], str):
-                    try:
-                        json.loads(step["payload"])
-                    except json.JSONDecodeError:
-                        return jsonify({"success": False, "error": f"Step {i+1}: Invalid JSON payload"}), 400
+        validation_error = validate_sequence_config(data.get("sequence_config"))
+        if validation_error:
+            return jsonify({"success": False, "error": validation_error}), 400
 
     conn = get_db_connection()
     try:
@@ -1506,11 +1751,192 @@ def reset_sequence_endpoint(endpoint_id):
         conn.close()
 
 
-@app.route("/sequence-endpoint/<int:user_id>/<endpoint_name>", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"])
-def sequence_endpoint_handler(user_id, endpoint_name):
-    """Handle sequence endpoint requests - cycles through configured steps with delays and custom responses"""
-    import time
+# Rows per multi-row INSERT statement during bulk import
+SEQUENCE_IMPORT_BATCH_SIZE = 500
+SEQUENCE_DESCRIPTION_MAX_BYTES = 65535  # TEXT column
+
+
+def parse_sequence_import_document(raw_text, content_type):
+    """
+    Parse a bulk import document into a list of endpoint definitions.
+    Accepts a JSON array, {"endpoints": [...]}, a single endpoint object, or NDJSON (one endpoint per line).
+    Raises ValueError with a user-facing message if the document can't be parsed.
+    """
+    text = raw_text.strip()
+    if not text:
+        raise ValueError("Import document is empty")
+
+    if "ndjson" not in (content_type or ""):
+        try:
+            document = json.loads(text)
+        except json.JSONDecodeError:
+            document = None
+        else:
+            if isinstance(document, dict) and isinstance(document.get("endpoints"), list):
+                return document["endpoints"]
+            if isinstance(document, dict):
+                return [document]
+            if isinstance(document, list):
+                return document
+            raise ValueError("Import document must be a JSON array or object")
+
+    endpoints = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            endpoints.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number}: Invalid JSON ({e.msg})")
+    return endpoints
+
+
+def validate_sequence_import(endpoints):
+    """Validate every endpoint of a bulk import. Returns a list of {index, endpoint_name, error}."""
+    errors = []
+    seen_names = set()
+    for i, endpoint in enumerate(endpoints):
+        if not isinstance(endpoint, dict):
+            errors.append({"index": i, "endpoint_name": None, "error": "Endpoint must be an object"})
+            continue
+
+        endpoint_name = endpoint.get("endpoint_name")
+        description, is_active = endpoint.get("description", ""), endpoint.get("is_active", 1)
+        if not endpoint_name or not isinstance(endpoint_name, str):
+            error = "Endpoint name is required"
+        elif len(endpoint_name) > 255:
+            error = "Endpoint name must be at most 255 characters"
+        elif endpoint_name in seen_names:
+            error = "Duplicate endpoint name in import document"
+        elif not isinstance(endpoint.get("sequence_config"), (list, dict)):
+            error = "Sequence configuration array is required"
+        elif not isinstance(description, (str, type(None))):
+            error = "Description must be a string"
+        elif description and len(description.encode("utf-8", "surrogatepass")) > SEQUENCE_DESCRIPTION_MAX_BYTES:
+            error = f"Description must be at most {SEQUENCE_DESCRIPTION_MAX_BYTES} bytes"
+        elif not isinstance(is_active, int) or is_active not in (0, 1):  # bool is an int too
+            error = "is_active must be true, false, 1 or 0"
+        else:
+            error = validate_sequence_config(endpoint["sequence_config"])
+
+        if error:
+            errors.append({"index": i, "endpoint_name": endpoint_name, "error": error})
+        seen_names.add(endpoint_name)
+    return errors
+
+
+@app.route("/api/sequence-endpoints/import", methods=["POST"])
+@login_required
+def import_sequence_endpoints():
+    """Bulk create or update sequence endpoints from a JSON or NDJSON document (all-or-nothing)"""
+    user_id = session.get("user_id")
+
+    try:
+        endpoints = parse_sequence_import_document(request.get_data(as_text=True), request.content_type)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if not endpoints:
+        return jsonify({"success": False, "error": "No endpoints to import"}), 400
+
+    errors = validate_sequence_import(endpoints)
+    if errors:
+        return jsonify({"success": False, "error": f"{len(errors)} endpoint(s) failed validation", "errors": errors}), 400
 
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT endpoint_name FROM sequence_endpoints WHERE user_id = %s", (user_id,))
+            existing_names = {row["endpoint_name"] for row in cursor.fetchall()}
+
+            # Multi-row upserts; re-imported endpoints restart their sequence
+            for start in range(0, len(endpoints), SEQUENCE_IMPORT_BATCH_SIZE):
+                batch = endpoints[start:start + SEQUENCE_IMPORT_BATCH_SIZE]
+                params = []
+                for endpoint in batch:
+                    params.extend([user_id, endpoint["endpoint_name"], json.dumps(endpoint["sequence_config"]),
+                                   endpoint.get("description", ""), endpoint.get("is_active", 1)])
+                cursor.execute(f"""
+                    INSERT INTO sequence_endpoints (user_id, endpoint_name, sequence_config, current_index, description, is_active)
+                    VALUES {', '.join(['(%s, %s, %s, 0, %s, %s)'] * len(batch))}
+                    ON DUPLICATE KEY UPDATE
+                        sequence_config = VALUES(sequence_config),
+                        current_index = 0,
+                        description = VALUES(description),
+                        is_active = VALUES(is_active)
+                """, params)
+            conn.commit()
+
+        updated = sum(1 for endpoint in endpoints if endpoint["endpoint_name"] in existing_names)
+        log(f"User {user_id} imported {len(endpoints)} sequence endpoints ({updated} updated)")
+        return jsonify({
+            "success": True,
+            "imported": len(endpoints),
+            "created": len(endpoints) - updated,
+            "updated": updated
+        })
+    except Exception as e:
+        conn.rollback()
+        log(f"Error importing sequence endpoints: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        conn.close()
+
+
+@app.route("/api/sequence-endpoints/export", methods=["GET"])
+@login_required
+def export_sequence_endpoints():
+    """Stream all of the user's sequence endpoints as NDJSON (default) or a JSON array, re-importable as-is"""
+    user_id = session.get("user_id")
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "json"):
+        return jsonify({"success": False, "error": "Format must be ndjson or json"}), 400
+
+    def generate():
+        conn = get_db_connection()
+        try:
+            # Unbuffered cursor so rows are streamed instead of loaded all at once
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT endpoint_name, sequence_config, description, is_active
+                    FROM sequence_endpoints
+                    WHERE user_id = %s
+                    ORDER BY endpoint_name ASC
+                """, (user_id,))
+
+                if export_format == "json":
+                    yield "["
+                first = True
+                for row in cursor:
+                    if isinstance(row["sequence_config"], str):
+                        row["sequence_config"] = json.loads(row["sequence_config"])
+                    line = json.dumps(row)
+                    if export_format == "json":
+                        yield line if first else "," + line
+                    else:
+                        yield line + "\n"
+                    first = False
+                if export_format == "json":
+                    yield "]"
+        except Exception as e:
+            log(f"Error exporting sequence endpoints for user {user_id}: {str(e)}")
+            raise
+        finally:
+            conn.close()
+
+    log(f"User {user_id} exporting sequence endpoints as {export_format}")
+    mimetype = "application/json" if export_format == "json" else "application/x-ndjson"
+    response = Response(generate(), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=sequence_endpoints.{export_format}"
+    return response
+
+
+def select_sequence_step(user_id, endpoint_name):
+    """
+    Look up an active sequence endpoint and pick the step to serve, then apply its delay.
+    Returns (selection, None) on success or (None, error_body) when the user or endpoint is missing.
+    The DB connection is released before sleeping so delayed steps don't hold it.
+    """
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
@@ -1519,115 +1945,146 @@ def sequence_endpoint_handler(user_id, endpoint_name):
             user_result = cursor.fetchone()
 
             if not user_result:
-                return jsonify({
+                return None, {
                     "error": "User not found",
                     "user_id": user_id
-                }), 404
+                }
 
-            # Get sequence endpoint configuration with row lock for atomic update
+            # Get sequence endpoint configuration
             cursor.execute("""
                 SELECT id, sequence_config, current_index, description
                 FROM sequence_endpoints
                 WHERE user_id = %s AND endpoint_name = %s AND is_active = 1
-                FOR UPDATE
             """, (user_id, endpoint_name))
             endpoint = cursor.fetchone()
 
             if not endpoint:
-                return jsonify({
+                return None, {
                     "error": "Sequence endpoint not found or inactive",
                     "user_id": user_id,
                     "endpoint_name": endpoint_name
-                }), 404
+                }
 
             # Parse sequence configuration
-            sequence_config = json.loads(endpoint["sequence_config"]) if isinstance(endpoint["sequence_config"], str) else endpoint["sequence_config"]
-            current_index = endpoint["current_index"]
-
-            # Get current step
-            current_step = sequence_config[current_index]
-            http_code = int(current_step["http_code"])
-            delay_ms = int(current_step["delay_ms"])
-            payload = current_step.get("payload")
-
-            # Apply delay if configured
-            if delay_ms > 0:
-                time.sleep(delay_ms / 1000.0)
-
-            # Calculate next index (circular rotation)
-            next_index = (current_index + 1) % len(sequence_config)
-
-            # Update current index for next call
-            cursor.execute("""
-                UPDATE sequence_endpoints
-                SET current_index = %s
-                WHERE id = %s
-            """, (next_index, endpoint["id"]))
-            conn.commit()
+            selection_mode, sequence_config = parse_sequence_config(endpoint["sequence_config"])
 
-            # Prepare response
-            # Use custom payload if provided and HTTP code is 200, otherwise use default response
-            if payload and http_code == 200:
-                response_data = payload
+            if selection_mode == "weighted":
+                # Weighted steps are drawn at random, so nothing is written back per call
+                current_index = choose_weighted_step(sequence_config)
+                next_index = None
             else:
-                # Get next step info for response
-                next_step = sequence_config[next_index]
+                # Re-read the index with a row lock for the atomic round-robin update
+                cursor.execute("""
+                    SELECT current_index FROM sequence_endpoints
+                    WHERE id = %s
+                    FOR UPDATE
+                """, (endpoint["id"],))
+                current_index = cursor.fetchone()["current_index"] % len(sequence_config)
+
+                # Calculate next index (circular rotation)
+                next_index = (current_index + 1) % len(sequence_config)
+
+                # Update current index for next call
+                cursor.execute("""
+                    UPDATE sequence_endpoints
+                    SET current_index = %s
+                    WHERE id = %s
+                """, (next_index, endpoint["id"]))
+                conn.commit()
+    finally:
+        conn.close()
 
-                response_data = {
-                    "status": http_code,
-                    "message": get_http_status_message(http_code),
-                    "endpoint_name": endpoint_name,
-                    "user_id": user_id,
-                    "description": endpoint["description"],
-                    "current_step_index": current_index,
-                    "total_steps": len(sequence_config),
-                    "next_step": {
-                        "http_code": next_step["http_code"],
-                        "delay_ms": next_step["delay_ms"]
-                    },
-                    "current_step": {
-                        "http_code": http_code,
-                        "delay_ms": delay_ms
-                    },
-                    "method": request.method,
-                    "path": request.path,
-                    "timestamp": datetime.now().isoformat()
-                }
+    # Get current step
+    current_step = sequence_config[current_index]
+    delay_ms = sample_step_delay_ms(current_step)
+
+    # Apply delay if configured (after the row lock and connection have been released)
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+
+    return {
+        "description": endpoint["description"],
+        "selection_mode": selection_mode,
+        "steps": sequence_config,
+        "current_index": current_index,
+        "next_index": next_index,
+        "http_code": int(current_step["http_code"]),
+        "delay_ms": delay_ms,
+        "payload": current_step.get("payload")
+    }, None
+
+
+def build_sequence_response_data(selection, user_id, endpoint_name, method, path):
+    """Build the JSON body served for a selected sequence step"""
+    http_code = selection["http_code"]
+
+    # Use custom payload if provided and HTTP code is 200, otherwise use default response
+    if selection["payload"] and http_code == 200:
+        return selection["payload"]
+
+    # Get next step info for response (unknown ahead of time in weighted mode)
+    next_index = selection["next_index"]
+    next_step = selection["steps"][next_index] if next_index is not None else None
+
+    return {
+        "status": http_code,
+        "message": get_http_status_message(http_code),
+        "endpoint_name": endpoint_name,
+        "user_id": user_id,
+        "description": selection["description"],
+        "selection_mode": selection["selection_mode"],
+        "current_step_index": selection["current_index"],
+        "total_steps": len(selection["steps"]),
+        "next_step": {
+            "http_code": next_step["http_code"],
+            "delay_ms": next_step["delay_ms"]
+        } if next_step else None,
+        "current_step": {
+            "http_code": http_code,
+            "delay_ms": selection["delay_ms"]
+        },
+        "method": method,
+        "path": path,
+        "timestamp": datetime.now().isoformat()
+    }
 
-            # Include request data if present (only for default response, not custom payload)
-            if not (payload and http_code == 200) and request.method in ["POST", "PUT", "PATCH"]:
-                if request.is_json:
-                    response_data["received_data"] = request.get_json()
-                elif request.form:
-                    response_data["received_data"] = dict(request.form)
-                elif request.data:
-                    response_data["received_data"] = request.data.decode('utf-8', errors='ignore')
-
-            # Handle special HTTP codes that need special responses
-            if http_code == 204:
-                # No Content - return empty response
-                response = Response('', status=http_code)
-            else:
-                response = jsonify(response_data)
-                response.status_code = http_code
 
-            # Add special headers based on status code
-            if http_code == 401:
-                response.headers['WWW-Authenticate'] = 'Basic realm="Authentication Required"'
-            elif http_code in [301, 302, 307, 308]:
-                response.headers['Location'] = '/'
-            elif http_code == 429:
-                response.headers['Retry-After'] = '60'
-            elif http_code == 503:
-                response.headers['Retry-After'] = '120'
+@app.route("/sequence-endpoint/<int:user_id>/<endpoint_name>", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"])
+def sequence_endpoint_handler(user_id, endpoint_name):
+    """Handle sequence endpoint requests - cycles through (or samples) configured steps with delays and custom responses"""
+    try:
+        selection, error = select_sequence_step(user_id, endpoint_name)
+        if error:
+            return jsonify(error), 404
+
+        http_code = selection["http_code"]
+        response_data = build_sequence_response_data(selection, user_id, endpoint_name, request.method, request.path)
+
+        # Include request data if present (only for default response, not custom payload)
+        if not (selection["payload"] and http_code == 200) and request.method in ["POST", "PUT", "PATCH"]:
+            if request.is_json:
+                response_data["received_data"] = request.get_json()
+            elif request.form:
+                response_data["received_data"] = dict(request.form)
+            elif request.data:
+                response_data["received_data"] = request.data.decode('utf-8', errors='ignore')
+
+        # Handle special HTTP codes that need special responses
+        if http_code == 204:
+            # No Content - return empty response
+            response = Response('', status=http_code)
+        else:
+            response = jsonify(response_data)
+            response.status_code = http_code
 
-            return response
+        # Add special headers based on status code
+        response.headers.extend(STATUS_CODE_EXTRA_HEADERS.get(http_code, []))
+
+        return response
 
     except Exception as e:
         log(f"Error handling sequence endpoint: {str(e)}")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
-    finally:
-        conn.close()
 
 
 @app.route("/events/<user_id>")
@@ -2373,6 +2830,49 @@ def api_admin_stats():
 
 # ==================== TOTP AUTHENTICATOR ROUTES ====================
 
+# Each user's accounts are kept as ready-built pyotp.TOTP objects, so generating codes needs
+# no query. Entries are dropped when the user changes an account here, and re-read after
+# TOTP_ACCOUNT_CACHE_TTL in case another process changed them.
+TOTP_ACCOUNT_CACHE_TTL = 300
+totp_account_cache = {}  # user_id -> {'loaded_at': ..., 'accounts': {account_id: (TOTP, period)}}
+totp_account_generations = {}  # user_id -> invalidation count, so an in-flight load can't re-cache stale rows
+totp_account_cache_lock = threading.Lock()
+
+
+def load_totp_accounts(user_id, refresh=False):
+    """A user's accounts as account id -> (pyotp.TOTP, period), newest first, from the cache or one query"""
+    with totp_account_cache_lock:
+        entry = totp_account_cache.get(user_id)
+        if entry and not refresh and time.time() - entry['loaded_at'] < TOTP_ACCOUNT_CACHE_TTL:
+            return entry['accounts']
+        generation = totp_account_generations.get(user_id, 0)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, secret_key, digits, period FROM totp_accounts WHERE user_id = %s ORDER BY created_at DESC",
+                (user_id,)
+            )
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    accounts = {row['id']: (pyotp.TOTP(row['secret_key'], digits=row['digits'], interval=row['period']), row['period'])
+                for row in rows}
+    with totp_account_cache_lock:
+        if totp_account_generations.get(user_id, 0) == generation:
+            totp_account_cache[user_id] = {'loaded_at': time.time(), 'accounts': accounts}
+    return accounts
+
+
+def forget_totp_accounts(user_id):
+    """Drop a user's cached accounts after one of them was created, updated or deleted"""
+    with totp_account_cache_lock:
+        totp_account_cache.pop(user_id, None)
+        totp_account_generations[user_id] = totp_account_generations.get(user_id, 0) + 1
+
+
 @app.route("/totp-authenticator")
 @login_required
 def totp_authenticator():
@@ -2453,6 +2953,7 @@ def create_totp_account():
                 data.get('icon', '')
             ))
             conn.commit()
+            forget_totp_accounts(user_id)
 
             account_id = cursor.lastrowid
             log(f"User {user_id} created TOTP account {account_id} for service: {data.get('service_name')}")
@@ -2507,6 +3008,7 @@ def update_totp_account(account_id):
                 user_id
             ))
             conn.commit()
+            forget_totp_accounts(user_id)
 
             log(f"User {user_id} updated TOTP account {account_id}")
             return jsonify({'success': True, 'message': 'Account updated successfully'})
@@ -2533,6 +3035,7 @@ def delete_totp_account(account_id):
             # Delete the account
             cursor.execute("DELETE FROM totp_accounts WHERE id = %s AND user_id = %s", (account_id, user_id))
             conn.commit()
+            forget_totp_accounts(user_id)
 
             log(f"User {user_id} deleted TOTP account {account_id}")
             return jsonify({'success': True, 'message': 'Account deleted successfully'})
@@ -2575,6 +3078,26 @@ def get_ntp_synced_time():
         })
 
 
+@app.route("/api/totp/ntp-stats", methods=["GET"])
+@login_required
+def get_ntp_stats():
+    """NTP sync status: the offset in use, estimated drift and per-server offset/latency stats of the last refresh"""
+    offset = get_ntp_offset()
+    with ntp_cache_lock:
+        timestamp = ntp_offset_cache['timestamp']
+        measured, drift = ntp_offset_cache['offset'], ntp_offset_cache['drift']
+        servers = [dict(stats) for stats in ntp_offset_cache['servers'].values()]
+    return jsonify({
+        'success': True,
+        'offset': offset,
+        'measured_offset': measured,
+        'synced_at': timestamp or None,
+        'age': time.time() - timestamp if timestamp else None,
+        'drift_ppm': drift * 1e6,
+        'servers': servers
+    })
+
+
 @app.route("/api/totp/generate/<int:account_id>", methods=["GET"])
 @login_required
 def generate_totp_code(account_id):
@@ -2583,219 +3106,5009 @@ def generate_totp_code(account_id):
     This ensures the code matches standard authenticators.
     """
     user_id = session["user_id"]
-    conn = get_db_connection()
 
     try:
-        with conn.cursor() as cursor:
-            # Fetch account details
-            cursor.execute(
-                "SELECT secret_key, digits, period FROM totp_accounts WHERE id = %s AND user_id = %s",
-                (account_id, user_id)
-            )
-            account = cursor.fetchone()
+        accounts = load_totp_accounts(user_id)
+        if account_id not in accounts:
+            # It may have been created by another process since the cache was filled
+            accounts = load_totp_accounts(user_id, refresh=True)
+        if account_id not in accounts:
+            return jsonify({'success': False, 'message': 'Account not found'}), 404
+        totp, period = accounts[account_id]
+
+        # Use NTP time for generation
+        ntp_time = get_ntp_time()
+        code = totp.at(ntp_time)
 
-            if not account:
-                return jsonify({'success': False, 'message': 'Account not found'}), 404
+        # Calculate time remaining
+        epoch = int(ntp_time)
+        time_remaining = period - (epoch % period)
 
-            # Generate TOTP using NTP-synchronized time
-            totp = pyotp.TOTP(
-                account['secret_key'],
-                digits=account['digits'],
-                interval=account['period']
-            )
+        return jsonify({
+            'success': True,
+            'code': code,
+            'time_remaining': time_remaining,
+            'period': period
+        })
+
+    except Exception as e:
+        log(f"Error generating TOTP code for account {account_id}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to generate code'}), 500
 
-            # Use NTP time for generation
-            ntp_time = get_ntp_time()
-            code = totp.at(ntp_time)
 
-            # Calculate time remaining
-            period = account['period']
-            epoch = int(ntp_time)
-            time_remaining = period - (epoch % period)
+@app.route("/api/totp/codes", methods=["GET"])
+@login_required
+def generate_all_totp_codes():
+    """
+    Current and next-window TOTP codes for all of the user's accounts in one call, at one
+    NTP-synchronized time. `counter` is the time step of `code`; `next_code` is valid for the
+    step after it, so the page can switch codes at the period boundary without a request.
+    An account whose code cannot be generated (e.g. a secret that isn't valid base32) gets an
+    `error` entry instead, without failing the others.
+    """
+    user_id = session["user_id"]
 
-            return jsonify({
-                'success': True,
-                'code': code,
-                'time_remaining': time_remaining,
-                'period': period
-            })
+    try:
+        accounts = load_totp_accounts(user_id)
+        ntp_time = get_ntp_time()
+        epoch = int(ntp_time)
+        codes = []
+        for account_id, (totp, period) in accounts.items():
+            try:
+                codes.append({
+                    'account_id': account_id,
+                    'code': totp.at(ntp_time),
+                    'next_code': totp.at(ntp_time, counter_offset=1),
+                    'counter': epoch // period,
+                    'time_remaining': period - (epoch % period),
+                    'period': period
+                })
+            except Exception as e:
+                log(f"Error generating TOTP code for account {account_id}: {e}")
+                codes.append({'account_id': account_id, 'error': 'Failed to generate code', 'period': period})
 
+        return jsonify({'success': True, 'timestamp': int(ntp_time * 1000), 'codes': codes})
     except Exception as e:
-        log(f"Error generating TOTP code for account {account_id}: {e}")
-        return jsonify({'success': False, 'message': 'Failed to generate code'}), 500
-    finally:
-        conn.close()
+        log(f"Error generating TOTP codes for user {user_id}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to generate codes'}), 500
 
 
 # ==================== END TOTP AUTHENTICATOR ROUTES ====================
 
 
-# ==================== CODE FORMATTER ROUTES ====================
+# ==================== WORKER PROCESS POOL ====================
+# CPU-bound batch work (log partition diffs, batch JSON diffs, large code format jobs) runs in
+# one long-lived process pool shared by every request. Its workers start from a fresh
+# interpreter (forkserver, or spawn where that is unavailable) instead of forking this threaded
+# process together with whatever locks its threads hold at that moment. Workers import this
+# module and so see the environment configuration, not values changed at runtime.
 
-@app.route("/code-formatter")
-@login_required
-def code_formatter():
-    """Code Formatter page"""
-    user_id = session["user_id"]
-    username = session.get("username", "User")
-    log(f"User {user_id} accessed Code Formatter")
-    return render_template("code-formatter.html", username=username)
+PROCESS_POOL_WORKERS = max(LOG_COMPARE_WORKERS, JSON_BATCH_WORKERS, CODE_FORMAT_WORKERS)
+PROCESS_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
 
+process_pool = None
+process_pool_lock = threading.Lock()
 
-@app.route("/api/code-formatter/format", methods=["POST"])
-@login_required
-def format_code():
-    """Format code based on selected mode"""
-    user_id = session["user_id"]
-    data = request.json
 
-    code = data.get("code", "")
-    language = data.get("language", "javascript")
-    mode = data.get("mode", "standard")  # 'standard' or 'oneline'
+def get_process_pool():
+    """The shared worker process pool, started on first use"""
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS,
+                                               mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD))
+        return process_pool
 
-    if not code:
-        return jsonify({"success": False, "error": "No code provided"}), 400
 
-    try:
-        if mode == "oneline":
-            # Convert to one line (minify)
-            formatted_code = minify_code(code, language)
-        else:
-            # Standard IntelliJ-style formatting
-            formatted_code = format_code_standard(code, language)
+def discard_process_pool(pool):
+    """Drop a pool broken by a worker that died, so the next caller starts a new one"""
+    global process_pool
+    with process_pool_lock:
+        if process_pool is pool:
+            process_pool = None
+    pool.shutdown(wait=False)
 
-        log(f"User {user_id} formatted {language} code in {mode} mode")
-        return jsonify({
+
+def iter_process_pool_futures(function, jobs, workers, ordered=False):
+    """
+    Run function(*args) for each args tuple of `jobs` in the shared pool, with at most `workers`
+    of this caller's jobs in flight so one batch cannot queue ahead of every other request.
+    The first jobs are submitted right away; the returned iterator yields (index, future) as
+    they finish (in job order if `ordered`) and cancels the rest when it is closed early.
+    """
+    pool = get_process_pool()
+    jobs = enumerate(jobs)
+    running = {}  # future -> job index, in submission order
+
+    def submit():
+        for index, args in jobs:
+            try:
+                running[pool.submit(function, *args)] = index
+            except BrokenProcessPool:
+                discard_process_pool(pool)
+                raise
+            if len(running) >= workers:
+                return
+
+    def iterate():
+        finished = {}  # job index -> future, until its turn comes when ordered
+        next_index = 0
+        try:
+            while running:
+                for future in wait(running, return_when=FIRST_COMPLETED)[0]:
+                    finished[running.pop(future)] = future
+                    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                        discard_process_pool(pool)
+                submit()
+                if not ordered:
+                    yield from list(finished.items())
+                    finished.clear()
+                while next_index in finished:
+                    yield next_index, finished.pop(next_index)
+                    next_index += 1
+        finally:
+            for future in running:
+                future.cancel()
+
+    submit()
+    return iterate()
+
+
+def map_process_pool(function, jobs, workers):
+    """Yield function(*args) for each args tuple in order: in the shared pool if workers > 1, else inline"""
+    if workers <= 1:
+        return (function(*args) for args in jobs)
+    return (future.result() for _, future in iter_process_pool_futures(function, jobs, workers, ordered=True))
+
+
+# ==================== END WORKER PROCESS POOL ====================
+
+
+# ==================== CODE FORMATTER ROUTES ====================
+# Code is tokenized in one pass by a lexer compiled once per language, so string literals,
+# comments and URLs are never mistaken for code. Formatters and minifiers walk the token stream
+# once, appending to a list that is joined at the end.
+
+CODE_INDENT = '  '  # 2 spaces (Postman/Beautify style)
+CODE_WORD_PATTERN = r'(?P<word>[\w$]+)'
+CODE_PUNCT_PATTERN = r'(?P<punct>[{}()\[\];,])'
+CODE_DOUBLE_QUOTED = r'"(?:\\.|[^"\\\n])*"?'
+CODE_SINGLE_QUOTED = r"'(?:\\.|[^'\\\n])*'?"
+CODE_TEMPLATE_QUOTED = r'`(?:\\.|[^`\\])*`?'
+CODE_RAW_BACKTICK = r'`[^`]*`?'
+CODE_TRIPLE_QUOTED = r'"""[\s\S]*?(?:"""|\Z)' + '|' + r"'''[\s\S]*?(?:'''|\Z)"
+CODE_SLASH_COMMENTS = (r'(?P<line_comment>//[^\n]*)', r'(?P<block_comment>/\*[\s\S]*?(?:\*/|\Z))')
+# url(...) is opaque so the // of a URL is never read as a comment
+CODE_CSS_URL = r'url\(\s*(?:"[^"]*"|\'[^\']*\'|[^)]*)\s*\)'
+CODE_CSS_WORD_PATTERN = r'(?P<word>[\w$\-#.%!@&]+)'
+CODE_CSS_PUNCT_PATTERN = r'(?P<punct>[{}()\[\];,:])'
+
+
+def compile_code_lexer(strings, comments=CODE_SLASH_COMMENTS, word=CODE_WORD_PATTERN, punct=CODE_PUNCT_PATTERN,
+                       space=r'(?P<space>\s+)'):
+    """
+    One regex whose alternatives are tried in order at each position: whitespace, comments,
+    strings (opaque tokens), words, punctuation, then runs of other operator characters.
+    Anything left is a single-character 'op', so the lexer never fails.
+    """
+    return re.compile('|'.join([space, *comments, f"(?P<string>{'|'.join(strings)})", word, punct,
+                                r'(?P<op>[^\s\w${}()\[\];,"\'`/#@\\]+|[\s\S])']))
+
+
+CODE_C_LEXER = compile_code_lexer([CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED, CODE_TEMPLATE_QUOTED])
+CODE_LEXERS = {
+    'javascript': CODE_C_LEXER,
+    'typescript': CODE_C_LEXER,
+    'java': CODE_C_LEXER,
+    'c': CODE_C_LEXER,
+    'cpp': CODE_C_LEXER,
+    'json': CODE_C_LEXER,
+    'csharp': compile_code_lexer([r'@"(?:""|[^"])*"?', CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED]),
+    'go': compile_code_lexer([CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED, CODE_RAW_BACKTICK]),
+    # Rust lifetimes ('a) look like char literals, so only complete one-character literals are strings
+    'rust': compile_code_lexer([CODE_DOUBLE_QUOTED, r"'(?:\\[^\n]{1,10}?|[^'\\\n])'"]),
+    'swift': compile_code_lexer([CODE_TRIPLE_QUOTED, CODE_DOUBLE_QUOTED]),
+    'kotlin': compile_code_lexer([CODE_TRIPLE_QUOTED, CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED]),
+    'php': compile_code_lexer([CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED, CODE_TEMPLATE_QUOTED],
+                              (r'(?P<line_comment>(?://|#(?!\[))[^\n]*)', CODE_SLASH_COMMENTS[1])),
+    # Indentation languages keep newlines as their own tokens
+    'python': compile_code_lexer([r'[rRbBuUfF]{0,2}(?:' + CODE_TRIPLE_QUOTED + ')', CODE_DOUBLE_QUOTED,
+                                  CODE_SINGLE_QUOTED], (r'(?P<line_comment>#[^\n]*)',),
+                                 space=r'(?P<newline>\r?\n)|(?P<continuation>\\\r?\n)|(?P<space>[^\S\n]+)'),
+    'ruby': compile_code_lexer([CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED], (r'(?P<line_comment>#[^\n]*)',),
+                               space=r'(?P<newline>\r?\n)|(?P<continuation>\\\r?\n)|(?P<space>[^\S\n]+)'),
+    # In shell, # only starts a comment at the start of a word ($# and ${#x} are expansions)
+    'bash': compile_code_lexer([r'"(?:\\.|[^"\\])*"?', r"'[^']*'?"], (r'(?P<line_comment>(?<![^\s;|&(])#[^\n]*)',),
+                               space=r'(?P<newline>\r?\n)|(?P<continuation>\\\r?\n)|(?P<space>[^\S\n]+)'),
+    'sql': compile_code_lexer([r"'(?:''|\\.|[^'\\])*'?", r'"(?:""|[^"])*"?', r'`(?:``|[^`])*`?'],
+                              (r'(?P<line_comment>--[^\n]*)', CODE_SLASH_COMMENTS[1]), word=r'(?P<word>[\w$@:.]+)'),
+    'css': compile_code_lexer([CODE_CSS_URL, CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED], (CODE_SLASH_COMMENTS[1],),
+                              word=CODE_CSS_WORD_PATTERN, punct=CODE_CSS_PUNCT_PATTERN),
+    # SCSS and LESS add // line comments
+    'scss': compile_code_lexer([CODE_CSS_URL, CODE_DOUBLE_QUOTED, CODE_SINGLE_QUOTED],
+                               word=CODE_CSS_WORD_PATTERN, punct=CODE_CSS_PUNCT_PATTERN),
+}
+CODE_LEXERS['shell'] = CODE_LEXERS['bash']
+CODE_LEXERS['less'] = CODE_LEXERS['scss']
+
+CODE_FAMILIES = {
+    **dict.fromkeys(['javascript', 'typescript', 'java', 'c', 'cpp', 'csharp', 'go', 'rust', 'swift', 'kotlin',
+                     'php', 'json'], 'c'),
+    **dict.fromkeys(['css', 'scss', 'less'], 'css'),
+    **dict.fromkeys(['python', 'ruby', 'bash', 'shell'], 'indented'),
+    'sql': 'sql',
+}
+# JavaScript regex literals: a / where an operand is expected starts a regex, not a division
+CODE_REGEX_LITERAL_LANGUAGES = ('javascript', 'typescript')
+CODE_REGEX_LITERAL_PATTERN = re.compile(r'/(?![*/])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-zA-Z]*')
+CODE_REGEX_PRECEDING_WORDS = frozenset(['return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                                        'void', 'throw', 'yield', 'await'])
+# Tokens after a } that stay on its line (} else {, });, }, ...)
+CODE_CLOSERS = {'}': '{', ')': '(', ']': '['}
+CODE_BRACE_CONTINUATIONS = frozenset([';', ',', ')', ']', '.', 'else', 'catch', 'finally', 'while'])
+CODE_SIGNIFICANT_SPACE = ('++', '--', '//', '/*', '**', '&&', '||', '<<', '>>', '::', '..', '==', '=>', '->', '<-', '+-', '-+')
+# Minified output drops the spaces next to these; shell and Ruby keep every space, other
+# languages (None) keep only the spaces that separate words or would fuse operators
+CODE_MINIFY_TIGHT = {
+    'python': frozenset('{}();,:'), 'ruby': frozenset(), 'bash': frozenset(), 'shell': frozenset(),
+    'sql': frozenset('(),;'), **dict.fromkeys(['css', 'scss', 'less'], frozenset('{};,>')),
+}
+# SQL clauses that start a new line (first word -> words that must follow for it to count)
+SQL_CLAUSES = {
+    'SELECT': (), 'FROM': (), 'WHERE': (), 'HAVING': (), 'LIMIT': (), 'OFFSET': (), 'VALUES': (), 'SET': (),
+    'UPDATE': (), 'WITH': (), 'RETURNING': (), 'UNION': (), 'INTERSECT': (), 'EXCEPT': (), 'JOIN': (),
+    'GROUP': ('BY',), 'ORDER': ('BY',), 'INSERT': ('INTO',), 'DELETE': ('FROM',),
+    'INNER': ('JOIN',), 'CROSS': ('JOIN',), 'LEFT': ('JOIN', 'OUTER'), 'RIGHT': ('JOIN', 'OUTER'),
+    'FULL': ('JOIN', 'OUTER'), 'NATURAL': ('JOIN', 'LEFT', 'RIGHT', 'INNER'),
+}
+SQL_CONDITIONS = frozenset(['AND', 'OR'])
+SQL_CLAUSE_PREFIXES = frozenset(['DELETE', 'LEFT', 'RIGHT', 'FULL', 'INNER', 'CROSS', 'NATURAL', 'OUTER'])
+SQL_SPACED_BEFORE_PARENS = frozenset([*SQL_CLAUSES, *SQL_CONDITIONS, 'IN', 'AS', 'ON', 'EXISTS', 'NOT', 'INTO',
+                                      'USING', 'OVER', 'ALL', 'ANY'])
+WHITESPACE_RUN_PATTERN = re.compile(r'\s+')
+# JSON, XML and HTML are formatted as a stream of parse events, so a document of any size is
+# processed one read chunk at a time with memory bounded by its nesting depth
+CODE_STREAM_LANGUAGES = ('json', 'xml', 'html')
+JSON_ENCODE_STRING = json.encoder.encode_basestring  # the C string encoder json.dumps(ensure_ascii=False) uses
+CODE_STREAM_CHUNK_CHARS = 256 * 1024
+CODE_STREAM_FLUSH_PARTS = 4096  # output parts joined into one chunk
+# Every markup token may run to the end of the buffer, which means it continues in the next chunk
+# (comments and CDATA sections are then passed on in pieces, other tags are re-read whole up to
+# MARKUP_TAG_MAX_CHARS)
+MARKUP_TOKEN_PATTERN = re.compile(
+    r'(?P<comment><!--[\s\S]*?(?:-->|\Z))'
+    r'|(?P<cdata><!\[CDATA\[[\s\S]*?(?:\]\]>|\Z))'
+    r'|(?P<declaration><[!?][^>]*(?:>|\Z))'
+    r'|(?P<end></[^>]*(?:>|\Z))'
+    r'|(?P<start><[A-Za-z][^>"\']*(?:(?:"[^"]*(?:"|\Z)|\'[^\']*(?:\'|\Z))[^>"\']*)*(?:>|\Z))'
+    r'|(?P<text>[^<]+|<)')
+MARKUP_NAME_PATTERN = re.compile(r'</?\s*([^\s/>]+)')
+MARKUP_BODY_DELIMITERS = {'comment': ('<!--', '-->'), 'cdata': ('<![CDATA[', ']]>')}
+MARKUP_TAG_MAX_CHARS = 1024 * 1024
+HTML_VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                                'source', 'track', 'wbr'])
+# Elements closed implicitly by a sibling of the same name (<li>a<li>b)
+HTML_SELF_CLOSING_SIBLINGS = frozenset(['li', 'p', 'option', 'tr', 'td', 'th', 'dt', 'dd'])
+# Content passed through untouched, up to the matching end tag
+HTML_RAW_TEXT_END_PATTERNS = {name: re.compile(rf'</{name}\s*>', re.IGNORECASE)
+                              for name in ('script', 'style', 'pre', 'textarea')}
+# Results are cached by (content hash, language, mode) within CODE_FORMAT_CACHE_MAX_MB
+CODE_FORMAT_CACHE_ENTRY_OVERHEAD = 200  # bytes charged per entry on top of its text
+CODE_FORMAT_BATCH_MAX_ITEMS = 500
+CODE_FORMAT_POOL_MIN_CHARS = 64 * 1024  # smaller snippets are formatted on the request thread
+code_format_cache = OrderedDict()  # key -> (formatted_code, charged bytes)
+code_format_cache_usage = {'bytes': 0, 'hits': 0, 'misses': 0}
+code_format_cache_lock = threading.Lock()
+
+
+@app.route("/code-formatter")
+@login_required
+def code_formatter():
+    """Code Formatter page"""
+    user_id = session["user_id"]
+    username = session.get("username", "User")
+    log(f"User {user_id} accessed Code Formatter")
+    return render_template("code-formatter.html", username=username)
+
+
+@app.route("/api/code-formatter/format", methods=["POST"])
+@login_required
+def format_code():
+    """Format code based on selected mode"""
+    user_id = session["user_id"]
+    data = request.json
+
+    code = data.get("code", "")
+    language = data.get("language", "javascript")
+    mode = data.get("mode", "standard")  # 'standard' or 'oneline'
+
+    if not code:
+        return jsonify({"success": False, "error": "No code provided"}), 400
+    if not isinstance(code, str) or not isinstance(language, str) or not isinstance(mode, str):
+        return jsonify({"success": False, "error": "code, language and mode must be strings"}), 400
+
+    try:
+        formatted_code, cached = format_code_cached(code, language, mode)
+        log(f"User {user_id} formatted {language} code in {mode} mode{' (cached)' if cached else ''}")
+        return jsonify({
+            "success": True,
+            "formatted_code": formatted_code,
+            "cached": cached
+        })
+    except Exception as e:
+        log(f"Error formatting code for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/api/code-formatter/batch", methods=["POST"])
+@login_required
+def format_code_batch():
+    """
+    Format many snippets in one request: {"items": [{"code": ..., "language": ..., "mode": ...}],
+    "language": ..., "mode": ...} (item fields default to the top-level ones). Results come back
+    in item order; snippets of CODE_FORMAT_POOL_MIN_CHARS or more are formatted in parallel
+    across CODE_FORMAT_WORKERS processes.
+    """
+    user_id = session["user_id"]
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "items must be a non-empty array"}), 400
+    if len(items) > CODE_FORMAT_BATCH_MAX_ITEMS:
+        return jsonify({"success": False,
+                        "error": f"At most {CODE_FORMAT_BATCH_MAX_ITEMS} snippets can be formatted per batch"}), 400
+
+    jobs = []
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        code = item.get("code")
+        if not isinstance(code, str) or not code:
+            return jsonify({"success": False, "error": f"Item {index}: No code provided"}), 400
+        language = item.get("language", data.get("language", "javascript"))
+        mode = item.get("mode", data.get("mode", "standard"))
+        if not isinstance(language, str) or not isinstance(mode, str):
+            return jsonify({"success": False, "error": f"Item {index}: language and mode must be strings"}), 400
+        jobs.append((code, language, mode))
+
+    try:
+        results = format_code_batch_jobs(jobs)
+    except Exception as e:
+        log(f"Error formatting code batch for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    stats = {"items": len(results), "cached": sum(1 for result in results if result.get("cached")),
+             "failed": sum(1 for result in results if "error" in result)}
+    log(f"User {user_id} formatted a batch of {stats['items']} snippets ({stats['cached']} cached)")
+    return jsonify({"success": True, "results": results, "stats": stats})
+
+
+@app.route("/api/code-formatter/stream", methods=["POST"])
+@login_required
+def format_code_stream():
+    """
+    Format (mode=standard) or minify (mode=oneline) a large uploaded JSON, XML or HTML document
+    (field `file`, optionally gzip'd). The output is streamed back in chunks as it is produced;
+    if the document turns out to be invalid part way through, it ends with an "ERROR: ..." line.
+    """
+    user_id = session["user_id"]
+    language = request.form.get("language", "json")
+    mode = request.form.get("mode", "standard")
+    if "file" not in request.files:
+        return jsonify({"success": False, "error": "No file provided"}), 400
+    if language not in CODE_STREAM_LANGUAGES:
+        return jsonify({"success": False,
+                        "error": f"Streaming formatting supports {', '.join(CODE_STREAM_LANGUAGES)}"}), 400
+
+    work_dir = tempfile.mkdtemp(prefix="code-format-")
+    path = os.path.join(work_dir, "input")
+    try:
+        request.files["file"].save(path)
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log(f"Error receiving file to format for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    def generate():
+        try:
+            with (gzip.open(path, 'rb') if is_gzip_file(path) else open(path, 'rb')) as f:
+                yield from iter_formatted_chunks(f, language, mode == "oneline")
+            log(f"User {user_id} formatted a {language} file in {mode} mode (streaming)")
+        except Exception as e:
+            log(f"Error streaming formatted {language} for user {user_id}: {str(e)}")
+            yield f"\nERROR: {e}\n"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return Response(generate(), mimetype="text/plain; charset=utf-8")
+
+
+def iter_code_tokens(code, language):
+    """Yield (kind, text) tokens of `code` in one left-to-right pass"""
+    lexer = CODE_LEXERS[language]
+    if language not in CODE_REGEX_LITERAL_LANGUAGES:
+        for token in lexer.finditer(code):
+            yield token.lastgroup, token.group()
+        return
+
+    # A regex literal is one token, so the scan jumps over it instead of iterating matches
+    match = lexer.match
+    previous_kind, previous = 'op', ''  # last token that is not whitespace or a comment
+    pos, end = 0, len(code)
+    while pos < end:
+        token = match(code, pos)
+        kind, text = token.lastgroup, token.group()
+        if text == '/' and (previous_kind == 'op' or previous_kind == 'punct' and previous not in CODE_CLOSERS
+                            or previous_kind == 'word' and previous in CODE_REGEX_PRECEDING_WORDS):
+            literal = CODE_REGEX_LITERAL_PATTERN.match(code, pos)
+            if literal:
+                kind, text = 'string', literal.group()
+        pos += len(text)
+        if kind != 'space' and kind != 'line_comment' and kind != 'block_comment':
+            previous_kind, previous = kind, text
+        yield kind, text
+
+
+def format_c_like_code(code, language):
+    """
+    Brace-structured formatting: a line break after { and ; (outside parentheses), } on its own
+    line, and 2-space indentation per open brace, or per bracket whose contents start a new line
+    """
+    out = []
+    append = out.append
+    indent = 0
+    line_empty = True  # nothing written on the current output line yet
+    pending_space = False
+    pending_break = None  # '{', ';' or '}' just written: the next token decides where it goes
+    stack = []  # open delimiters as [char, indented]
+    open_parens = 0
+    last_opened = False  # last token written was ( or [
+
+    for kind, text in iter_code_tokens(code, language):
+        if kind == 'space':
+            if '\n' in text:
+                if last_opened and not stack[-1][1]:
+                    stack[-1][1] = True
+                    indent += 1
+                if not line_empty:
+                    append('\n')
+                    line_empty = True
+                pending_break = None
+                last_opened = False
+            pending_space = True
+            continue
+
+        if pending_break:
+            stays = kind == 'line_comment' or kind == 'block_comment' or \
+                pending_break == '}' and text in CODE_BRACE_CONTINUATIONS
+            if not stays and not line_empty:
+                append('\n')
+                line_empty = True
+            pending_break = None
+            pending_space = pending_space or stays and kind == 'word'
+
+        if kind == 'punct' and text in CODE_CLOSERS:
+            # Pop up to the matching opener; a stray closer pops nothing
+            opener = CODE_CLOSERS[text]
+            if any(entry[0] == opener for entry in stack):
+                while True:
+                    char, indented = stack.pop()
+                    if char != '{':
+                        open_parens -= 1
+                    if indented:
+                        indent -= 1
+                    if char == opener:
+                        break
+            if text == '}' and not line_empty:
+                append('\n')
+                line_empty = True
+
+        if line_empty:
+            append(CODE_INDENT * indent)
+            line_empty = False
+        elif pending_space:
+            append(' ')
+        pending_space = False
+        append(text)
+        last_opened = False
+
+        if kind != 'punct':
+            continue
+        if text == '{':
+            stack.append(['{', True])
+            indent += 1
+            pending_break = '{'
+        elif text == '(' or text == '[':
+            stack.append([text, False])
+            open_parens += 1
+            last_opened = True
+        elif text == ';' and not open_parens:
+            pending_break = ';'
+        elif text == '}':
+            pending_break = '}'
+
+    return ''.join(out).rstrip()
+
+
+def format_indented_code(code, language):
+    """
+    Formatting for indentation-structured languages: each line's indentation is re-derived
+    from the source's own block structure (like Python's tokenizer) and normalized to 2 spaces
+    per level; continuation lines inside brackets get one extra level
+    """
+    out = []
+    widths = [0]  # indentation widths of the open blocks
+    depth = 0  # open brackets
+    line = []
+    leading = 0
+    continued = False  # current line continues the previous one (open bracket or backslash)
+    comment_only = True
+    pending_space = False
+
+    def finish_line():
+        if not line:
+            return
+        if continued:
+            level = len(widths) - (1 if line[0] in CODE_CLOSERS else 0)
+        elif comment_only:
+            level = len(widths) if leading > widths[-1] else sum(1 for width in widths[1:] if width <= leading)
+        else:
+            while leading < widths[-1]:
+                widths.pop()
+            if leading > widths[-1]:
+                widths.append(leading)
+            level = len(widths) - 1
+        out.append(CODE_INDENT * level + ''.join(line))
+
+    for kind, text in iter_code_tokens(code, language):
+        if kind == 'newline' or kind == 'continuation':
+            if kind == 'continuation':
+                line.append(' \\' if line else '\\')
+            finish_line()
+            line = []
+            leading = 0
+            comment_only = True
+            pending_space = False
+            continued = depth > 0 or kind == 'continuation'
+            continue
+        if kind == 'space':
+            if line:
+                pending_space = True
+            else:
+                leading = len(text.expandtabs(8))
+            continue
+        if pending_space:
+            line.append(' ')
+            pending_space = False
+        line.append(text)
+        if kind != 'line_comment':
+            comment_only = False
+        if kind == 'punct':
+            if text in '([{':
+                depth += 1
+            elif text in ')]}':
+                depth = max(0, depth - 1)
+    finish_line()
+    return '\n'.join(out)
+
+
+def sql_clause_at(tokens, index):
+    """Whether the word at tokens[index] starts a clause (LEFT JOIN, not LEFT(name, 1))"""
+    word = tokens[index][1].upper()
+    follow = SQL_CLAUSES.get(word)
+    if follow is None:
+        return False
+    if not follow:
+        return True
+    for kind, text in tokens[index + 1:index + 4]:
+        if kind == 'word':
+            return text.upper() in follow
+    return False
+
+
+def format_sql_code(code, language='sql'):
+    """
+    SQL formatting: each clause (SELECT, FROM, WHERE, JOINs, ...) on its own line, AND/OR
+    conditions on continuation lines, and subqueries indented one level per nesting
+    """
+    tokens = [token for token in iter_code_tokens(code, language) if token[0] != 'space']
+    out = []
+    line = ['']  # indentation, then the line's tokens
+    level = 0
+    subqueries = []  # for each open parenthesis, whether it holds a subquery
+    in_between = False  # the next AND belongs to BETWEEN ... AND ...
+    tight = True  # no space before the next token
+
+    def break_line(indent):
+        if len(line) > 1:
+            out.append(''.join(line))
+        line[:] = [CODE_INDENT * indent]
+
+    for index, (kind, text) in enumerate(tokens):
+        upper = text.upper() if kind == 'word' else ''
+        previous = tokens[index - 1][1].upper() if index else ''
+        if upper and sql_clause_at(tokens, index) and previous not in SQL_CLAUSE_PREFIXES:
+            break_line(level)
+            tight = True
+        elif upper in SQL_CONDITIONS and not in_between:
+            break_line(level + 1)
+            tight = True
+        elif text == ')' and subqueries and subqueries[-1]:
+            level -= 1
+            break_line(level)
+            tight = True
+
+        # Function calls keep their parenthesis: COUNT(*), but IN (...), VALUES (...)
+        if not tight and text not in (')', ',', ';') and not (
+                text == '(' and tokens[index - 1][0] == 'word' and previous not in SQL_SPACED_BEFORE_PARENS):
+            line.append(' ')
+        line.append(text)
+        # No space after an opening parenthesis or a unary sign
+        tight = text == '(' or kind == 'op' and text in ('-', '+') and (
+            index == 0 or tokens[index - 1][0] in ('op', 'punct') and tokens[index - 1][1] != ')'
+            or previous in SQL_CLAUSES or previous in SQL_CONDITIONS)
+
+        if upper == 'BETWEEN':
+            in_between = True
+        elif upper == 'AND':
+            in_between = False
+        if text == '(':
+            is_subquery = index + 1 < len(tokens) and tokens[index + 1][1].upper() in ('SELECT', 'WITH')
+            subqueries.append(is_subquery)
+            if is_subquery:
+                level += 1
+        elif text == ')' and subqueries:
+            subqueries.pop()
+        elif text == ';' or kind == 'line_comment':
+            break_line(level)
+            tight = True
+
+    break_line(level)
+    return '\n'.join(out)
+
+
+def minify_code_tokens(code, language):
+    """
+    Join the tokens on one line without comments. A space is kept only where removing it would
+    change the meaning: between two word characters, or where two operators would fuse (a - -b).
+    Languages in CODE_MINIFY_TIGHT keep their source spacing except around their tight punctuation.
+    """
+    tight = CODE_MINIFY_TIGHT.get(language)
+    out = []
+    append = out.append
+    last = ''
+    pending_space = False
+    for kind, text in iter_code_tokens(code, language):
+        if kind in ('space', 'newline', 'continuation', 'line_comment', 'block_comment'):
+            pending_space = True
+            continue
+        if last and pending_space:
+            if tight is None:
+                before, after = last[-1], text[0]
+                if ((before.isalnum() or before in '_$') and (after.isalnum() or after in '_$')
+                        or before + after in CODE_SIGNIFICANT_SPACE):
+                    append(' ')
+            elif last not in tight and text not in tight:
+                append(' ')
+        pending_space = False
+        append(text)
+        last = text
+    return ''.join(out)
+
+
+def append_pretty_json(value, indent, parts):
+    """
+    Append `value` formatted like json.dumps(indent=2, ensure_ascii=False) to `parts`, with
+    nested lines prefixed by `indent`. json.dumps() drops to its pure-Python encoder whenever
+    indent is set; this writes straight into the shared parts list instead.
+    """
+    value_type = type(value)
+    if value_type is str:
+        parts.append(JSON_ENCODE_STRING(value))
+    elif value_type is dict or value_type is list:
+        if not value:
+            parts.append('{}' if value_type is dict else '[]')
+            return
+        inner = indent + CODE_INDENT
+        separator = '\n' + inner
+        if value_type is dict:
+            parts.append('{')
+            for key, item in value.items():
+                parts.append(separator)
+                parts.append(JSON_ENCODE_STRING(key))
+                parts.append(': ')
+                append_pretty_json(item, inner, parts)
+                separator = ',\n' + inner
+            parts.append('\n' + indent + '}')
+        else:
+            parts.append('[')
+            for item in value:
+                parts.append(separator)
+                append_pretty_json(item, inner, parts)
+                separator = ',\n' + inner
+            parts.append('\n' + indent + ']')
+    elif value is None:
+        parts.append('null')
+    elif value is True or value is False:
+        parts.append('true' if value else 'false')
+    else:
+        parts.append(json.dumps(value) if value_type is float and not math.isfinite(value) else repr(value))
+
+
+def iter_json_format_chunks(f, minify=False):
+    """
+    Pretty-print (or minify) the JSON document in binary file `f` from its parse events, in
+    chunks. Containers small enough to be decoded whole are written by append_pretty_json() (or
+    the C encoder when minifying); larger ones event by event. Several top-level values (NDJSON)
+    come out one per line.
+    """
+    parts = []
+    depth = 0
+    first = True  # the next item is the first of its container
+    after_key = False
+    separators = (',', ':') if minify else (',', ': ')
+    for kind, value in iter_json_events(f):
+        if kind == 'end_map' or kind == 'end_array':
+            depth -= 1
+            close = '}' if kind == 'end_map' else ']'
+            parts.append(close if first or minify else '\n' + CODE_INDENT * depth + close)
+            first = False
+            continue
+
+        if after_key:
+            after_key = False
+        elif depth:
+            parts.append(('' if first else ',') + ('' if minify else '\n' + CODE_INDENT * depth))
+        elif not first:
+            parts.append('\n')
+        first = False
+
+        if kind == 'map_key':
+            parts.append(json.dumps(value, ensure_ascii=False) + separators[1])
+            after_key = True
+        elif kind == 'start_map' or kind == 'start_array':
+            parts.append('{' if kind == 'start_map' else '[')
+            depth += 1
+            first = True
+        elif minify:
+            parts.append(json.dumps(value, ensure_ascii=False, separators=separators))
+        else:
+            append_pretty_json(value, CODE_INDENT * depth, parts)
+
+        if len(parts) >= CODE_STREAM_FLUSH_PARTS:
+            yield ''.join(parts)
+            parts.clear()
+    yield ''.join(parts)
+
+
+def markup_tag_name(tag, html=False):
+    """Element name of a start or end tag, lowercased for HTML"""
+    match = MARKUP_NAME_PATTERN.match(tag)
+    name = match.group(1) if match else ''
+    return name.lower() if html else name
+
+
+def iter_markup_events(f, html=False):
+    """
+    Incrementally tokenize XML/HTML from text file `f` into (kind, text) events: 'start', 'end',
+    'text', 'comment', 'cdata', 'declaration' and 'raw' (the untouched content of an HTML
+    script/style/pre/textarea element). A comment or CDATA section longer than the buffer is
+    followed by 'more' events carrying the rest of it. Memory is one read chunk plus the current tag.
+    """
+    buffer, pos, eof = '', 0, False
+    raw_end = None  # end tag pattern of the raw text element we are in
+    body_end = None  # terminator of the comment or CDATA section we are in
+    while True:
+        if pos >= len(buffer):
+            if eof:
+                return
+            buffer, pos = f.read(CODE_STREAM_CHUNK_CHARS), 0
+            eof = not buffer
+            continue
+
+        if body_end is not None:
+            # Only the new chunk and the last len(body_end) - 1 characters before it are searched
+            end = buffer.find(body_end, pos)
+            if end >= 0:
+                yield 'more', buffer[pos:end + len(body_end)]
+                pos, body_end = end + len(body_end), None
+                continue
+            end = len(buffer) if eof else max(pos, len(buffer) - len(body_end) + 1)
+            if end > pos:
+                yield 'more', buffer[pos:end]
+                pos = end
+            if not eof:
+                chunk = f.read(CODE_STREAM_CHUNK_CHARS)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+
+        if raw_end is not None:
+            match = raw_end.search(buffer, pos)
+            end = match.start() if match else len(buffer) if eof else max(pos, len(buffer) - 16)
+            if end > pos:
+                yield 'raw', buffer[pos:end]
+                pos = end
+            if match:
+                raw_end = None
+            elif not eof:
+                # Keep a tail in case the end tag straddles the chunk boundary
+                chunk = f.read(CODE_STREAM_CHUNK_CHARS)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+
+        match = MARKUP_TOKEN_PATTERN.match(buffer, pos)
+        kind, text = match.lastgroup, match.group()
+        if kind in MARKUP_BODY_DELIMITERS and match.end() == len(buffer) and not eof:
+            opener, terminator = MARKUP_BODY_DELIMITERS[kind]
+            if not text.endswith(terminator, len(opener)):
+                # Runs past the buffer: pass the opener on and scan for the terminator chunk by chunk
+                pos += len(opener)
+                body_end = terminator
+                yield kind, opener
+                continue
+        if match.end() == len(buffer) and not eof and (kind != 'text' or len(text) < CODE_STREAM_CHUNK_CHARS):
+            # The token may continue in the next chunk (long text is passed on in pieces)
+            if len(text) > MARKUP_TAG_MAX_CHARS:
+                raise ValueError(f"Tag longer than {MARKUP_TAG_MAX_CHARS} characters: {text[:40]}...")
+            chunk = f.read(CODE_STREAM_CHUNK_CHARS)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        pos = match.end()
+        yield kind, text
+        if html and kind == 'start' and not text.endswith('/>'):
+            raw_end = HTML_RAW_TEXT_END_PATTERNS.get(markup_tag_name(text, html))
+
+
+def iter_markup_format_chunks(f, language, minify=False):
+    """
+    Pretty-print (or minify) XML/HTML from text file `f` in chunks: one tag per line indented by
+    nesting depth, with short text kept on its element's line. Minifying drops comments and
+    collapses whitespace (whitespace-only text between XML elements is dropped). Raw text elements
+    are copied as they are. Only the stack of open element names is kept.
+    """
+    html = language == 'html'
+    parts = []
+    stack = []  # names of the open elements
+    separator = ''  # no line break before the first line
+    attach_end = None  # element whose end tag stays on the current line (just opened, or with inline text)
+    dropped_comment = False  # the rest of a minified comment is dropped too
+
+    for kind, text in iter_markup_events(f, html):
+        if kind == 'more':
+            if not dropped_comment:
+                parts.append(text)
+        elif kind == 'raw':
+            parts.append(text)
+        elif kind == 'text':
+            if minify:
+                text = WHITESPACE_RUN_PATTERN.sub(' ', text)
+                if html or text != ' ':
+                    parts.append(text)
+                continue
+            lines = [line for line in (line.strip() for line in text.split('\n')) if line]
+            if attach_end and len(lines) == 1:
+                parts.append(lines[0])
+                continue
+            for line in lines:
+                parts.append(separator + CODE_INDENT * len(stack) + line)
+                separator = '\n'
+            if lines:
+                attach_end = None
+        elif kind == 'end':
+            name = markup_tag_name(text, html)
+            if name in stack:
+                while stack.pop() != name:
+                    pass
+            parts.append(text if minify or attach_end == name else separator + CODE_INDENT * len(stack) + text)
+            separator = '\n'
+            attach_end = None
+        elif minify and kind == 'comment':
+            dropped_comment = True
+        else:
+            dropped_comment = False
+            if kind == 'start':
+                name = markup_tag_name(text, html)
+                if html and name in HTML_SELF_CLOSING_SIBLINGS and stack and stack[-1] == name:
+                    stack.pop()
+            parts.append(text if minify else separator + CODE_INDENT * len(stack) + text)
+            separator = '\n'
+            attach_end = None
+            if kind == 'start' and not text.endswith('/>') and not (html and name in HTML_VOID_ELEMENTS):
+                stack.append(name)
+                attach_end = name
+
+        if len(parts) >= CODE_STREAM_FLUSH_PARTS:
+            yield ''.join(parts)
+            parts.clear()
+    yield ''.join(parts)
+
+
+def iter_formatted_chunks(f, language, minify=False):
+    """Formatted (or minified) text of a JSON/XML/HTML document in binary file `f`, in chunks"""
+    if language == 'json':
+        return iter_json_format_chunks(f, minify)
+    return iter_markup_format_chunks(io.TextIOWrapper(f, encoding='utf-8-sig', errors='replace'), language, minify)
+
+
+def format_code_in_memory(code, language, minify=False):
+    """Run the streaming formatter over a string (None if it isn't valid JSON)"""
+    try:
+        return ''.join(iter_formatted_chunks(io.BytesIO(code.encode('utf-8')), language, minify)).strip()
+    except ValueError:
+        return None
+
+
+def format_code_job(code, language, mode):
+    """Format one snippet (module level so the batch process pool can run it)"""
+    return minify_code(code, language) if mode == 'oneline' else format_code_standard(code, language)
+
+
+def code_format_cache_key(code, language, mode):
+    digest = hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    return digest, language, 'oneline' if mode == 'oneline' else 'standard'
+
+
+def get_cached_code_format(key):
+    with code_format_cache_lock:
+        entry = code_format_cache.get(key)
+        if entry is None:
+            code_format_cache_usage['misses'] += 1
+            return None
+        code_format_cache.move_to_end(key)
+        code_format_cache_usage['hits'] += 1
+        return entry[0]
+
+
+def cache_code_format(key, formatted_code):
+    """Store a result, evicting least recently used ones until the cache fits its budget"""
+    size = len(formatted_code) if formatted_code.isascii() else len(formatted_code.encode('utf-8', 'surrogatepass'))
+    charged = size + CODE_FORMAT_CACHE_ENTRY_OVERHEAD
+    max_bytes = CODE_FORMAT_CACHE_MAX_MB * 1024 * 1024
+    if charged > max_bytes // 4:
+        return  # one huge result would flush everything else
+    with code_format_cache_lock:
+        previous = code_format_cache.pop(key, None)
+        if previous is not None:
+            code_format_cache_usage['bytes'] -= previous[1]
+        code_format_cache[key] = (formatted_code, charged)
+        code_format_cache_usage['bytes'] += charged
+        while code_format_cache_usage['bytes'] > max_bytes:
+            code_format_cache_usage['bytes'] -= code_format_cache.popitem(last=False)[1][1]
+
+
+def format_code_cached(code, language, mode):
+    """Format a snippet through the result cache. Returns (formatted_code, cached)."""
+    key = code_format_cache_key(code, language, mode)
+    formatted_code = get_cached_code_format(key)
+    if formatted_code is not None:
+        return formatted_code, True
+    formatted_code = format_code_job(code, language, mode)
+    cache_code_format(key, formatted_code)
+    return formatted_code, False
+
+
+def format_code_batch_jobs(jobs):
+    """
+    Format (code, language, mode) jobs, returning a result dict per job in order. Cached results
+    are reused and repeated snippets formatted once; large uncached snippets go to a process pool.
+    """
+    results = [None] * len(jobs)
+    pending = {}  # cache key -> indexes of the jobs waiting for it
+    for index, (code, language, mode) in enumerate(jobs):
+        key = code_format_cache_key(code, language, mode)
+        formatted_code = get_cached_code_format(key)
+        if formatted_code is not None:
+            results[index] = {'formatted_code': formatted_code, 'cached': True}
+        else:
+            pending.setdefault(key, []).append(index)
+
+    def finish(key, future=None):
+        indexes = pending[key]
+        try:
+            formatted_code = future.result() if future else format_code_job(*jobs[indexes[0]])
+        except Exception as e:
+            result = {'error': str(e)}
+        else:
+            cache_code_format(key, formatted_code)
+            result = {'formatted_code': formatted_code, 'cached': False}
+        for index in indexes:
+            results[index] = result
+
+    large = [key for key, indexes in pending.items() if len(jobs[indexes[0]][0]) >= CODE_FORMAT_POOL_MIN_CHARS]
+    workers = min(CODE_FORMAT_WORKERS, len(large))
+    pooled = large if workers > 1 else []
+    futures = iter(())
+    if pooled:
+        futures = iter_process_pool_futures(format_code_job, [jobs[pending[key][0]] for key in pooled], workers)
+    try:
+        # Small snippets are formatted here while the pool works on the large ones
+        pooled_keys = set(pooled)
+        for key in pending:
+            if key not in pooled_keys:
+                finish(key)
+        for index, future in futures:
+            finish(pooled[index], future)
+    finally:
+        if pooled:
+            futures.close()
+    return results
+
+
+def minify_code(code, language):
+    """Convert code to single line (minify)"""
+    if language in CODE_STREAM_LANGUAGES:
+        minified = format_code_in_memory(code, language, minify=True)
+        if minified is not None:
+            return minified
+    if language in CODE_FAMILIES:
+        return minify_code_tokens(code, language)
+
+    # Unknown languages: collapse whitespace
+    return WHITESPACE_RUN_PATTERN.sub(' ', code).strip()
+
+
+def format_code_standard(code, language):
+    """Format code with Postman-style beautify (2-space indentation)"""
+    if language in CODE_STREAM_LANGUAGES:
+        formatted = format_code_in_memory(code, language)
+        if formatted is not None:
+            return formatted  # invalid JSON falls back to brace formatting
+
+    family = CODE_FAMILIES.get(language)
+    if family in ('c', 'css'):
+        return format_c_like_code(code, language)
+    if family == 'indented':
+        return format_indented_code(code, language)
+    if family == 'sql':
+        return format_sql_code(code, language)
+
+    # Unknown languages: keep the non-blank lines, stripped
+    return '\n'.join(line.strip() for line in code.split('\n') if line.strip())
+
+
+# ==================== END CODE FORMATTER ROUTES ====================
+
+
+# ==================== AWS LOG COMPARISON ENGINE ====================
+# Server-side counterpart of compareLogs() in static/js/aws-log-compare.js for exports too
+# large for the browser. Both inputs are stream-parsed and hash-partitioned by key column
+# into files on disk; each partition pair is then diffed on its own, so memory is bounded
+# by the partition size instead of the input size. Results are written per change type as
+# NDJSON and served back in pages.
+
+LOG_COMPARE_CHANGE_TYPES = ("added", "removed", "modified", "unchanged", "fuzzy_matched")
+LOG_COMPARE_MIN_PARTITIONS = 16
+LOG_COMPARE_MAX_PARTITIONS = 256  # one file per partition stays open while a side is partitioned
+LOG_COMPARE_PARTITION_BYTES = 32 * 1024 * 1024  # target input bytes per partition
+LOG_COMPARE_SPLIT_BYTES = 2 * LOG_COMPARE_PARTITION_BYTES  # partition pairs larger than this are split again
+LOG_COMPARE_MAX_SPLIT_DEPTH = 3  # a single huge key can't be split, so give up after this many rounds
+LOG_KEY_SAMPLE_ROWS = 5000  # reservoir size used to score key columns
+LOG_KEY_SCAN_ROWS = 500000  # rows read at most while sampling, bounding 'auto' on huge files
+LOG_KEY_SHAPE_RATIO = 0.9  # share of values that must look like a UUID/timestamp
+LOG_RESULT_INDEX_STRIDE = 1000  # a byte offset is indexed every N result records
+LOG_RESULT_MAX_PAGE_SIZE = 1000
+LOG_RESULT_INDEX_BATCH_SIZE = 10000  # rows per insert batch when building the query index
+LOG_RESULT_INDEX_VERSION = 1  # results.db schema version; older indexes are rebuilt on first query
+LOG_RESULT_OPEN_FILES = 64  # result segment files a sorted query keeps open at once
+LOG_HLL_PRECISION = 12  # 4096 HyperLogLog registers, about 1.6% standard error
+LOG_TYPE_PROFILE_ROWS = 1000  # leading rows per file whose value types are profiled (the browser checks 100)
+LOG_NULL_RATE_THRESHOLD = 0.1  # columns emptier than this are reported, like analyzeDataQuality()
+LOG_NUMERIC_START = frozenset('0123456789+-.')  # first characters of numbers and timestamps
+LOG_BOOLEAN_VALUES = frozenset(['true', 'false', 'True', 'False', 'TRUE', 'FALSE'])
+LOG_TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2}')
+LOG_UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+LOG_KEY_NAME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'^id$', r'^.*id$', r'^request.*id$', r'^message.*id$',
+    r'^transaction.*id$', r'^.*key$', r'^.*identifier$',
+    r'^.*uuid$', r'^.*guid$'
+)]
+COMPARISON_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+LOG_COMPARE_JOB_FINISHED = ("completed", "failed")
+# Sort orders of the result query API (a leading '-' sorts descending); ties keep file order
+LOG_RESULT_SORTS = {'position': 'id', 'key': 'key', 'changes': 'change_count', 'similarity': 'similarity'}
+LOG_RESULT_EXPORT_LABELS = {
+    'added': 'Added', 'removed': 'Removed', 'modified': 'Modified',
+    'unchanged': 'Unchanged', 'fuzzy_matched': 'Fuzzy Match'
+}
+
+# Fuzzy matching: rows are blocked on bottom-k sketches of per-column q-grams so each
+# unmatched row is only scored against a short list of likely candidates, never all rows.
+LOG_FUZZY_THRESHOLD = 0.85  # same 85% row similarity threshold as the browser
+LOG_FUZZY_QGRAM = 3
+LOG_FUZZY_SKETCH_SIZE = 4  # smallest q-gram hashes kept per column as blocking keys
+LOG_FUZZY_MAX_VALUE_CHARS = 128  # only the start of long values is used for blocking
+LOG_FUZZY_MAX_CANDIDATES = 10  # candidates scored exactly per unmatched row
+LOG_FUZZY_MAX_POSTINGS = 1000  # blocking keys shared by more rows than this aren't selective
+LOG_FUZZY_PROBE_KEYS = 8  # only the rarest blocking keys of a row are probed
+
+# Input formats: gzip is detected by magic bytes, NDJSON vs CSV/TSV and the delimiter from a sample
+LOG_GZIP_MAGIC = b'\x1f\x8b'
+LOG_GZIP_SIZE_RATIO = 8  # assumed compression ratio when sizing partitions for gzip input
+LOG_FORMAT_SAMPLE_LINES = 50
+LOG_DELIMITERS = (',', '\t', ';', '|')
+
+# Allow very wide CloudWatch message fields
+csv.field_size_limit(sys.maxsize)
+
+
+def is_gzip_file(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == LOG_GZIP_MAGIC
+
+
+def open_log_file(path):
+    """Open a log export as text, decompressing gzip on the fly"""
+    if is_gzip_file(path):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8-sig', errors='replace')
+    return open(path, newline='', encoding='utf-8-sig', errors='replace')
+
+
+def detect_log_delimiter(sample, complete=True):
+    """
+    Pick the delimiter from the header like detectDelimiter() in the browser (tab only wins over
+    comma with more fields). Semicolon and pipe are also considered, and a candidate must split
+    every sampled record. The sample is parsed as records per candidate, so a quoted value that
+    spans lines is one record; unless `complete`, its last record may be cut off and isn't checked.
+    """
+    best, best_count = ',', 0
+    for delimiter in LOG_DELIMITERS:
+        records = [values for values in csv.reader(io.StringIO(sample), delimiter=delimiter)
+                   if values and any(value.strip() for value in values)]
+        if not complete and len(records) > 1:
+            records.pop()
+        if not records:
+            continue
+        count = len(records[0]) - 1
+        if count > best_count and all(len(values) > 1 for values in records[1:]):
+            best, best_count = delimiter, count
+    return best
+
+
+def detect_log_format(path):
+    """Return ('ndjson', None) or ('csv', delimiter) from the first lines of an export"""
+    sample_lines = []
+    non_empty = 0
+    complete = True
+    with open_log_file(path) as f:
+        for line in f:
+            sample_lines.append(line)
+            if line.strip():
+                non_empty += 1
+                if non_empty >= LOG_FORMAT_SAMPLE_LINES:
+                    complete = False
+                    break
+
+    first_line = next((line for line in sample_lines if line.strip()), '')
+    if first_line.lstrip().startswith('{'):
+        try:
+            if isinstance(json.loads(first_line), dict):
+                return 'ndjson', None
+        except ValueError:
+            pass
+    return 'csv', detect_log_delimiter(''.join(sample_lines), complete)
+
+
+def log_json_value(value):
+    """Render an NDJSON field as the string the browser would compare (String(value))"""
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            return 'NaN' if value != value else ('Infinity' if value > 0 else '-Infinity')
+        return format_js_number(value) if isinstance(value, float) else str(value)
+    # Nested objects are kept as compact JSON rather than "[object Object]"
+    return json.dumps(value, separators=(',', ':'))
+
+
+def iter_log_records(path, log_format=None):
+    """
+    Lazily iterate a CSV/TSV or NDJSON export (optionally gzip'd) as dicts keyed by header.
+    CSV values are trimmed and rows whose column count doesn't match the header are skipped,
+    matching parseCSV() in the browser. NDJSON lines that aren't JSON objects are skipped,
+    like parseJSONLogs(); fields a line doesn't have are simply absent (compared as empty).
+    `log_format` is the detect_log_format() result, if the caller already has it.
+    """
+    log_format, delimiter = log_format or detect_log_format(path)
+    with open_log_file(path) as f:
+        if log_format == 'ndjson':
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield {str(field): log_json_value(value) for field, value in record.items()}
+            return
+
+        headers = None
+        for values in csv.reader(f, delimiter=delimiter):
+            if not values or not any(value.strip() for value in values):
+                continue
+            values = [value.strip() for value in values]
+            if headers is None:
+                headers = values
+                continue
+            if len(values) == len(headers):
+                yield dict(zip(headers, values))
+
+
+def read_log_headers(path, log_format=None):
+    """
+    Read the headers of an export: the header row of a CSV/TSV, or for NDJSON the fields seen in
+    its first LOG_KEY_SCAN_ROWS lines, in order of first appearance (partition_log_file() collects
+    every field while partitioning, so a comparison never needs an extra pass for them)
+    """
+    log_format = log_format or detect_log_format(path)
+    if log_format[0] == 'ndjson':
+        headers = {}
+        for scanned, row in enumerate(iter_log_records(path, log_format)):
+            if scanned >= LOG_KEY_SCAN_ROWS:
+                break
+            for field in row:
+                headers.setdefault(field, None)
+        return list(headers)
+    delimiter = log_format[1]
+
+    with open_log_file(path) as f:
+        for values in csv.reader(f, delimiter=delimiter):
+            if values and any(value.strip() for value in values):
+                return [value.strip() for value in values]
+    return []
+
+
+def sample_log_records(path, size=LOG_KEY_SAMPLE_ROWS, max_rows=LOG_KEY_SCAN_ROWS, log_format=None):
+    """
+    Reservoir-sample up to `size` rows from the first `max_rows` rows of an export.
+    The sample is returned in file order so monotonic key columns stay monotonic.
+    Returns (sample, rows_scanned).
+    """
+    rng = random.Random(0)  # deterministic, so the same file always detects the same key
+    reservoir = []
+    scanned = 0
+    for row in iter_log_records(path, log_format):
+        if scanned >= max_rows:
+            break
+        if scanned < size:
+            reservoir.append((scanned, row))
+        else:
+            slot = rng.randrange(scanned + 1)
+            if slot < size:
+                reservoir[slot] = (scanned, row)
+        scanned += 1
+    reservoir.sort(key=lambda item: item[0])
+    return [row for _, row in reservoir], scanned
+
+
+def score_log_key_column(header, values):
+    """
+    Score one column of sampled values the way detectKeyColumn() does, in a single pass:
+    uniqueness, null ratio, numeric monotonicity and UUID/timestamp shape are all gathered
+    while walking the column once.
+    """
+    total = len(values)
+    seen = set()
+    nulls = numeric = uuid_like = timestamp_like = 0
+    monotonic = True
+    previous = None
+    for value in values:
+        if value == '':
+            nulls += 1
+            continue
+        seen.add(value)
+        number = parse_log_number(value)
+        if number is not None:
+            numeric += 1
+            if previous is not None and number <= previous:
+                monotonic = False
+            previous = number
+        if LOG_UUID_PATTERN.match(value):
+            uuid_like += 1
+        elif LOG_TIMESTAMP_PATTERN.match(value):
+            timestamp_like += 1
+
+    non_empty = total - nulls
+    uniqueness_ratio = len(seen) / total if total else 0.0
+    null_ratio = nulls / total if total else 0.0
+    uuid_ratio = uuid_like / non_empty if non_empty else 0.0
+    timestamp_ratio = timestamp_like / non_empty if non_empty else 0.0
+    sequential = numeric > total * 0.8 and numeric > 2 and monotonic
+
+    score = 0
+    if any(pattern.match(header) for pattern in LOG_KEY_NAME_PATTERNS):
+        score += 100
+    if uniqueness_ratio == 1.0:
+        score += 80
+    elif uniqueness_ratio > 0.9:
+        score += 60
+    elif uniqueness_ratio > 0.7:
+        score += 30
+    if sequential:
+        score += 40
+    score -= null_ratio * 50
+    if uuid_ratio >= LOG_KEY_SHAPE_RATIO:
+        score += 60
+    if timestamp_ratio >= LOG_KEY_SHAPE_RATIO:
+        score += 30
+
+    return {
+        'column': header,
+        'score': round(score, 2),
+        'uniqueness_ratio': round(uniqueness_ratio, 4),
+        'null_ratio': round(null_ratio, 4),
+        'sequential': sequential,
+        'uuid_ratio': round(uuid_ratio, 4),
+        'timestamp_ratio': round(timestamp_ratio, 4)
+    }
+
+
+def rank_log_key_columns(headers, rows):
+    """Score every column of a row sample and return them best first (ties keep header order)"""
+    # Transpose once into per-column arrays instead of re-walking the rows for every column
+    columns = list(zip(*([row.get(header, '') for header in headers] for row in rows))) or [()] * len(headers)
+    ranking = []
+    for index, (header, values) in enumerate(zip(headers, columns)):
+        scored = score_log_key_column(header, values)
+        scored['index'] = index
+        ranking.append(scored)
+    ranking.sort(key=lambda scored: -scored['score'])
+    return ranking
+
+
+def detect_log_key_column(headers, rows):
+    """Return the best key column of a row sample, like detectKeyColumn() in the browser"""
+    if not headers:
+        return None
+    return rank_log_key_columns(headers, rows)[0]['column']
+
+
+def resolve_log_key_column(key_column, headers, path, log_format=None):
+    """Resolve the requested key column (header name, column index, or 'auto')"""
+    if key_column and key_column != 'auto':
+        if key_column in headers:
+            return key_column
+        if key_column.isdigit() and int(key_column) < len(headers):
+            return headers[int(key_column)]
+        raise ValueError(f"Key column '{key_column}' not found in original data")
+
+    sample, _ = sample_log_records(path, log_format=log_format)
+    return detect_log_key_column(headers, sample)
+
+
+def log_row_key(row, key_column):
+    """Key of a row; rows without a key value fall back to their full content, like the browser"""
+    return row.get(key_column) or json.dumps(row, separators=(',', ':'))
+
+
+def log_partition_index(key, num_partitions):
+    """Stable hash partition of a key (crc32 is identical across processes and restarts)"""
+    return zlib.crc32(key.encode('utf-8')) % num_partitions
+
+
+def choose_log_partition_count(*paths):
+    """Enough partitions to keep each one near LOG_COMPARE_PARTITION_BYTES"""
+    total_bytes = sum(os.path.getsize(path) * (LOG_GZIP_SIZE_RATIO if is_gzip_file(path) else 1) for path in paths)
+    wanted = math.ceil(total_bytes / LOG_COMPARE_PARTITION_BYTES)
+    return min(max(wanted, LOG_COMPARE_MIN_PARTITIONS), LOG_COMPARE_MAX_PARTITIONS)
+
+
+def log_row_digest(row, columns):
+    """
+    Canonical digest of a row over the compared columns, or with columns=None over all of its
+    non-empty fields (when the columns are only known after the pass).
+    Rows are trimmed when parsed, so equal digests mean find_log_changes() has nothing to report.
+    A column missing from one file only makes the digests differ; the field diff then treats it as empty.
+    """
+    if columns is None:
+        canonical = repr(sorted(item for item in row.items() if item[1]))
+    else:
+        canonical = repr(list(map(row.get, columns)))  # repr keeps value boundaries unambiguous
+    return hashlib.blake2b(canonical.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def classify_log_value(value):
+    """Type of a non-empty log value: 'number', 'timestamp', 'boolean' or 'string'"""
+    # Dispatch on the first character so most strings skip the regex and float() attempts
+    if value[0] not in LOG_NUMERIC_START:
+        return 'boolean' if value in LOG_BOOLEAN_VALUES else 'string'
+    if LOG_TIMESTAMP_PATTERN.match(value):
+        return 'timestamp'
+    if parse_log_number(value) is not None:
+        return 'number'
+    return 'string'
+
+
+def log_hll_add(registers, value):
+    """
+    Add a string to a HyperLogLog sketch (a bytearray of 2**LOG_HLL_PRECISION registers).
+    blake2b rather than hash() keeps the estimate identical across runs and processes.
+    """
+    h = int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+    index = h & ((1 << LOG_HLL_PRECISION) - 1)
+    rank = 64 - LOG_HLL_PRECISION - (h >> LOG_HLL_PRECISION).bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def log_hll_count(registers):
+    """Estimated number of distinct values added to a HyperLogLog sketch"""
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)  # linear counting is more accurate for small sets
+    return int(round(estimate))
+
+
+def partition_log_file(path, key_column, partition_dir, side, num_partitions, columns, profile_columns,
+                       log_format=None):
+    """
+    Stream a log export into num_partitions files of tab-separated key JSON, row digest (over
+    the compared columns; None digests all non-empty fields) and row JSON lines.
+    JSON escapes tabs inside strings, so the fields split cleanly without decoding the row.
+
+    The same pass profiles the export: the empty count of every column of `profile_columns`,
+    a value type histogram over its first LOG_TYPE_PROFILE_ROWS rows and a HyperLogLog estimate
+    of its distinct keys. With profile_columns=None (NDJSON, whose lines may each have different
+    fields) the columns are collected as they appear. Returns {'rows': count, 'headers': columns,
+    'distinct_keys': estimate, 'columns': {column: {'empty': n, 'types': {...}}}}.
+    """
+    files = {}
+    rows_read = 0
+    discover = profile_columns is None
+    empty = dict.fromkeys(profile_columns or (), 0)
+    filled = {}  # column -> non-empty count, in order of first appearance (discovery only)
+    type_counts = {}  # (column, type) -> count
+    key_sketch = bytearray(1 << LOG_HLL_PRECISION)
+    try:
+        for row in iter_log_records(path, log_format):
+            key = log_row_key(row, key_column)
+            index = log_partition_index(key, num_partitions)
+            if index not in files:
+                files[index] = open(os.path.join(partition_dir, f"{side}-{index}.tsv"), 'w', encoding='utf-8')
+            files[index].write(f"{json.dumps(key)}\t{log_row_digest(row, columns)}\t"
+                               f"{json.dumps(row, separators=(',', ':'))}\n")
+            rows_read += 1
+            log_hll_add(key_sketch, key)
+
+            if discover:
+                profiled = rows_read <= LOG_TYPE_PROFILE_ROWS
+                for column, value in row.items():
+                    if value:
+                        filled[column] = filled.get(column, 0) + 1
+                        if profiled:
+                            counted = (column, classify_log_value(value))
+                            type_counts[counted] = type_counts.get(counted, 0) + 1
+                    elif column not in filled:
+                        filled[column] = 0
+            elif rows_read <= LOG_TYPE_PROFILE_ROWS:
+                for column, value in zip(profile_columns, map(row.get, profile_columns)):
+                    if value:
+                        counted = (column, classify_log_value(value))
+                        type_counts[counted] = type_counts.get(counted, 0) + 1
+                    else:
+                        empty[column] += 1
+            elif not all(map(row.get, profile_columns)):  # most rows have no empty value at all
+                for column, value in zip(profile_columns, map(row.get, profile_columns)):
+                    if not value:
+                        empty[column] += 1
+    finally:
+        for f in files.values():
+            f.close()
+
+    if discover:
+        profile_columns = list(filled)
+        empty = {column: rows_read - count for column, count in filled.items()}
+    profiles = {column: {'empty': empty[column], 'types': {}} for column in profile_columns}
+    for (column, value_type), count in type_counts.items():
+        profiles[column]['types'][value_type] = count
+    return {'rows': rows_read, 'headers': profile_columns, 'distinct_keys': log_hll_count(key_sketch),
+            'columns': profiles}
+
+
+def split_log_partition(path, depth, num_partitions):
+    """
+    Split a partition file into num_partitions files (<name>-<index>.tsv next to it) by a hash
+    of the key seeded with `depth`, so its rows spread out instead of following the split that
+    grouped them. Returns the paths of the parts; empty parts are not created.
+    """
+    base = path[:-len('.tsv')]
+    paths = [f"{base}-{index}.tsv" for index in range(num_partitions)]
+    if not os.path.exists(path):
+        return paths
+    person = str(depth).encode()
+    files = {}
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                key = line[:line.index(b'\t')]
+                digest = hashlib.blake2b(key, digest_size=8, person=person).digest()
+                index = int.from_bytes(digest, 'little') % num_partitions
+                if index not in files:
+                    files[index] = open(paths[index], 'wb')
+                files[index].write(line)
+    finally:
+        for part in files.values():
+            part.close()
+    return paths
+
+
+def load_log_partition(path):
+    """
+    Load one partition into an ordered key JSON -> (digest, row JSON) dict of raw bytes
+    (later duplicates win, like Map.set). Rows are only decoded when they need a field diff.
+    Every row of a key lands in the same partition, so duplicate keys are counted exactly here.
+    Returns (rows, duplicate_count).
+    """
+    rows = {}
+    lines = 0
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                key, digest, row = line.rstrip(b'\n').split(b'\t', 2)
+                rows[key] = (digest, row)
+                lines += 1
+    return rows, lines - len(rows)
+
+
+def log_raw_record(key, row):
+    """Encode a {key, row} result line from the raw JSON of a partition entry"""
+    return b'{"key":' + key + b',"row":' + row + b'}\n'
+
+
+def parse_log_number(value):
+    """Parse a numeric log value, or None if it isn't a finite number"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_log_timestamp(value):
+    """Parse an ISO-style timestamp value, or None"""
+    if not value or not LOG_TIMESTAMP_PATTERN.match(value):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    # Treat naive timestamps as UTC so they can be compared with aware ones
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def format_js_number(number):
+    """Render a float the way JavaScript prints numbers (10.0 -> '10')"""
+    if number == int(number) and abs(number) < 1e21:
+        return str(int(number))
+    return repr(number)
+
+
+def find_log_changes(old_row, new_row, columns=None):
+    """
+    Per-column changes between two rows with numeric and timestamp awareness, like findChanges().
+    Only `columns` are compared when given; otherwise every column of either row.
+    """
+    changes = []
+    if columns is None:
+        columns = list(old_row) + [column for column in new_row if column not in old_row]
+
+    for column in columns:
+        old_value = old_row.get(column) or ''
+        new_value = new_row.get(column) or ''
+        if old_value.strip() == new_value.strip():
+            continue
+
+        change_type = 'modified'
+        change_detail = ''
+
+        # Numeric change detection
+        old_number = parse_log_number(old_value) if old_value else None
+        new_number = parse_log_number(new_value) if new_value else None
+        if old_number is not None and new_number is not None:
+            diff = new_number - old_number
+            percent_change = f"{diff / old_number * 100:.2f}" if old_number != 0 else 'N/A'
+            if diff > 0:
+                change_type = 'increased'
+                change_detail = f"+{format_js_number(diff)} (+{percent_change}%)"
+            elif diff < 0:
+                change_type = 'decreased'
+                change_detail = f"{format_js_number(diff)} ({percent_change}%)"
+
+        # Date/timestamp change detection
+        old_time = parse_log_timestamp(old_value)
+        new_time = parse_log_timestamp(new_value)
+        if old_time and new_time:
+            hours_diff = f"{(new_time - old_time).total_seconds() / 3600:.2f}"
+            if abs(float(hours_diff)) > 0.1:
+                change_type = 'time_shifted'
+                change_detail = f"{'+' if float(hours_diff) > 0 else ''}{hours_diff} hours"
+
+        changes.append({
+            'column': column,
+            'oldValue': old_value,
+            'newValue': new_value,
+            'changeType': change_type,
+            'changeDetail': change_detail
+        })
+
+    return changes
+
+
+def levenshtein_distance(a, b):
+    """Levenshtein distance using Myers' bit-parallel algorithm (one big-int pass over the longer string)"""
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+
+    peq = {}
+    for i, char in enumerate(b):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for char in a:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def log_string_similarity(a, b):
+    """Case-insensitive Levenshtein similarity, like calculateStringSimilarity()"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    a, b = a.lower(), b.lower()
+    return 1 - levenshtein_distance(a, b) / max(len(a), len(b))
+
+
+def log_row_similarity(old_row, new_row, columns, minimum=0.0):
+    """
+    Average column similarity over columns present in both rows, like calculateRowSimilarity().
+    Scoring stops early, returning 0.0, once minimum can no longer be reached.
+    """
+    shared = [column for column in columns if column in old_row and column in new_row]
+    if not shared:
+        return 0.0
+
+    # Each column loses (1 - similarity); once the losses exceed the slack, minimum is out of reach
+    slack = len(shared) * (1 - minimum) + 1e-9
+    total = 0.0
+    for column in shared:
+        old_value, new_value = old_row[column], new_row[column]
+        longest = max(len(old_value), len(new_value))
+        # Cheap bound first: the length difference alone costs at least this much
+        if longest and abs(len(old_value) - len(new_value)) / longest > slack:
+            return 0.0
+        similarity = log_string_similarity(old_value, new_value)
+        total += similarity
+        slack -= 1 - similarity
+        if slack < 0:
+            return 0.0
+    return total / len(shared)
+
+
+def log_blocking_keys(row, columns):
+    """
+    Blocking keys of a row: the bottom-k q-gram hashes of each column value. CRC-32 seeded with
+    the column index rather than hash(), which is salted per process, keeps the keys and so the
+    matches identical across runs and processes.
+    """
+    keys = []
+    q = LOG_FUZZY_QGRAM
+    for index, column in enumerate(columns):
+        value = row.get(column)
+        if not value:
+            continue
+        value = value.lower()[:LOG_FUZZY_MAX_VALUE_CHARS]
+        grams = {value[i:i + q] for i in range(len(value) - q + 1)} or {value}
+        hashes = (zlib.crc32(gram.encode('utf-8', 'surrogatepass'), index) for gram in grams)
+        keys.extend(heapq.nsmallest(LOG_FUZZY_SKETCH_SIZE, hashes))
+    return keys
+
+
+def fuzzy_match_log_records(old_records, new_records, columns, threshold=LOG_FUZZY_THRESHOLD, read_new_record=None):
+    """
+    Match unmatched original rows to unmatched new rows by row similarity.
+    Candidates come from a blocking-key index over new_records and only the best
+    LOG_FUZZY_MAX_CANDIDATES of them are scored exactly, so the cost is near-linear
+    instead of O(n*m). Each new row is matched at most once; original rows are matched
+    greedily in order, like the browser.
+
+    new_records is iterated once to build the index, which holds row positions only; rows
+    are fetched again with read_new_record(position) (default: new_records[position]).
+
+    Yields ('fuzzy_matched', old, new, similarity), ('removed', old, None, 0) and finally
+    ('added', None, new, 0) for new rows left unmatched.
+    """
+    read_new_record = read_new_record or new_records.__getitem__
+    index = {}
+    new_count = 0
+    for position, record in enumerate(new_records):
+        for key in log_blocking_keys(record['row'], columns):
+            index.setdefault(key, []).append(position)
+        new_count += 1
+
+    matched = set()
+    for old_record in old_records:
+        # Probe the most selective keys first; common keys add cost but little signal
+        probes = [postings for postings in (index.get(key) for key in log_blocking_keys(old_record['row'], columns))
+                  if postings and len(postings) <= LOG_FUZZY_MAX_POSTINGS]
+        probes.sort(key=len)
+
+        hits = {}
+        for postings in probes[:LOG_FUZZY_PROBE_KEYS]:
+            for position in postings:
+                if position not in matched:
+                    hits[position] = hits.get(position, 0) + 1
+
+        best_record, best_position, best_similarity = None, None, 0.0
+        for position, _ in heapq.nlargest(LOG_FUZZY_MAX_CANDIDATES, hits.items(), key=lambda item: (item[1], -item[0])):
+            record = read_new_record(position)
+            similarity = log_row_similarity(old_record['row'], record['row'], columns, max(threshold, best_similarity))
+            if similarity >= threshold and similarity > best_similarity:
+                best_record, best_position, best_similarity = record, position, similarity
+
+        if best_position is None:
+            yield 'removed', old_record, None, 0
+        else:
+            matched.add(best_position)
+            yield 'fuzzy_matched', old_record, best_record, best_similarity
+
+    for position in range(new_count):
+        if position not in matched:
+            yield 'added', None, read_new_record(position), 0
+
+
+def read_ndjson_records(path):
+    """Iterate JSON records of an NDJSON spill file"""
+    with open(path, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def run_log_fuzzy_stage(unmatched_old_path, unmatched_new_path, columns, writers, column_changes):
+    """
+    Fuzzy-match the rows left unmatched by key and write the final removed/added/fuzzy results.
+    Both spill files stay on disk: original rows are streamed, and new rows are indexed by
+    byte offset and read back only when they are scored as candidates or written out.
+    """
+    offsets = array('q')
+    with open(unmatched_new_path, 'rb') as new_file:
+        def iter_new_records():
+            offset = 0
+            for line in new_file:
+                offsets.append(offset)
+                offset += len(line)
+                yield json.loads(line)
+
+        def read_new_record(position):
+            new_file.seek(offsets[position])
+            return json.loads(new_file.readline())
+
+        for outcome, old_record, new_record, similarity in fuzzy_match_log_records(
+                read_ndjson_records(unmatched_old_path), iter_new_records(), columns,
+                read_new_record=read_new_record):
+            if outcome == 'fuzzy_matched':
+                changes = find_log_changes(old_record['row'], new_record['row'], columns)
+                tally_log_column_changes(column_changes, changes)
+                write_log_result(writers, 'fuzzy_matched', {
+                    'key': old_record['key'],
+                    'new_key': new_record['key'],
+                    'old': old_record['row'],
+                    'new': new_record['row'],
+                    'changes': changes,
+                    'similarity': similarity
+                })
+            elif outcome == 'removed':
+                write_log_result(writers, 'removed', old_record)
+            else:
+                write_log_result(writers, 'added', new_record)
+
+
+def open_log_result_writers(result_dir, segment):
+    """Open one NDJSON result segment file per change type"""
+    return {
+        change_type: {
+            'file': open(os.path.join(result_dir, f"{change_type}-{segment}.ndjson"), 'wb'),
+            'count': 0,
+            'offsets': []
+        }
+        for change_type in LOG_COMPARE_CHANGE_TYPES
+    }
+
+
+def write_log_result(writers, change_type, record):
+    """Append a record to a result file"""
+    append_log_result_line(writers, change_type, json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+
+
+def append_log_result_line(writers, change_type, line):
+    """Append an encoded NDJSON line, indexing its offset every LOG_RESULT_INDEX_STRIDE records"""
+    writer = writers[change_type]
+    if writer['count'] % LOG_RESULT_INDEX_STRIDE == 0:
+        writer['offsets'].append(writer['file'].tell())
+    writer['file'].write(line)
+    writer['count'] += 1
+
+
+def close_log_result_writers(writers):
+    """Close result segment files and return {change_type: {'count': n, 'offsets': [...]}}"""
+    segments = {}
+    for change_type, writer in writers.items():
+        writer['file'].close()
+        segments[change_type] = {'count': writer['count'], 'offsets': writer['offsets']}
+    return segments
+
+
+def write_log_result_manifests(result_dir, segments):
+    """
+    Record the result segments of each change type, given (segment, close_log_result_writers()
+    output) pairs in result order, in <change_type>.idx. Empty segment files are deleted.
+    Returns the counts per change type.
+    """
+    counts = {}
+    for change_type in LOG_COMPARE_CHANGE_TYPES:
+        manifest = []
+        for segment, stats in segments:
+            file_name = f"{change_type}-{segment}.ndjson"
+            if stats[change_type]['count']:
+                manifest.append(dict(stats[change_type], file=file_name))
+            else:
+                os.remove(os.path.join(result_dir, file_name))
+        write_json_atomic(os.path.join(result_dir, f"{change_type}.idx"), manifest)
+        counts[change_type] = sum(entry['count'] for entry in manifest)
+    return counts
+
+
+def load_log_result_segments(result_dir, change_type):
+    """
+    The result segments of one change type, in order, as {'file', 'count', 'offsets'} dicts.
+    Result sets stored before results were segmented have a single file per change type,
+    indexed by a plain offset list, and no count.
+    """
+    with open(os.path.join(result_dir, f"{change_type}.idx")) as f:
+        segments = json.load(f)
+    if segments and not isinstance(segments[0], dict):
+        return [{'file': f"{change_type}.ndjson", 'count': None, 'offsets': segments}]
+    return segments
+
+
+def tally_log_column_changes(column_changes, changes):
+    """
+    Count per-column changes and change types of one modified record, as detectPatterns() does,
+    and accumulate the numeric deltas (count, sum, min, max) of increased/decreased values
+    """
+    for change in changes:
+        stats = column_changes.setdefault(change['column'], {'count': 0, 'change_types': {}})
+        stats['count'] += 1
+        change_type = change.get('changeType') or 'modified'
+        stats['change_types'][change_type] = stats['change_types'].get(change_type, 0) + 1
+        if change_type in ('increased', 'decreased'):
+            delta = float(change['newValue']) - float(change['oldValue'])
+            deltas = stats.get('numeric_delta')
+            if deltas is None:
+                stats['numeric_delta'] = {'count': 1, 'sum': delta, 'min': delta, 'max': delta}
+            else:
+                deltas['count'] += 1
+                deltas['sum'] += delta
+                deltas['min'] = min(deltas['min'], delta)
+                deltas['max'] = max(deltas['max'], delta)
+
+
+def merge_log_column_changes(total, part):
+    """Merge the column-change statistics of one partition into the running total"""
+    for column, stats in part.items():
+        merged = total.setdefault(column, {'count': 0, 'change_types': {}})
+        merged['count'] += stats['count']
+        for change_type, count in stats['change_types'].items():
+            merged['change_types'][change_type] = merged['change_types'].get(change_type, 0) + count
+        deltas = stats.get('numeric_delta')
+        if deltas:
+            merged_deltas = merged.get('numeric_delta')
+            if merged_deltas is None:
+                merged['numeric_delta'] = dict(deltas)
+            else:
+                merged_deltas['count'] += deltas['count']
+                merged_deltas['sum'] += deltas['sum']
+                merged_deltas['min'] = min(merged_deltas['min'], deltas['min'])
+                merged_deltas['max'] = max(merged_deltas['max'], deltas['max'])
+
+
+def diff_log_partition(old_path, new_path, writers, columns, unmatched=None, column_changes=None,
+                       duplicates=None, depth=0):
+    """
+    Diff one partition pair over `columns`, writing added/removed/modified/unchanged records.
+    Rows whose digests match are unchanged and copied through as raw JSON; only rows with
+    differing digests are decoded and go through find_log_changes().
+    With fuzzy matching, rows without a key match go to the unmatched spill files instead.
+    Duplicate keys of each side are added to `duplicates` ({'original': n, 'new': n}) if given.
+
+    A pair is loaded whole, so one past LOG_COMPARE_SPLIT_BYTES (inputs beyond
+    LOG_COMPARE_MAX_PARTITIONS partitions, or gzip compressing better than assumed) is split
+    again with a differently seeded hash and its parts are diffed one after another.
+    """
+    size = sum(os.path.getsize(path) for path in (old_path, new_path) if os.path.exists(path))
+    if size > LOG_COMPARE_SPLIT_BYTES and depth < LOG_COMPARE_MAX_SPLIT_DEPTH:
+        num_parts = min(math.ceil(size / LOG_COMPARE_PARTITION_BYTES), LOG_COMPARE_MAX_PARTITIONS)
+        parts = zip(split_log_partition(old_path, depth + 1, num_parts),
+                    split_log_partition(new_path, depth + 1, num_parts))
+        for old_part, new_part in parts:
+            try:
+                diff_log_partition(old_part, new_part, writers, columns, unmatched, column_changes,
+                                   duplicates, depth + 1)
+            finally:
+                for path in (old_part, new_part):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return
+
+    old_rows, old_duplicates = load_log_partition(old_path)
+    new_rows, new_duplicates = load_log_partition(new_path)
+    if duplicates is not None:
+        duplicates['original'] += old_duplicates
+        duplicates['new'] += new_duplicates
+
+    for key, (digest, row) in old_rows.items():
+        new_entry = new_rows.pop(key, None)
+        if new_entry is None:
+            if unmatched:
+                unmatched['old'].write(log_raw_record(key, row))
+            else:
+                append_log_result_line(writers, 'removed', log_raw_record(key, row))
+            continue
+
+        new_digest, new_row = new_entry
+        if new_digest == digest:
+            append_log_result_line(writers, 'unchanged', log_raw_record(key, row))
+            continue
+
+        old_row, new_row = json.loads(row), json.loads(new_row)
+        changes = find_log_changes(old_row, new_row, columns)
+        if changes:
+            if column_changes is not None:
+                tally_log_column_changes(column_changes, changes)
+            write_log_result(writers, 'modified', {'key': json.loads(key), 'old': old_row, 'new': new_row,
+                                                   'changes': changes})
+        else:
+            append_log_result_line(writers, 'unchanged', log_raw_record(key, row))
+
+    for key, (_, row) in new_rows.items():
+        if unmatched:
+            unmatched['new'].write(log_raw_record(key, row))
+        else:
+            append_log_result_line(writers, 'added', log_raw_record(key, row))
+
+
+def diff_log_partition_job(partition_dir, result_dir, index, columns, fuzzy):
+    """
+    Diff partition pair `index` straight into its final result segment files (<type>-<index>.ndjson).
+    Runs in a worker process; the caller only records the segments, in partition order.
+    With fuzzy matching, unmatched rows are spilled to unmatched-<side>-<index>.ndjson.
+    Returns the partition's statistics: {'segments': ..., 'column_changes': ..., 'duplicates': ...}.
+    """
+    old_path = os.path.join(partition_dir, f"old-{index}.tsv")
+    new_path = os.path.join(partition_dir, f"new-{index}.tsv")
+
+    # Files left by a run interrupted mid-partition are overwritten; that partition starts over
+    writers = open_log_result_writers(result_dir, index)
+    unmatched = None
+    if fuzzy:
+        unmatched = {
+            side: open(os.path.join(partition_dir, f"unmatched-{side}-{index}.ndjson"), 'wb')
+            for side in ('old', 'new')
+        }
+    column_changes = {}
+    duplicates = {'original': 0, 'new': 0}
+    try:
+        diff_log_partition(old_path, new_path, writers, columns, unmatched, column_changes, duplicates)
+    finally:
+        segments = close_log_result_writers(writers)
+        for f in (unmatched or {}).values():
+            f.close()
+    return {'segments': segments, 'column_changes': column_changes, 'duplicates': duplicates}
+
+
+def merge_log_unmatched_spills(partition_dir, num_partitions):
+    """Concatenate the unmatched spill files of every partition into unmatched-<side>.ndjson"""
+    for side in ('old', 'new'):
+        with open(os.path.join(partition_dir, f"unmatched-{side}.ndjson"), 'wb') as spill:
+            for index in range(num_partitions):
+                with open(os.path.join(partition_dir, f"unmatched-{side}-{index}.ndjson"), 'rb') as f:
+                    shutil.copyfileobj(f, spill)
+
+
+def public_log_comparison_summary(summary):
+    """A summary as returned to clients, without which users have access to it"""
+    return {field: value for field, value in summary.items() if field not in ('user_id', 'user_ids')}
+
+
+def log_result_dir(comparison_id):
+    return os.path.join(LOG_COMPARE_DIR, 'results', comparison_id)
+
+
+def cleanup_log_compare_results():
+    """Delete result sets, finished jobs and stored uploads older than LOG_COMPARE_RESULT_TTL_HOURS"""
+    cutoff = time.time() - LOG_COMPARE_RESULT_TTL_HOURS * 3600
+    for root in ('results', 'jobs', 'uploads'):
+        root_dir = os.path.join(LOG_COMPARE_DIR, root)
+        if not os.path.isdir(root_dir):
+            continue
+        for comparison_id in os.listdir(root_dir):
+            path = os.path.join(root_dir, comparison_id)
+            if root == 'jobs':
+                job = load_log_compare_job(comparison_id)
+                if job and job['status'] not in LOG_COMPARE_JOB_FINISHED:
+                    continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+            except OSError:
+                continue
+
+
+def log_partition_dir(comparison_id):
+    return os.path.join(LOG_COMPARE_DIR, 'partitions', comparison_id)
+
+
+def write_json_atomic(path, data):
+    """Write a JSON file via rename so readers and resumed runs never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def try_lock_file(path):
+    """
+    Take an exclusive flock on `path`, held for as long as the returned file stays open.
+    Returns None if it is held elsewhere, in this process or another one.
+    """
+    try:
+        lock_file = open(path, 'a')
+    except OSError:
+        return None
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def load_log_checkpoint(partition_dir):
+    """Load the partition-level checkpoint of an interrupted comparison, if there is one"""
+    try:
+        with open(os.path.join(partition_dir, 'checkpoint.json')) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # JSON object keys are strings; partitions are tracked by index
+    checkpoint['done'] = {int(index): stats for index, stats in checkpoint['done'].items()}
+    return checkpoint
+
+
+def build_log_insights(counts, column_changes, profiles, duplicates, old_headers, new_headers):
+    """
+    Insights of a comparison in the shape generateIntelligentInsights() builds in the browser.
+    Everything comes from the accumulators filled while partitioning and diffing (column
+    profiles, duplicate counts, column-change tallies), so no result or input row is read again.
+    """
+    insights = {'summary': '', 'patterns': [], 'dataQuality': [], 'recommendations': [], 'statistics': {}}
+    total_rows = profiles['original']['rows']
+    changed = counts['added'] + counts['removed'] + counts['modified']
+    change_percentage = f"{changed / total_rows * 100:.1f}" if total_rows else '0.0'
+    insights['summary'] = f"Compared {total_rows} records. {change_percentage}% of data changed."
+
+    # Patterns (detectPatterns)
+    all_modified = counts['modified'] + counts['fuzzy_matched']
+    if all_modified:
+        for column, stats in column_changes.items():
+            change_rate = stats['count'] / all_modified * 100
+            if change_rate <= 50:
+                continue
+            change_types = list(stats['change_types'])
+            if len(change_types) == 1 and change_types[0] != 'modified':
+                insights['patterns'].append({
+                    'type': 'consistent_pattern',
+                    'description': f'Column "{column}" consistently {change_types[0]} across '
+                                   f'{change_rate:.1f}% of modified records',
+                    'severity': 'info'
+                })
+            elif change_rate > 80:
+                insights['patterns'].append({
+                    'type': 'frequent_change',
+                    'description': f'Column "{column}" changed in {change_rate:.1f}% of modified records',
+                    'severity': 'warning'
+                })
+
+        if counts['added'] > all_modified * 2:
+            insights['patterns'].append({
+                'type': 'bulk_insert',
+                'description': f"Large number of records added ({counts['added']}) - possible bulk insert operation",
+                'severity': 'info'
+            })
+        if counts['removed'] > all_modified * 2:
+            insights['patterns'].append({
+                'type': 'bulk_delete',
+                'description': f"Large number of records removed ({counts['removed']}) - possible bulk delete operation",
+                'severity': 'warning'
+            })
+
+    removed_headers = [header for header in old_headers if header not in new_headers]
+    added_headers = [header for header in new_headers if header not in old_headers]
+    possible_renames = []
+    for old_header in removed_headers:
+        for new_header in added_headers:
+            similarity = log_string_similarity(old_header, new_header)
+            if similarity > 0.7:
+                possible_renames.append(f'"{old_header}" → "{new_header}" ({similarity * 100:.0f}% similar)')
+    if possible_renames:
+        insights['patterns'].append({
+            'type': 'field_rename',
+            'description': f"Possible field rename detected: {', '.join(possible_renames)}",
+            'severity': 'info'
+        })
+
+    # Data quality (analyzeDataQuality)
+    labels = {'original': 'original data', 'new': 'new data'}
+    for side, label in labels.items():
+        if duplicates[side]:
+            insights['dataQuality'].append({
+                'type': 'duplicates',
+                'description': f"Found {duplicates[side]} duplicate key values in {label}",
+                'severity': 'error'
+            })
+    for side, label in labels.items():
+        rows = profiles[side]['rows']
+        null_rates = [
+            f"{column} ({profile['empty'] / rows * 100:.1f}%)"
+            for column, profile in profiles[side]['columns'].items()
+            if rows and profile['empty'] > rows * LOG_NULL_RATE_THRESHOLD
+        ]
+        if null_rates:
+            insights['dataQuality'].append({
+                'type': 'null_values',
+                'description': f"High null/empty rates in {label}: {', '.join(null_rates)}",
+                'severity': 'warning'
+            })
+    new_columns = profiles['new']['columns']
+    for column, profile in profiles['original']['columns'].items():
+        if column not in new_columns:
+            continue
+        old_types, new_types = list(profile['types']), list(new_columns[column]['types'])
+        if len(old_types) == 1 and len(new_types) == 1 and old_types != new_types:
+            insights['dataQuality'].append({
+                'type': 'type_mismatch',
+                'description': f'Data type changed for column "{column}": {old_types[0]} → {new_types[0]}',
+                'severity': 'warning'
+            })
+
+    # Recommendations (generateRecommendations)
+    if counts['added'] > counts['removed'] * 2:
+        insights['recommendations'].append({
+            'type': 'data_growth',
+            'message': 'Significant data growth detected. Consider reviewing storage and indexing strategies.',
+            'action': 'Review database capacity planning'
+        })
+    if counts['removed'] > counts['added'] * 2:
+        insights['recommendations'].append({
+            'type': 'data_reduction',
+            'message': 'Significant data reduction detected. Verify this is intentional.',
+            'action': 'Confirm data retention policies'
+        })
+    if any(pattern['type'] == 'field_rename' for pattern in insights['patterns']):
+        insights['recommendations'].append({
+            'type': 'schema_change',
+            'message': 'Schema changes detected. Update documentation and client code.',
+            'action': 'Document schema changes and notify dependent systems'
+        })
+    if any(quality['severity'] == 'error' for quality in insights['dataQuality']):
+        insights['recommendations'].append({
+            'type': 'data_quality',
+            'message': 'Critical data quality issues found. Address before deployment.',
+            'action': 'Run data validation and cleanup processes'
+        })
+    if counts['fuzzy_matched']:
+        insights['recommendations'].append({
+            'type': 'fuzzy_matches',
+            'message': f"{counts['fuzzy_matched']} records matched using fuzzy matching. Review for accuracy.",
+            'action': 'Verify fuzzy-matched records manually'
+        })
+
+    column_stats = {}
+    for side in ('original', 'new'):
+        for column, profile in profiles[side]['columns'].items():
+            column_stats.setdefault(column, {})[side] = profile
+    for column, stats in column_changes.items():
+        if 'numeric_delta' in stats:
+            deltas = stats['numeric_delta']
+            column_stats.setdefault(column, {})['numericDelta'] = dict(deltas, mean=deltas['sum'] / deltas['count'])
+
+    insights['statistics'] = {
+        'totalRecords': total_rows,
+        'changePercentage': change_percentage,
+        'addedCount': counts['added'],
+        'removedCount': counts['removed'],
+        'modifiedCount': counts['modified'],
+        'unchangedCount': counts['unchanged'],
+        'fuzzyMatchedCount': counts['fuzzy_matched'],
+        'distinctKeys': {side: profile['distinct_keys'] for side, profile in profiles.items()},
+        'duplicateKeys': duplicates,
+        'columns': column_stats
+    }
+    return insights
+
+
+def check_log_compare_columns(columns, headers):
+    missing = [column for column in columns if column not in headers]
+    if missing:
+        raise ValueError(f"Comparison columns not found: {', '.join(missing)}")
+
+
+def run_log_comparison(user_id, old_path, new_path, key_column='auto', fuzzy=False, columns=None,
+                       comparison_id=None, progress=None):
+    """
+    Compare two log exports on disk and store the result set.
+    `columns` limits the comparison to those headers (default: every column of either file).
+
+    Progress is checkpointed per partition in checkpoint.json, so calling this again with the
+    same comparison_id after an interruption skips the partitioning and every partition pair
+    that was already diffed. `progress`, if given, is called with a dict after each stage
+    and partition.
+
+    Returns the comparison summary (also saved as summary.json next to the results).
+    """
+    started = time.time()
+    comparison_id = comparison_id or uuid.uuid4().hex
+    result_dir = log_result_dir(comparison_id)
+    partition_dir = log_partition_dir(comparison_id)
+    os.makedirs(result_dir, exist_ok=True)
+    os.makedirs(partition_dir, exist_ok=True)
+    checkpoint_path = os.path.join(partition_dir, 'checkpoint.json')
+
+    def report(stage, checkpoint=None, eta_seconds=None):
+        if progress:
+            progress({
+                'stage': stage,
+                'rows_read': checkpoint['rows_read'] if checkpoint else None,
+                'partitions_done': len(checkpoint['done']) if checkpoint else 0,
+                'partitions_total': checkpoint['partitions'] if checkpoint else None,
+                'eta_seconds': eta_seconds
+            })
+
+    try:
+        checkpoint = load_log_checkpoint(partition_dir)
+        if checkpoint is None:
+            report('partitioning')
+            old_format, new_format = detect_log_format(old_path), detect_log_format(new_path)
+            old_headers = read_log_headers(old_path, old_format)
+            new_headers = read_log_headers(new_path, new_format)
+            key_column = resolve_log_key_column(key_column, old_headers, old_path, old_format)
+            num_partitions = choose_log_partition_count(old_path, new_path)
+            # NDJSON fields are only all known after the partitioning pass, which collects them;
+            # until then rows are digested over their own non-empty fields
+            csv_only = old_format[0] == 'csv' and new_format[0] == 'csv'
+            if columns and csv_only:
+                check_log_compare_columns(columns, old_headers + new_headers)
+            if columns:
+                digest_columns = list(columns)
+            elif csv_only:
+                digest_columns = old_headers + [header for header in new_headers if header not in old_headers]
+            else:
+                digest_columns = None
+
+            partition_args = [
+                (old_path, key_column, partition_dir, 'old', num_partitions, digest_columns,
+                 old_headers if old_format[0] == 'csv' else None, old_format),
+                (new_path, key_column, partition_dir, 'new', num_partitions, digest_columns,
+                 new_headers if new_format[0] == 'csv' else None, new_format),
+            ]
+            profiles = dict(zip(('original', 'new'), map_process_pool(
+                partition_log_file, partition_args, min(LOG_COMPARE_WORKERS, 2))))
+            old_headers = profiles['original'].pop('headers')
+            new_headers = profiles['new'].pop('headers')
+            headers = old_headers + [header for header in new_headers if header not in old_headers]
+            if columns:
+                check_log_compare_columns(columns, headers)
+            compare_columns = list(columns) if columns else headers
+            rows_read = {side: profile['rows'] for side, profile in profiles.items()}
+
+            checkpoint = {
+                'key_column': key_column,
+                'headers': headers,
+                'compare_columns': compare_columns,
+                'original_headers': old_headers,
+                'new_headers': new_headers,
+                'rows_read': rows_read,
+                'profiles': profiles,
+                'partitions': num_partitions,
+                'done': {}
+            }
+            write_json_atomic(checkpoint_path, checkpoint)
+        else:
+            log(f"Resuming log comparison {comparison_id}: "
+                f"{len(checkpoint['done'])}/{checkpoint['partitions']} partitions already diffed")
+
+        num_partitions = checkpoint['partitions']
+        compare_columns = checkpoint['compare_columns']
+        report('diffing', checkpoint)
+
+        # Partition pairs are independent, so they are diffed in the worker pool; each writes its
+        # own result segments, which are recorded in partition order (results stay deterministic)
+        workers = max(1, min(LOG_COMPARE_WORKERS, num_partitions))
+        remaining = [index for index in range(num_partitions) if index not in checkpoint['done']]
+        diff_started = time.time()
+        partition_stats = map_process_pool(diff_log_partition_job,
+                                           [(partition_dir, result_dir, index, compare_columns, fuzzy)
+                                            for index in remaining], workers)
+        for finished, (index, stats) in enumerate(zip(remaining, partition_stats), 1):
+            checkpoint['done'][index] = stats
+            write_json_atomic(checkpoint_path, checkpoint)
+            # The input partitions aren't needed any more; free the disk as early as possible
+            for side in ('old', 'new'):
+                path = os.path.join(partition_dir, f"{side}-{index}.tsv")
+                if os.path.exists(path):
+                    os.remove(path)
+            eta_seconds = (time.time() - diff_started) / finished * (len(remaining) - finished)
+            report('diffing', checkpoint, round(eta_seconds, 1))
+
+        report('merging', checkpoint)
+        column_changes = {}
+        duplicates = {'original': 0, 'new': 0}
+        segments = []
+        for index in range(num_partitions):
+            stats = checkpoint['done'][index]
+            segments.append((index, stats['segments']))
+            merge_log_column_changes(column_changes, stats['column_changes'])
+            for side, count in stats['duplicates'].items():
+                duplicates[side] += count
+
+        if fuzzy:
+            report('fuzzy_matching', checkpoint)
+            merge_log_unmatched_spills(partition_dir, num_partitions)
+            writers = open_log_result_writers(result_dir, 'fuzzy')
+            try:
+                run_log_fuzzy_stage(os.path.join(partition_dir, "unmatched-old.ndjson"),
+                                    os.path.join(partition_dir, "unmatched-new.ndjson"), compare_columns, writers,
+                                    column_changes)
+            finally:
+                segments.append(('fuzzy', close_log_result_writers(writers)))
+        counts = write_log_result_manifests(result_dir, segments)
+
+        report('indexing', checkpoint)
+        build_log_result_index(result_dir)
+
+        summary = {
+            'comparison_id': comparison_id,
+            'user_id': user_id,
+            'user_ids': [user_id],
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'key_column': checkpoint['key_column'],
+            'fuzzy': fuzzy,
+            'headers': checkpoint['headers'],
+            'compare_columns': compare_columns,
+            'original_headers': checkpoint['original_headers'],
+            'new_headers': checkpoint['new_headers'],
+            'rows_read': checkpoint['rows_read'],
+            'partitions': num_partitions,
+            'workers': workers,
+            'counts': counts,
+            'column_changes': column_changes,
+            'insights': build_log_insights(counts, column_changes, checkpoint['profiles'], duplicates,
+                                           checkpoint['original_headers'], checkpoint['new_headers']),
+            'elapsed_ms': int((time.time() - started) * 1000)
+        }
+        write_json_atomic(os.path.join(result_dir, 'summary.json'), summary)
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        return summary
+    except Exception:
+        shutil.rmtree(result_dir, ignore_errors=True)
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        raise
+
+
+def load_log_comparison_summary(comparison_id, user_id=None):
+    """
+    Load a stored comparison summary if it exists and, with user_id, if the user may read it
+    (the user who ran it, or users served the same comparison from the cache)
+    """
+    if not COMPARISON_ID_PATTERN.match(comparison_id):
+        return None
+    try:
+        with open(os.path.join(log_result_dir(comparison_id), 'summary.json')) as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if user_id is not None and user_id not in summary.get('user_ids', [summary.get('user_id')]):
+        return None
+    return summary
+
+
+def iter_log_results(comparison_id, change_type, offset=0):
+    """Iterate stored result records of one change type, starting at offset"""
+    result_dir = log_result_dir(comparison_id)
+    for segment in load_log_result_segments(result_dir, change_type):
+        if segment['count'] is not None and offset >= segment['count']:
+            offset -= segment['count']
+            continue
+        checkpoint = offset // LOG_RESULT_INDEX_STRIDE
+        if checkpoint >= len(segment['offsets']):
+            return
+        with open(os.path.join(result_dir, segment['file']), 'rb') as f:
+            f.seek(segment['offsets'][checkpoint])
+            for _ in range(offset - checkpoint * LOG_RESULT_INDEX_STRIDE):
+                f.readline()
+            for line in f:
+                yield line
+        offset = 0
+
+
+def build_log_result_index(result_dir):
+    """
+    Index a result set into results.db (SQLite) for filtered, sorted and keyset-paged queries.
+    The records stay in the NDJSON segment files; the index holds the sort fields, the changed
+    columns and each record's segment (its position in the change type's manifest) and byte offset.
+    """
+    db_path = os.path.join(result_dir, 'results.db')
+    tmp_path = f"{db_path}.{uuid.uuid4().hex}.tmp"
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute("""
+            CREATE TABLE results (
+                id INTEGER PRIMARY KEY,
+                change_type TEXT NOT NULL,
+                key TEXT NOT NULL,
+                change_count INTEGER NOT NULL,
+                similarity REAL NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL
+            )
+        """)
+        db.execute("CREATE TABLE changed_columns (result_id INTEGER NOT NULL, column_name TEXT NOT NULL)")
+
+        decoder = json.JSONDecoder()
+        result_id = 0
+        rows, changed = [], []
+        for change_type in LOG_COMPARE_CHANGE_TYPES:
+            for segment, entry in enumerate(load_log_result_segments(result_dir, change_type)):
+                with open(os.path.join(result_dir, entry['file']), 'rb') as f:
+                    offset = 0
+                    for line in f:
+                        result_id += 1
+                        if change_type in ('modified', 'fuzzy_matched'):
+                            record = json.loads(line)
+                            changes = record['changes']
+                            rows.append((result_id, change_type, record['key'], len(changes),
+                                         record.get('similarity', 0.0), segment, offset))
+                            changed.extend((result_id, change['column']) for change in changes)
+                        else:
+                            # Every record starts with {"key":...; decode only that
+                            key = decoder.raw_decode(line.decode('utf-8'), 7)[0]
+                            rows.append((result_id, change_type, key, 0, 0.0, segment, offset))
+                        offset += len(line)
+
+                        if len(rows) >= LOG_RESULT_INDEX_BATCH_SIZE:
+                            insert_log_result_index_rows(db, rows, changed)
+                            rows, changed = [], []
+        insert_log_result_index_rows(db, rows, changed)
+
+        db.execute("CREATE INDEX idx_results_type_key ON results (change_type, key, id)")
+        db.execute("CREATE INDEX idx_results_key ON results (key, id)")
+        db.execute("CREATE INDEX idx_results_changes ON results (change_count, id)")
+        db.execute("CREATE INDEX idx_results_similarity ON results (similarity, id)")
+        db.execute("CREATE INDEX idx_changed_columns ON changed_columns (column_name, result_id)")
+        db.execute(f"PRAGMA user_version = {LOG_RESULT_INDEX_VERSION}")
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, db_path)
+
+
+def insert_log_result_index_rows(db, rows, changed):
+    """Insert a batch of index rows and (result id, changed column) pairs"""
+    db.executemany("INSERT INTO results (id, change_type, key, change_count, similarity, segment, offset) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    db.executemany("INSERT INTO changed_columns (result_id, column_name) VALUES (?, ?)", changed)
+
+
+def open_log_result_index(comparison_id):
+    """Open a result set's query index, (re)building it first for result sets stored without a current one"""
+    result_dir = log_result_dir(comparison_id)
+    db_path = os.path.join(result_dir, 'results.db')
+    if os.path.exists(db_path):
+        db = sqlite3.connect(db_path)
+        if db.execute("PRAGMA user_version").fetchone()[0] == LOG_RESULT_INDEX_VERSION:
+            return db
+        db.close()
+    build_log_result_index(result_dir)
+    return sqlite3.connect(db_path)
+
+
+def encode_log_result_cursor(sort_value, result_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, result_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_log_result_cursor(cursor):
+    try:
+        sort_value, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    return sort_value, result_id
+
+
+def query_log_results(comparison_id, change_types, column=None, sort='position', cursor=None, offset=0,
+                      limit=None):
+    """
+    Query a stored result set. Filters on change types and, optionally, on a changed column;
+    sorts by one of LOG_RESULT_SORTS; pages by keyset cursor (or offset).
+    Returns (total matching, iterator of (cursor, change_type, record)).
+    """
+    descending = sort.startswith('-')
+    sort_column = LOG_RESULT_SORTS.get(sort.lstrip('-'))
+    if sort_column is None:
+        raise ValueError(f"Sort must be one of {', '.join(LOG_RESULT_SORTS)} (prefix '-' for descending)")
+    unknown = [change_type for change_type in change_types if change_type not in LOG_COMPARE_CHANGE_TYPES]
+    if not change_types or unknown:
+        raise ValueError(f"Type must be one of {', '.join(LOG_COMPARE_CHANGE_TYPES)}")
+
+    if cursor:
+        cursor_value, cursor_id = decode_log_result_cursor(cursor)
+
+    where = [f"change_type IN ({', '.join('?' * len(change_types))})"]
+    params = list(change_types)
+    if column:
+        where.append("id IN (SELECT result_id FROM changed_columns WHERE column_name = ?)")
+        params.append(column)
+
+    db = open_log_result_index(comparison_id)
+    total = db.execute(f"SELECT COUNT(*) FROM results WHERE {' AND '.join(where)}", params).fetchone()[0]
+
+    compare = '<' if descending else '>'
+    if cursor:
+        if sort_column == 'id':
+            where.append(f"id {compare} ?")
+            params.append(cursor_id)
+        else:
+            where.append(f"({sort_column} {compare} ? OR ({sort_column} = ? AND id {compare} ?))")
+            params.extend([cursor_value, cursor_value, cursor_id])
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = (f"SELECT id, {sort_column}, change_type, segment, offset FROM results WHERE {' AND '.join(where)} "
+           f"ORDER BY {sort_column} {direction}, id {direction}")
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, 0 if cursor else offset])
+
+    def iterate():
+        result_dir = log_result_dir(comparison_id)
+        segments = {}
+        files = OrderedDict()  # (change_type, segment) -> open file, least recently used first
+        try:
+            for result_id, sort_value, change_type, segment, record_offset in db.execute(sql, params):
+                f = files.pop((change_type, segment), None)
+                if f is None:
+                    if change_type not in segments:
+                        segments[change_type] = load_log_result_segments(result_dir, change_type)
+                    f = open(os.path.join(result_dir, segments[change_type][segment]['file']), 'rb')
+                    if len(files) >= LOG_RESULT_OPEN_FILES:
+                        files.popitem(last=False)[1].close()
+                files[(change_type, segment)] = f
+                f.seek(record_offset)
+                yield encode_log_result_cursor(sort_value, result_id), change_type, json.loads(f.readline())
+        finally:
+            for f in files.values():
+                f.close()
+            db.close()
+
+    return total, iterate()
+
+
+def log_result_csv_row(writer_buffer, writer, change_type, record, headers):
+    """Encode one result record as a CSV line in the layout of exportResults() in the browser"""
+    if change_type in ('modified', 'fuzzy_matched'):
+        changes = {change['column']: change for change in record['changes']}
+        cells = [
+            f"Old: {changes[header]['oldValue']} | New: {changes[header]['newValue']}" if header in changes
+            else record['new'].get(header) or ''
+            for header in headers
+        ]
+        cells.append(', '.join(changes))
+    else:
+        cells = [record['row'].get(header) or '' for header in headers] + ['']
+    writer.writerow([LOG_RESULT_EXPORT_LABELS[change_type]] + cells)
+    line = writer_buffer.getvalue()
+    writer_buffer.seek(0)
+    writer_buffer.truncate()
+    return line
+
+
+# Result cache. Uploads are stored once per content hash, and finished comparisons are
+# cached under (original hash, new hash, key column, options) so re-running the same comparison
+# returns the stored result set. A cache entry only points at a result directory; entries are
+# evicted least recently used first once the cached results exceed LOG_COMPARE_CACHE_MAX_MB.
+log_compare_cache_lock = threading.Lock()
+UPLOAD_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def store_log_upload(file_storage):
+    """Stream an upload to disk while hashing it; returns (sha256, path) in the upload store"""
+    upload_root = os.path.join(LOG_COMPARE_DIR, 'uploads')
+    os.makedirs(upload_root, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(upload_root, f"tmp-{uuid.uuid4().hex}")
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = file_storage.stream.read(UPLOAD_HASH_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        content_hash = digest.hexdigest()
+        path = os.path.join(upload_root, content_hash)
+        # Identical content is stored once; re-uploads just refresh its age
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+        return content_hash, path
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def log_compare_cache_key(old_hash, new_hash, key_column, fuzzy, columns):
+    options = [old_hash, new_hash, key_column or 'auto', bool(fuzzy), list(columns or [])]
+    return hashlib.sha256(json.dumps(options).encode('utf-8')).hexdigest()
+
+
+def log_compare_cache_path(*parts):
+    return os.path.join(LOG_COMPARE_DIR, 'cache', *parts)
+
+
+def record_log_compare_cache_lookup(hit):
+    """Count a cache hit or miss (caller holds log_compare_cache_lock)"""
+    stats_path = log_compare_cache_path('stats.json')
+    try:
+        with open(stats_path) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {'hits': 0, 'misses': 0}
+    stats['hits' if hit else 'misses'] += 1
+    write_json_atomic(stats_path, stats)
+
+
+def lookup_log_compare_cache(cache_key, user_id):
+    """
+    Return the cached summary for a cache key (granting the user access to it), or None.
+    Hits refresh the entry's position in the LRU order and the result set's TTL.
+    """
+    with log_compare_cache_lock:
+        os.makedirs(log_compare_cache_path('entries'), exist_ok=True)
+        entry_path = log_compare_cache_path('entries', f"{cache_key}.json")
+        summary = None
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+            summary = load_log_comparison_summary(entry['comparison_id'])
+        except (OSError, ValueError):
+            pass
+        if summary is None:
+            # Missing, or its result set has expired or been deleted
+            if os.path.exists(entry_path):
+                os.remove(entry_path)
+            record_log_compare_cache_lookup(False)
+            return None
+
+        if user_id not in summary.get('user_ids', [summary['user_id']]):
+            summary['user_ids'] = summary.get('user_ids', [summary['user_id']]) + [user_id]
+            write_json_atomic(os.path.join(log_result_dir(summary['comparison_id']), 'summary.json'), summary)
+        os.utime(entry_path)
+        os.utime(log_result_dir(summary['comparison_id']))
+        record_log_compare_cache_lookup(True)
+        return summary
+
+
+def add_log_compare_cache_entry(cache_key, summary):
+    """Cache a finished comparison, then evict least recently used results over the size budget"""
+    result_dir = log_result_dir(summary['comparison_id'])
+    size_bytes = sum(os.path.getsize(os.path.join(result_dir, name)) for name in os.listdir(result_dir))
+    with log_compare_cache_lock:
+        os.makedirs(log_compare_cache_path('entries'), exist_ok=True)
+        write_json_atomic(log_compare_cache_path('entries', f"{cache_key}.json"),
+                          {'comparison_id': summary['comparison_id'], 'size_bytes': size_bytes})
+        evict_log_compare_cache(keep=summary['comparison_id'])
+
+
+def list_log_compare_cache_entries():
+    """Cache entries as (last used, entry path, entry), least recently used first"""
+    entries_dir = log_compare_cache_path('entries')
+    entries = []
+    if os.path.isdir(entries_dir):
+        for name in os.listdir(entries_dir):
+            path = os.path.join(entries_dir, name)
+            try:
+                with open(path) as f:
+                    entries.append((os.path.getmtime(path), path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+    entries.sort(key=lambda item: item[0])
+    return entries
+
+
+def evict_log_compare_cache(keep=None):
+    """
+    Drop least recently used cached results until the cache fits (caller holds the lock).
+    `keep` is the comparison just added, which is never evicted even if it alone is over budget.
+    """
+    entries = list_log_compare_cache_entries()
+    total_bytes = sum(entry['size_bytes'] for _, _, entry in entries)
+    max_bytes = LOG_COMPARE_CACHE_MAX_MB * 1024 * 1024
+    for _, path, entry in entries:
+        if total_bytes <= max_bytes:
+            break
+        if entry['comparison_id'] == keep:
+            continue
+        shutil.rmtree(log_result_dir(entry['comparison_id']), ignore_errors=True)
+        os.remove(path)
+        total_bytes -= entry['size_bytes']
+        log(f"Evicted cached log comparison {entry['comparison_id']} ({entry['size_bytes']} bytes)")
+
+
+# Background comparison jobs. The job directory holds job.json (the inputs live in the upload
+# store) and a lock file: whichever worker runs a job holds an flock on it, so with several
+# server processes each job runs in exactly one of them. The OS drops the lock when its process
+# exits, and the comparison's partition checkpoint lets another worker pick up where it left off.
+LOG_COMPARE_JOB_RESCAN_SECONDS = 30  # how often an idle worker looks for jobs no worker has claimed
+log_compare_job_queue = Queue()
+log_compare_worker_lock = threading.Lock()
+log_compare_worker_started = False
+
+
+def log_job_dir(job_id):
+    return os.path.join(LOG_COMPARE_DIR, 'jobs', job_id)
+
+
+def load_log_compare_job(job_id, user_id=None):
+    """Load a job's state; with user_id, only if the job belongs to that user"""
+    if not COMPARISON_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(os.path.join(log_job_dir(job_id), 'job.json')) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if user_id is not None and job.get('user_id') != user_id:
+        return None
+    return job
+
+
+def save_log_compare_job(job):
+    job['updated_at'] = datetime.now(timezone.utc).isoformat()
+    write_json_atomic(os.path.join(log_job_dir(job['job_id']), 'job.json'), job)
+
+
+def notify_log_compare_progress(job):
+    """Push a job's progress to the user's SSE connections"""
+    user_id = str(job['user_id'])
+    with queue_lock:
+        if user_id in user_event_queues:
+            for queue in user_event_queues[user_id]:
+                event_data = {
+                    'type': 'log_compare_progress',
+                    'job_id': job['job_id'],
+                    'status': job['status'],
+                    'progress': job['progress'],
+                    'counts': job.get('counts'),
+                    'error': job.get('error')
+                }
+                queue.put(json.dumps(event_data))
+
+
+def claim_log_compare_job(job_id):
+    """
+    Take a job's lock, held for as long as the returned file stays open. Returns None if another
+    worker, in this process or another one, holds it.
+    """
+    return try_lock_file(os.path.join(log_job_dir(job_id), 'lock'))
+
+
+def list_unclaimed_log_compare_jobs():
+    """Ids of the unfinished jobs that no worker holds the lock of, oldest first"""
+    jobs_root = os.path.join(LOG_COMPARE_DIR, 'jobs')
+    unclaimed = []
+    if os.path.isdir(jobs_root):
+        for job_id in os.listdir(jobs_root):
+            job = load_log_compare_job(job_id)
+            if job and job['status'] not in LOG_COMPARE_JOB_FINISHED:
+                lock_file = claim_log_compare_job(job_id)
+                if lock_file:
+                    lock_file.close()
+                    unclaimed.append(job)
+    return [job['job_id'] for job in sorted(unclaimed, key=lambda job: job['created_at'])]
+
+
+def run_log_compare_job(job_id):
+    """Run (or resume) one comparison job unless another worker has claimed it"""
+    lock_file = claim_log_compare_job(job_id)
+    if lock_file is None:
+        return
+    try:
+        execute_log_compare_job(job_id)
+    finally:
+        lock_file.close()
+
+
+def execute_log_compare_job(job_id):
+    """Run a claimed job, recording progress in job.json"""
+    # Reloaded under the lock: another worker may have finished it since it was queued
+    job = load_log_compare_job(job_id)
+    if not job or job['status'] in LOG_COMPARE_JOB_FINISHED:
+        return
+    job['status'] = 'running'
+    save_log_compare_job(job)
+    # Keep the stored uploads from expiring while the job runs
+    for path in job['inputs'].values():
+        os.utime(path)
+
+    def progress(update):
+        job['progress'] = update
+        save_log_compare_job(job)
+        notify_log_compare_progress(job)
+
+    try:
+        summary = run_log_comparison(job['user_id'], job['inputs']['original'], job['inputs']['new'],
+                                     job['key_column'], job['fuzzy'], job['columns'] or None, job_id, progress)
+        add_log_compare_cache_entry(job['cache_key'], summary)
+        job['status'] = 'completed'
+        job['counts'] = summary['counts']
+        job['insights'] = summary['insights']
+        job['progress'] = dict(job['progress'], stage='done', eta_seconds=0)
+        log(f"Log comparison job {job_id} for user {job['user_id']} completed: {summary['counts']}")
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        log(f"Log comparison job {job_id} failed: {str(e)}\nStack trace: {traceback.format_exc()}")
+    save_log_compare_job(job)
+    notify_log_compare_progress(job)
+
+
+def log_compare_worker():
+    """
+    Run queued comparison jobs one at a time (each job already uses a process pool). When idle,
+    take over unfinished jobs no worker holds: ones queued in a process that is busy or gone.
+    """
+    while True:
+        try:
+            job_ids = [log_compare_job_queue.get(timeout=LOG_COMPARE_JOB_RESCAN_SECONDS)]
+        except Empty:
+            job_ids = list_unclaimed_log_compare_jobs()
+        for job_id in job_ids:
+            try:
+                run_log_compare_job(job_id)
+            except Exception as e:
+                log(f"Error running log comparison job {job_id}: {str(e)}")
+
+
+def start_log_compare_worker():
+    """Start the job worker once, re-queueing unfinished jobs that no worker has claimed"""
+    global log_compare_worker_started
+    with log_compare_worker_lock:
+        if log_compare_worker_started:
+            return
+        log_compare_worker_started = True
+
+        for job_id in list_unclaimed_log_compare_jobs():
+            log(f"Re-queueing unfinished log comparison job {job_id}")
+            log_compare_job_queue.put(job_id)
+
+        threading.Thread(target=log_compare_worker, daemon=True).start()
+
+
+@app.route("/api/aws-log-compare/compare", methods=["POST"])
+@login_required
+def api_compare_logs():
+    """Compare two uploaded log exports server-side (multipart fields file1, file2, key_column, fuzzy, columns)"""
+    user_id = session["user_id"]
+    file1 = request.files.get("file1")
+    file2 = request.files.get("file2")
+    if not file1 or not file2:
+        return jsonify({"success": False, "error": "Both file1 and file2 are required"}), 400
+
+    try:
+        cleanup_log_compare_results()
+
+        # Uploads are streamed to disk (never held in memory) and stored by content hash
+        old_hash, old_path = store_log_upload(file1)
+        new_hash, new_path = store_log_upload(file2)
+
+        key_column = request.form.get("key_column", "auto")
+        fuzzy = request.form.get("fuzzy", "false").lower() in ("1", "true", "on")
+        columns = [column.strip() for column in request.form.get("columns", "").split(",") if column.strip()]
+        cache_key = log_compare_cache_key(old_hash, new_hash, key_column, fuzzy, columns)
+
+        summary = lookup_log_compare_cache(cache_key, user_id)
+        if summary:
+            log(f"User {user_id} compared logs server-side: served {summary['comparison_id']} from cache")
+            return jsonify({"success": True, "cached": True, "comparison": public_log_comparison_summary(summary)})
+
+        summary = run_log_comparison(user_id, old_path, new_path, key_column, fuzzy, columns or None)
+        add_log_compare_cache_entry(cache_key, summary)
+        log(f"User {user_id} compared logs server-side: {summary['counts']} in {summary['elapsed_ms']} ms")
+        return jsonify({"success": True, "cached": False, "comparison": public_log_comparison_summary(summary)})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        log(f"Error comparing logs for user {user_id}: {str(e)}\nStack trace: {traceback.format_exc()}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/api/aws-log-compare/detect-key", methods=["POST"])
+@login_required
+def api_detect_log_key_column():
+    """Rank the key column candidates of an uploaded log export (multipart field file1)"""
+    user_id = session["user_id"]
+    file1 = request.files.get("file1")
+    if not file1:
+        return jsonify({"success": False, "error": "file1 is required"}), 400
+
+    upload_dir = os.path.join(LOG_COMPARE_DIR, 'uploads', uuid.uuid4().hex)
+    os.makedirs(upload_dir)
+    try:
+        path = os.path.join(upload_dir, 'original')
+        file1.save(path)
+
+        headers = read_log_headers(path)
+        if not headers:
+            return jsonify({"success": False, "error": "File has no header row"}), 400
+        sample, rows_scanned = sample_log_records(path)
+        ranking = rank_log_key_columns(headers, sample)
+        return jsonify({
             "success": True,
-            "formatted_code": formatted_code
+            "key_column": ranking[0]['column'],
+            "rows_sampled": len(sample),
+            "rows_scanned": rows_scanned,
+            "ranking": ranking
         })
     except Exception as e:
-        log(f"Error formatting code for user {user_id}: {str(e)}")
+        log(f"Error detecting log key column for user {user_id}: {str(e)}\nStack trace: {traceback.format_exc()}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+@app.route("/api/aws-log-compare/results/<comparison_id>", methods=["GET"])
+@login_required
+def api_get_log_comparison_results(comparison_id):
+    """Get one page of comparison results (?type=modified&offset=0&limit=100)"""
+    user_id = session["user_id"]
+    summary = load_log_comparison_summary(comparison_id, user_id)
+    if not summary:
+        return jsonify({"success": False, "error": "Comparison not found"}), 404
+
+    change_type = request.args.get("type", "modified")
+    if change_type not in LOG_COMPARE_CHANGE_TYPES:
+        return jsonify({"success": False, "error": f"Type must be one of {', '.join(LOG_COMPARE_CHANGE_TYPES)}"}), 400
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 100)), 1), LOG_RESULT_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"success": False, "error": "offset and limit must be integers"}), 400
+
+    rows = []
+    for line in iter_log_results(comparison_id, change_type, offset):
+        if len(rows) >= limit:
+            break
+        rows.append(json.loads(line))
+
+    return jsonify({
+        "success": True,
+        "type": change_type,
+        "offset": offset,
+        "limit": limit,
+        "total": summary['counts'][change_type],
+        "rows": rows
+    })
+
+
+@app.route("/api/aws-log-compare/results/<comparison_id>/stream", methods=["GET"])
+@login_required
+def api_stream_log_comparison_results(comparison_id):
+    """Stream all results of one change type as NDJSON"""
+    user_id = session["user_id"]
+    if not load_log_comparison_summary(comparison_id, user_id):
+        return jsonify({"success": False, "error": "Comparison not found"}), 404
+
+    change_type = request.args.get("type", "modified")
+    if change_type not in LOG_COMPARE_CHANGE_TYPES:
+        return jsonify({"success": False, "error": f"Type must be one of {', '.join(LOG_COMPARE_CHANGE_TYPES)}"}), 400
+
+    return Response(iter_log_results(comparison_id, change_type), mimetype="application/x-ndjson")
+
+
+def parse_log_result_query_args(args):
+    """Read the shared filter/sort arguments of the result query and export endpoints"""
+    types = [change_type.strip() for change_type in args.get("type", ",".join(LOG_COMPARE_CHANGE_TYPES)).split(",")
+             if change_type.strip()]
+    return types, args.get("column") or None, args.get("sort", "position")
+
+
+@app.route("/api/aws-log-compare/results/<comparison_id>/rows", methods=["GET"])
+@login_required
+def api_query_log_comparison_results(comparison_id):
+    """
+    Query one page of results across change types
+    (?type=added,modified&column=latency&sort=-changes&limit=100&cursor=... or &offset=...).
+    Pass next_cursor back as cursor for the following page.
+    """
+    user_id = session["user_id"]
+    summary = load_log_comparison_summary(comparison_id, user_id)
+    if not summary:
+        return jsonify({"success": False, "error": "Comparison not found"}), 404
+
+    types, column, sort = parse_log_result_query_args(request.args)
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 100)), 1), LOG_RESULT_MAX_PAGE_SIZE)
+        total, results = query_log_results(comparison_id, types, column, sort, request.args.get("cursor"),
+                                           offset, limit + 1)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    rows = []
+    next_cursor = None
+    for cursor, change_type, record in results:
+        if len(rows) == limit:
+            # One extra row was fetched only to know whether another page exists
+            next_cursor = previous_cursor
+            break
+        rows.append({"type": change_type, "record": record})
+        previous_cursor = cursor
+    results.close()
+
+    return jsonify({
+        "success": True,
+        "total": total,
+        "counts": summary['counts'],
+        "headers": summary['headers'],
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "rows": rows
+    })
+
+
+@app.route("/api/aws-log-compare/results/<comparison_id>/export.csv", methods=["GET"])
+@login_required
+def api_export_log_comparison_results(comparison_id):
+    """Stream matching results as CSV (same filters and sort as /rows; defaults to every change but unchanged)"""
+    user_id = session["user_id"]
+    summary = load_log_comparison_summary(comparison_id, user_id)
+    if not summary:
+        return jsonify({"success": False, "error": "Comparison not found"}), 404
+
+    args = request.args.to_dict()
+    args.setdefault("type", "added,removed,modified,fuzzy_matched")
+    types, column, sort = parse_log_result_query_args(args)
+    try:
+        _, results = query_log_results(comparison_id, types, column, sort)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    headers = summary['headers']
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(['Status'] + headers + ['Changes'])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for _, change_type, record in results:
+            yield log_result_csv_row(buffer, writer, change_type, record, headers)
+
+    log(f"User {user_id} exported log comparison {comparison_id} as CSV")
+    response = Response(generate(), mimetype="text/csv")
+    response.headers['Content-Disposition'] = 'attachment; filename="log_comparison_results.csv"'
+    return response
+
+
+@app.route("/api/aws-log-compare/results/<comparison_id>", methods=["DELETE"])
+@login_required
+def api_delete_log_comparison(comparison_id):
+    """Delete a stored comparison result set (or only the user's access, if it is shared via the cache)"""
+    user_id = session["user_id"]
+    with log_compare_cache_lock:
+        summary = load_log_comparison_summary(comparison_id, user_id)
+        if not summary:
+            return jsonify({"success": False, "error": "Comparison not found"}), 404
+
+        other_users = [other for other in summary.get('user_ids', [summary['user_id']]) if other != user_id]
+        if other_users:
+            summary['user_ids'] = other_users
+            write_json_atomic(os.path.join(log_result_dir(comparison_id), 'summary.json'), summary)
+        else:
+            shutil.rmtree(log_result_dir(comparison_id), ignore_errors=True)
+    job = load_log_compare_job(comparison_id, user_id)
+    if job and job['status'] in LOG_COMPARE_JOB_FINISHED:
+        shutil.rmtree(log_job_dir(comparison_id), ignore_errors=True)
+    log(f"User {user_id} deleted log comparison {comparison_id}")
+    return jsonify({"success": True})
+
+
+@app.route("/api/aws-log-compare/cache/stats", methods=["GET"])
+@login_required
+def api_log_comparison_cache_stats():
+    """Report the result cache's hit rate and disk usage"""
+    with log_compare_cache_lock:
+        try:
+            with open(log_compare_cache_path('stats.json')) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {'hits': 0, 'misses': 0}
+        entries = list_log_compare_cache_entries()
+
+    lookups = stats['hits'] + stats['misses']
+    return jsonify({
+        "success": True,
+        "hits": stats['hits'],
+        "misses": stats['misses'],
+        "hit_rate": round(stats['hits'] / lookups, 4) if lookups else None,
+        "entries": len(entries),
+        "size_bytes": sum(entry['size_bytes'] for _, _, entry in entries),
+        "max_bytes": LOG_COMPARE_CACHE_MAX_MB * 1024 * 1024
+    })
+
+
+@app.route("/api/aws-log-compare/jobs", methods=["POST"])
+@login_required
+def api_submit_log_comparison_job():
+    """
+    Queue a comparison as a background job (same multipart fields as /compare).
+    Progress is pushed as log_compare_progress events on /events/<user_id>; once completed,
+    results are read from /api/aws-log-compare/results/<comparison_id>. That is the job id for
+    a job that ran, or an earlier comparison's id for one served from the cache.
+    """
+    user_id = session["user_id"]
+    file1 = request.files.get("file1")
+    file2 = request.files.get("file2")
+    if not file1 or not file2:
+        return jsonify({"success": False, "error": "Both file1 and file2 are required"}), 400
+
+    start_log_compare_worker()
+    job_id = uuid.uuid4().hex
+    job_dir = log_job_dir(job_id)
+    os.makedirs(job_dir)
+    try:
+        cleanup_log_compare_results()
+        old_hash, old_path = store_log_upload(file1)
+        new_hash, new_path = store_log_upload(file2)
+
+        job = {
+            'job_id': job_id,
+            'comparison_id': job_id,
+            'user_id': user_id,
+            'status': 'queued',
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'inputs': {'original': old_path, 'new': new_path},
+            'key_column': request.form.get("key_column", "auto"),
+            'fuzzy': request.form.get("fuzzy", "false").lower() in ("1", "true", "on"),
+            'columns': [column.strip() for column in request.form.get("columns", "").split(",") if column.strip()],
+            'progress': {'stage': 'queued'}
+        }
+        job['cache_key'] = log_compare_cache_key(old_hash, new_hash, job['key_column'], job['fuzzy'], job['columns'])
+
+        summary = lookup_log_compare_cache(job['cache_key'], user_id)
+        if summary:
+            # Nothing to run: the job is recorded as completed, pointing at the cached comparison
+            job.update(comparison_id=summary['comparison_id'], status='completed', cached=True,
+                       counts=summary['counts'], insights=summary.get('insights'),
+                       progress={'stage': 'done', 'eta_seconds': 0})
+            save_log_compare_job(job)
+            log(f"User {user_id} log comparison job {job_id} served {summary['comparison_id']} from cache")
+            return jsonify({"success": True, "job": job})
+
+        save_log_compare_job(job)
+    except Exception as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        log(f"Error queueing log comparison job for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    log_compare_job_queue.put(job_id)
+    log(f"User {user_id} queued log comparison job {job_id}")
+    return jsonify({"success": True, "job": job}), 202
+
+
+@app.route("/api/aws-log-compare/jobs", methods=["GET"])
+@login_required
+def api_list_log_comparison_jobs():
+    """List the user's comparison jobs, newest first"""
+    user_id = session["user_id"]
+    start_log_compare_worker()
+    jobs_root = os.path.join(LOG_COMPARE_DIR, 'jobs')
+    jobs = []
+    if os.path.isdir(jobs_root):
+        for job_id in os.listdir(jobs_root):
+            job = load_log_compare_job(job_id, user_id)
+            if job:
+                jobs.append(job)
+    jobs.sort(key=lambda job: job['created_at'], reverse=True)
+    return jsonify({"success": True, "jobs": jobs})
+
+
+@app.route("/api/aws-log-compare/jobs/<job_id>", methods=["GET"])
+@login_required
+def api_get_log_comparison_job(job_id):
+    """Get the status and progress of a comparison job"""
+    user_id = session["user_id"]
+    start_log_compare_worker()
+    job = load_log_compare_job(job_id, user_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": job})
+
+
+# ==================== END AWS LOG COMPARISON ENGINE ====================
+
+
+# ==================== JSON COMPARISON ENGINE ====================
+# Server-side counterpart of findDifferences() in static/js/json-compare.js for documents too
+# large for the browser. Both documents are hashed bottom-up into Merkle trees first, so an
+# identical subtree, however large, is skipped with one digest comparison and only the
+# branches that actually differ are walked.
+
+JSON_DIFF_MAX_DIFFERENCES = 10000  # differences returned per response; stats always count all
+JSON_BOOLEAN_TOKENS = {True: b'\x01', False: b'\x00'}  # bool tokens must not equal 1 and 0
+# How arrays are matched up: by position like the browser, by longest common subsequence of
+# element digests, or by an identity member of their objects (falling back to LCS)
+JSON_ARRAY_STRATEGIES = ("index", "lcs", "keyed")
+JSON_DIFF_MAX_EDIT_DISTANCE = 1000  # beyond this many inserts/deletes an array is paired by position
+# Streaming mode (documents parsed as events, never held in memory)
+JSON_STREAM_CHUNK_BYTES = 1024 * 1024
+JSON_STREAM_LOOKAHEAD = 64  # bytes kept buffered past a token start so literals never split
+JSON_STREAM_VALUE_EVENTS = 1000  # parse events of an added/removed/changed value included in its difference
+JSON_STREAM_HOLD_BYTES = 4096  # out-of-order member values above this are held by file offset, not in memory
+JSON_STREAM_MAX_GUNZIP_BYTES = 4 * 1024 * 1024 * 1024  # decompressed size of each gzip'd upload
+JSON_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+JSON_NUMBER_PATTERN = re.compile(r'-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?')
+# A string body up to its closing quote, a control character (invalid) or a trailing backslash
+JSON_STRING_BODY_PATTERN = re.compile(r'[^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*', re.DOTALL)
+JSON_LITERALS = (('true', True), ('false', False), ('null', None))
+JSON_DECODER = json.JSONDecoder()
+JSON_CONTAINER_TYPES = (dict, list)
+# What the event parser accepts next, for its syntax errors. After a value it expects the
+# separator of the enclosing container, keyed by its opening bracket.
+JSON_EXPECTED_TOKENS = {
+    'value': "a value", 'first_value': "a value or ']'", 'key': "an object key",
+    'first_key': "an object key or '}'", 'colon': "':'", '{': "',' or '}'", '[': "',' or ']'",
+}
+# Batch mode: archives hold each pair at the same relative path under these two directories
+JSON_BATCH_ARCHIVE_DIRS = ("recorded", "current")
+JSON_BATCH_MAX_PAIRS = 5000
+JSON_BATCH_MAX_ARCHIVE_FILES = 2 * JSON_BATCH_MAX_PAIRS
+JSON_BATCH_MAX_ARCHIVE_BYTES = 256 * 1024 * 1024  # uncompressed total of the recorded/ and current/ files
+
+
+def json_leaf_token(value):
+    """
+    Token of a scalar that compares equal exactly when JSON.stringify() renders both the same:
+    1 and 1.0 match, true and 1 don't
+    """
+    if value is True or value is False:
+        return JSON_BOOLEAN_TOKENS[value]
+    if type(value) is float and value.is_integer():
+        return int(value)
+    return value
+
+
+def build_json_merkle_tree(value):
+    """
+    Hash a parsed JSON document bottom-up into nodes of (token, value, children).
+    `children` is a key -> node dict for objects, a list of nodes for arrays and None for
+    scalars. A container's token is the digest of its children's tokens (object members in
+    key order, since the diff compares objects key by key); a scalar's is json_leaf_token().
+    """
+    if isinstance(value, dict):
+        children = {}
+        for key, child in value.items():
+            # Scalars are handled inline; a call per leaf would dominate the build time
+            children[key] = build_json_merkle_tree(child) if isinstance(child, (dict, list)) \
+                else (child if type(child) is str else json_leaf_token(child), child, None)
+        canonical = sorted([(key, node[0]) for key, node in children.items()])
+    elif isinstance(value, list):
+        children = [
+            build_json_merkle_tree(child) if isinstance(child, (dict, list))
+            else (child if type(child) is str else json_leaf_token(child), child, None)
+            for child in value
+        ]
+        canonical = [node[0] for node in children]
+    else:
+        return json_leaf_token(value), value, None
+    # marshal (format 2 has no back-references) serializes the tokens unambiguously in C.
+    # Digests are bytes, so they can never equal a string, number or null token.
+    return hashlib.blake2b(marshal.dumps(canonical, 2), digest_size=16,
+                           person=b'{' if type(children) is dict else b'[').digest(), value, children
+
+
+def json_child_path(path, key):
+    """Path of an object member, like findDifferences() ('a.b', or 'b' at the root)"""
+    return f"{path}.{key}" if path else key
+
+
+def iter_json_differences(node1, node2, path='', array_strategy='index', array_key=None):
+    """
+    Yield the differences between two Merkle nodes with findDifferences() semantics:
+    arrays element by element (see JSON_ARRAY_STRATEGIES), objects key by key, anything
+    else as a changed value. Subtrees with equal digests are skipped without being visited.
+    """
+    if node1[0] == node2[0]:
+        return
+    children1, children2 = node1[2], node2[2]
+
+    if isinstance(children1, list) and isinstance(children2, list):
+        if array_strategy == 'keyed':
+            keys1 = json_array_element_keys(children1, array_key)
+            keys2 = json_array_element_keys(children2, array_key) if keys1 is not None else None
+            if keys2 is not None:
+                yield from iter_keyed_array_differences(children1, keys1, children2, keys2, path,
+                                                        array_strategy, array_key)
+                return
+        if array_strategy != 'index':
+            yield from iter_lcs_array_differences(children1, children2, path, array_strategy, array_key)
+            return
+
+        for index in range(max(len(children1), len(children2))):
+            current_path = f"{path}[{index}]"
+            if index >= len(children2):
+                yield {'type': 'removed', 'path': current_path, 'value1': children1[index][1]}
+            elif index >= len(children1):
+                yield {'type': 'added', 'path': current_path, 'value2': children2[index][1]}
+            else:
+                yield from iter_json_child_differences(children1[index], children2[index], current_path,
+                                                       array_strategy, array_key)
+        return
+
+    if isinstance(children1, dict) and isinstance(children2, dict):
+        for key, child in children1.items():
+            current_path = json_child_path(path, key)
+            if key not in children2:
+                yield {'type': 'removed', 'path': current_path, 'value1': child[1]}
+            else:
+                yield from iter_json_child_differences(child, children2[key], current_path,
+                                                       array_strategy, array_key)
+        for key, child in children2.items():
+            if key not in children1:
+                yield {'type': 'added', 'path': json_child_path(path, key), 'value2': child[1]}
+        return
+
+    yield {'type': 'changed', 'path': path, 'value1': node1[1], 'value2': node2[1]}
+
+
+def iter_json_child_differences(child1, child2, path, array_strategy='index', array_key=None):
+    """Recurse into two containers of the same kind; report anything else as changed"""
+    if child1[0] == child2[0]:
+        return
+    if child1[2] is not None and type(child1[2]) is type(child2[2]):
+        yield from iter_json_differences(child1, child2, path, array_strategy, array_key)
+    else:
+        yield {'type': 'changed', 'path': path, 'value1': child1[1], 'value2': child2[1]}
+
+
+def myers_matches(tokens1, tokens2, max_edits=JSON_DIFF_MAX_EDIT_DISTANCE):
+    """
+    Matched (index1, index2) pairs of a shortest edit script between two token lists,
+    found with Myers' O((N+M)D) greedy algorithm. Returns None if more than `max_edits`
+    inserts/deletes are needed.
+    """
+    n, m = len(tokens1), len(tokens2)
+    offset = max_edits + 1
+    v = [0] * (2 * offset + 1)  # furthest x reached on each diagonal k = x - y, at v[offset + k]
+    trace = []
+    for d in range(max_edits + 1):
+        trace.append(v[offset - d:offset + d + 1])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]  # insertion: down from diagonal k + 1
+            else:
+                x = v[offset + k - 1] + 1  # deletion: right from diagonal k - 1
+            y = x - k
+            while x < n and y < m and tokens1[x] == tokens2[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return myers_backtrack(trace, n, m)
+    return None
+
+
+def myers_backtrack(trace, n, m):
+    """Walk Myers' per-round snapshots back from (n, m), collecting the diagonal (matching) moves"""
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        previous = trace[d]  # diagonals -d..d at previous[k + d]
+        k = x - y
+        if k == -d or (k != d and previous[k - 1 + d] < previous[k + 1 + d]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = previous[previous_k + d]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x, y = previous_x, previous_y
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        matches.append((x, y))
+    matches.reverse()
+    return matches
+
+
+def json_array_matches(tokens1, tokens2):
+    """
+    Matched (index1, index2) pairs of two arrays' element tokens. The common prefix and suffix
+    are trimmed first, so one insertion into a huge array costs a linear scan; a middle that
+    needs more than JSON_DIFF_MAX_EDIT_DISTANCE edits is left unmatched.
+    """
+    n, m = len(tokens1), len(tokens2)
+    start = 0
+    while start < n and start < m and tokens1[start] == tokens2[start]:
+        start += 1
+    end1, end2 = n, m
+    while end1 > start and end2 > start and tokens1[end1 - 1] == tokens2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+
+    matches = [(index, index) for index in range(start)]
+    middle = myers_matches(tokens1[start:end1], tokens2[start:end2]) if start < end1 and start < end2 else []
+    matches.extend((index1 + start, index2 + start) for index1, index2 in middle or [])
+    matches.extend((end1 + index, end2 + index) for index in range(n - end1))
+    return matches
+
+
+def iter_lcs_array_differences(children1, children2, path, array_strategy, array_key):
+    """
+    Diff two arrays by their longest common subsequence of element digests. Between matched
+    elements, runs of removed and added elements are paired up by position and diffed; the rest
+    are reported as removed (at their index in the first array) or added (in the second).
+    """
+    matches = json_array_matches([node[0] for node in children1], [node[0] for node in children2])
+    index1 = index2 = 0
+    for next1, next2 in matches + [(len(children1), len(children2))]:
+        paired = min(next1 - index1, next2 - index2)
+        for offset in range(paired):
+            yield from iter_json_child_differences(children1[index1 + offset], children2[index2 + offset],
+                                                   f"{path}[{index2 + offset}]", array_strategy, array_key)
+        for index in range(index1 + paired, next1):
+            yield {'type': 'removed', 'path': f"{path}[{index}]", 'value1': children1[index][1]}
+        for index in range(index2 + paired, next2):
+            yield {'type': 'added', 'path': f"{path}[{index}]", 'value2': children2[index][1]}
+        index1, index2 = next1 + 1, next2 + 1
+
+
+def json_array_element_keys(children, array_key):
+    """
+    Identity tokens of array elements from their `array_key` member, or None unless every
+    element is an object with a unique scalar value there
+    """
+    keys = []
+    for node in children:
+        members = node[2]
+        if type(members) is not dict or array_key not in members or members[array_key][2] is not None:
+            return None
+        keys.append(members[array_key][0])
+    return keys if len(set(keys)) == len(keys) else None
+
+
+def iter_keyed_array_differences(children1, keys1, children2, keys2, path, array_strategy, array_key):
+    """
+    Diff two arrays of objects matched by identity member, reported at paths like items[id=42].
+    Elements are compared wherever they sit, so reordering alone is not a difference.
+    """
+    positions2 = {key: index for index, key in enumerate(keys2)}
+    for node, key in zip(children1, keys1):
+        current_path = f"{path}[{array_key}={json.dumps(node[2][array_key][1], ensure_ascii=False)}]"
+        if key in positions2:
+            yield from iter_json_child_differences(node, children2[positions2[key]], current_path,
+                                                   array_strategy, array_key)
+        else:
+            yield {'type': 'removed', 'path': current_path, 'value1': node[1]}
+    positions1 = set(keys1)
+    for node, key in zip(children2, keys2):
+        if key not in positions1:
+            yield {'type': 'added', 'path': f"{path}[{array_key}={json.dumps(node[2][array_key][1], ensure_ascii=False)}]",
+                   'value2': node[1]}
+
+
+def diff_json_documents(document1, document2, limit=JSON_DIFF_MAX_DIFFERENCES, array_strategy='index',
+                        array_key=None):
+    """
+    Compare two parsed JSON documents. Returns the first `limit` differences and the
+    added/removed/changed counts of all of them, like calculateStats().
+    """
+    differences = []
+    stats = {'added': 0, 'removed': 0, 'changed': 0}
+    for difference in iter_json_differences(build_json_merkle_tree(document1), build_json_merkle_tree(document2),
+                                            '', array_strategy, array_key):
+        stats[difference['type']] += 1
+        if len(differences) < limit:
+            differences.append(difference)
+    total = stats['added'] + stats['removed'] + stats['changed']
+    return {
+        'identical': total == 0,
+        'stats': stats,
+        'differences': differences,
+        'truncated': total > len(differences)
+    }
+
+
+def json_pointer(pointer, key):
+    """RFC 6901 pointer of an object member or array element"""
+    return f"{pointer}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def iter_json_patch_operations(node1, node2, pointer='', array_strategy='index', array_key=None):
+    """
+    Yield RFC 6902 operations turning the first Merkle node's document into the second's.
+    Arrays are aligned with the same strategy as the diff (position, LCS of digests, or LCS of
+    identity keys) and patched from the end backwards, so every index refers to the document
+    as it stands when that operation is applied.
+    """
+    if node1[0] == node2[0]:
+        return
+    children1, children2 = node1[2], node2[2]
+
+    if isinstance(children1, dict) and isinstance(children2, dict):
+        for key, child in children1.items():
+            if key not in children2:
+                yield {'op': 'remove', 'path': json_pointer(pointer, key)}
+            else:
+                yield from iter_json_patch_operations(child, children2[key], json_pointer(pointer, key),
+                                                      array_strategy, array_key)
+        for key, child in children2.items():
+            if key not in children1:
+                yield {'op': 'add', 'path': json_pointer(pointer, key), 'value': child[1]}
+        return
+
+    if not (isinstance(children1, list) and isinstance(children2, list)):
+        yield {'op': 'replace', 'path': pointer, 'value': node2[1]}
+        return
+
+    keys1 = keys2 = None
+    if array_strategy == 'keyed':
+        keys1 = json_array_element_keys(children1, array_key)
+        keys2 = json_array_element_keys(children2, array_key) if keys1 is not None else None
+    if keys2 is not None:
+        matches = json_array_matches(keys1, keys2)
+    elif array_strategy != 'index':
+        matches = json_array_matches([node[0] for node in children1], [node[0] for node in children2])
+    else:
+        matches = []
+
+    # Runs of unmatched elements, each followed by a matched pair (or the end of both arrays)
+    runs = []
+    index1 = index2 = 0
+    for next1, next2 in matches + [(len(children1), len(children2))]:
+        runs.append((index1, next1, index2, next2))
+        index1, index2 = next1 + 1, next2 + 1
+
+    for start1, end1, start2, end2 in reversed(runs):
+        if end1 < len(children1):
+            yield from iter_json_patch_operations(children1[end1], children2[end2], json_pointer(pointer, end1),
+                                                  array_strategy, array_key)
+        paired = min(end1 - start1, end2 - start2)
+        for index in range(end1 - 1, start1 + paired - 1, -1):
+            yield {'op': 'remove', 'path': json_pointer(pointer, index)}
+        for offset in range(paired, end2 - start2):
+            yield {'op': 'add', 'path': json_pointer(pointer, start1 + offset), 'value': children2[start2 + offset][1]}
+        for offset in range(paired):
+            yield from iter_json_patch_operations(children1[start1 + offset], children2[start2 + offset],
+                                                  json_pointer(pointer, start1 + offset), array_strategy, array_key)
+
+
+def diff_json_pair_job(name, document1, document2, options, raw=False):
+    """
+    Diff one pair of a batch comparison, in a worker process. With `raw`, the documents are
+    still JSON text and are parsed here. Returns the pair's summary and its RFC 6902 patch.
+    """
+    try:
+        if raw:
+            for document, directory in zip((document1, document2), JSON_BATCH_ARCHIVE_DIRS):
+                if document is None:
+                    raise ValueError(f"No matching file under {directory}/")
+            document1, document2 = json.loads(document1), json.loads(document2)
+        tree1, tree2 = build_json_merkle_tree(document1), build_json_merkle_tree(document2)
+        stats = {'added': 0, 'removed': 0, 'changed': 0}
+        for difference in iter_json_differences(tree1, tree2, '', options['array_strategy'], options['array_key']):
+            stats[difference['type']] += 1
+        patch = list(iter_json_patch_operations(tree1, tree2, '', options['array_strategy'], options['array_key']))
+    except Exception as e:
+        return {'type': 'pair', 'name': name, 'error': str(e)}
+    # Keyed matching ignores reordering, so a pair can be identical and still need a patch
+    return {'type': 'pair', 'name': name, 'identical': not any(stats.values()), 'stats': stats, 'patch': patch}
+
+
+def iter_json_batch_lines(pairs, options):
+    """
+    Diff (name, document1, document2, raw) pairs across JSON_BATCH_WORKERS processes, yielding
+    an NDJSON line per pair as soon as it finishes, then a summary line
+    """
+    totals = {'pairs': len(pairs), 'identical': 0, 'different': 0, 'failed': 0}
+    workers = min(JSON_BATCH_WORKERS, len(pairs))
+    jobs = [(name, document1, document2, options, raw) for name, document1, document2, raw in pairs]
+    if workers > 1:
+        futures = iter_process_pool_futures(diff_json_pair_job, jobs, workers)
+        results = (future.result() for _, future in futures)
+    else:
+        futures = None
+        results = (diff_json_pair_job(*job) for job in jobs)
+    try:
+        for result in results:
+            if 'error' in result:
+                totals['failed'] += 1
+            else:
+                totals['identical' if result['identical'] else 'different'] += 1
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+    finally:
+        if futures:
+            futures.close()
+    yield json.dumps({'type': 'summary', **totals}) + '\n'
+
+
+def select_json_batch_archive_files(entries):
+    """
+    Pick the files under recorded/ or current/ from (path, size, member) archive entries, as
+    (side, name, member). Raises ValueError once the archive has too many files or their
+    uncompressed sizes add up past JSON_BATCH_MAX_ARCHIVE_BYTES, before anything is extracted;
+    sizes come from the archive headers, and extraction never reads past them.
+    """
+    files, total = [], 0
+    for count, (path, size, member) in enumerate(entries, 1):
+        if count > JSON_BATCH_MAX_ARCHIVE_FILES:
+            raise ValueError(f"archive has more than {JSON_BATCH_MAX_ARCHIVE_FILES} files")
+        parts = path.replace('\\', '/').split('/')
+        for position, part in enumerate(parts[:-1]):
+            if part in JSON_BATCH_ARCHIVE_DIRS:
+                total += size
+                if total > JSON_BATCH_MAX_ARCHIVE_BYTES:
+                    raise ValueError(f"archive files exceed {JSON_BATCH_MAX_ARCHIVE_BYTES // (1024 * 1024)} MB uncompressed")
+                files.append((JSON_BATCH_ARCHIVE_DIRS.index(part), '/'.join(parts[position + 1:]), member))
+                break
+    return files
+
+
+def read_json_batch_archive(upload):
+    """
+    Pair up the files of a zip or tar(.gz) upload by their path under the recorded/ and current/
+    directories (at any depth). Returns (name, text1, text2, raw) tuples; a file with no
+    counterpart becomes a pair with None on the missing side, which fails in the worker.
+    The upload is read from its spooled stream and only checked members are extracted.
+    """
+    stream = upload.stream
+    if zipfile.is_zipfile(stream):
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                files = select_json_batch_archive_files(
+                    (info.filename, info.file_size, info) for info in archive.infolist() if not info.is_dir())
+                contents = [(side, name, archive.read(info)) for side, name, info in files]
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid zip archive: {e}")
+    else:
+        stream.seek(0)
+        try:
+            with tarfile.open(fileobj=stream) as archive:
+                files = select_json_batch_archive_files(
+                    (member.name, member.size, member) for member in archive if member.isfile())
+                contents = [(side, name, archive.extractfile(member).read()) for side, name, member in files]
+        except tarfile.TarError:
+            raise ValueError("archive must be a zip or tar file")
+
+    sides = ({}, {})
+    for side, name, content in contents:
+        sides[side][name] = content
+    names = sorted(set(sides[0]) | set(sides[1]))
+    if not names:
+        raise ValueError(f"archive has no files under {' or '.join(d + '/' for d in JSON_BATCH_ARCHIVE_DIRS)}")
+    return [(name, sides[0].get(name), sides[1].get(name), True) for name in names]
+
+
+def json_syntax_error(expect, stack, char, offset):
+    """The ValueError for a token the event parser did not expect"""
+    if expect == 'comma':
+        if not stack:
+            return ValueError(f"Unexpected '{char}' at byte {offset}")
+        expect = stack[-1]
+    return ValueError(f"Expected {JSON_EXPECTED_TOKENS[expect]} at byte {offset}, found '{char}'")
+
+
+def iter_json_events(f, marks=None, offset=0):
+    """
+    Incrementally parse a JSON document from a binary file into events: ('start_map', None),
+    ('map_key', key), ('end_map', None), ('start_array', None), ('end_array', None) and
+    ('value', value). Memory is one read chunk plus the container stack, whatever the size of
+    the document. Several top-level values (NDJSON) come out one after another; a token out of
+    place raises ValueError with its byte offset.
+
+    Containers that fit in the buffer are decoded whole by the C decoder and come out as a single
+    'value' event, with their raw text in marks[1]. The file is read as latin-1 so buffer
+    positions are byte offsets: marks[0] is the offset just past the latest ':' (where an
+    object member's value starts).
+    """
+    buffer, pos, eof = '', 0, False
+    stack = []
+    # Next token: 'value', 'first_value' (a value or ']'), 'key', 'first_key' (a key or '}'),
+    # 'colon' or 'comma' (',' or the closing bracket; at the top level, the next document)
+    expect = 'value'
+    if marks is None:
+        marks = [offset, None]
+    if not offset and f.read(3) != b'\xef\xbb\xbf':
+        f.seek(0)
+    consumed = f.tell()
+
+    while True:
+        pos = JSON_WHITESPACE_PATTERN.match(buffer, pos).end()
+        if not eof and pos + JSON_STREAM_LOOKAHEAD >= len(buffer):
+            chunk = f.read(JSON_STREAM_CHUNK_BYTES).decode('latin-1')
+            consumed += pos
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        if pos >= len(buffer):
+            if stack:
+                raise ValueError("Unexpected end of JSON document")
+            return
+        char = buffer[pos]
+        value_allowed = expect == 'value' or expect == 'first_value' or expect == 'comma' and not stack
+
+        if char == '"':
+            is_key = expect == 'key' or expect == 'first_key'
+            if not is_key and not value_allowed:
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            end = JSON_STRING_BODY_PATTERN.match(buffer, pos + 1).end()
+            if end == len(buffer) or buffer[end] == '\\':
+                # The string runs past the buffer: read on until its closing quote, scanning only
+                # the new data (a chunk may start with the character a backslash escapes)
+                parts = [buffer[pos:]]
+                escaped = end < len(buffer)
+                while True:
+                    chunk = '' if eof else f.read(JSON_STREAM_CHUNK_BYTES).decode('latin-1')
+                    if not chunk:
+                        raise ValueError(f"Unterminated string at byte {consumed + pos}")
+                    parts.append(chunk)
+                    end = JSON_STRING_BODY_PATTERN.match(chunk, int(escaped)).end()
+                    if end < len(chunk) and chunk[end] != '\\':
+                        break
+                    escaped = end < len(chunk)
+                consumed += pos
+                buffer, pos = ''.join(parts), 0
+                end += len(buffer) - len(chunk)
+                del parts, chunk
+            if buffer[end] != '"':
+                raise ValueError(f"Invalid control character in string at byte {consumed + end}")
+            try:
+                value, end = json.decoder.scanstring(buffer, pos + 1)
+            except ValueError:
+                raise ValueError(f"Invalid string at byte {consumed + pos}")
+            if not value.isascii():
+                value = json.decoder.scanstring(buffer[pos + 1:end].encode('latin-1').decode('utf-8'), 0)[0]
+            pos = end
+            if is_key:
+                expect = 'colon'
+                yield 'map_key', value
+            else:
+                expect = 'comma'
+                yield 'value', value
+        elif char == '{' or char == '[':
+            if not value_allowed:
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            try:
+                value, end = JSON_DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                if pos and not eof:
+                    # Retry with the container at the start of a full buffer
+                    chunk = f.read(JSON_STREAM_CHUNK_BYTES).decode('latin-1')
+                    consumed += pos
+                    buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                    continue
+            else:
+                raw = buffer[pos:end]
+                if not raw.isascii():
+                    value = json.loads(raw.encode('latin-1').decode('utf-8'))
+                marks[1] = raw
+                pos = end
+                expect = 'comma'
+                yield 'value', value
+                continue
+            # Too large for the buffer (or invalid): stream it event by event
+            pos += 1
+            stack.append(char)
+            expect = 'first_key' if char == '{' else 'first_value'
+            yield ('start_map' if char == '{' else 'start_array'), None
+        elif char == '}' or char == ']':
+            if not stack:
+                raise ValueError(f"Unexpected '{char}' at byte {consumed + pos}")
+            if (stack[-1] != ('{' if char == '}' else '[')
+                    or expect not in ('comma', 'first_key' if char == '}' else 'first_value')):
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            stack.pop()
+            pos += 1
+            expect = 'comma'
+            yield ('end_map' if char == '}' else 'end_array'), None
+        elif char == ',':
+            if expect != 'comma' or not stack:
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            pos += 1
+            expect = 'key' if stack[-1] == '{' else 'value'
+        elif char == ':':
+            if expect != 'colon':
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            pos += 1
+            expect = 'value'
+            marks[0] = consumed + pos
+        else:
+            if not value_allowed:
+                raise json_syntax_error(expect, stack, char, consumed + pos)
+            match = JSON_NUMBER_PATTERN.match(buffer, pos)
+            if match:
+                if match.end() == len(buffer) and not eof:
+                    chunk = f.read(JSON_STREAM_CHUNK_BYTES).decode('latin-1')
+                    consumed += pos
+                    buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                    continue
+                pos = match.end()
+                expect = 'comma'
+                yield 'value', float(match.group()) if match.group(1) or match.group(2) else int(match.group())
+                continue
+            for literal, value in JSON_LITERALS:
+                if buffer.startswith(literal, pos):
+                    pos += len(literal)
+                    expect = 'comma'
+                    yield 'value', value
+                    break
+            else:
+                raise ValueError(f"Unexpected '{char}' at byte {consumed + pos}")
+
+
+def iter_json_value_events(value):
+    """The parse events of an in-memory value"""
+    if type(value) is dict:
+        yield 'start_map', None
+        for key, item in value.items():
+            yield 'map_key', key
+            yield from iter_json_value_events(item)
+        yield 'end_map', None
+    elif type(value) is list:
+        yield 'start_array', None
+        for item in value:
+            yield from iter_json_value_events(item)
+        yield 'end_array', None
+    else:
+        yield 'value', value
+
+
+def open_json_event_source(path, offset=0):
+    """Parse events of a JSON file (or of the value starting at `offset`), for the streaming diff"""
+    f = open(path, 'rb')
+    f.seek(offset)
+    marks = [offset, None]
+    return {'path': path, 'file': f, 'marks': marks, 'events': iter_json_events(f, marks, offset)}
+
+
+def json_value_event_source(value):
+    """Parse events of an in-memory value, to diff it against a streamed one"""
+    return {'path': None, 'file': None, 'marks': [0, None], 'events': iter_json_value_events(value)}
+
+
+def close_json_event_source(source):
+    if source['file'] is not None:
+        source['file'].close()
+
+
+def read_json_event_value(events, event, limit=None):
+    """
+    Build the value that starts with `event` from an event stream. With `limit`, only that many
+    events are kept and the rest of the value is consumed and dropped.
+    Returns (value, complete).
+    """
+    kind, value = event
+    if kind == 'value':
+        return value, True
+    root = {} if kind == 'start_map' else []
+    stack, depth, kept, complete, key = [root], 1, 1, True, None
+
+    for kind, value in events:
+        if kind == 'map_key':
+            key = value
+            continue
+        if kind == 'end_map' or kind == 'end_array':
+            if len(stack) == depth:
+                stack.pop()
+            depth -= 1
+            if not depth:
+                return root, complete
+            continue
+
+        # Only values directly inside a kept container can be kept
+        keep = len(stack) == depth and (limit is None or kept < limit)
+        item = value if kind == 'value' else ({} if kind == 'start_map' else [])
+        if keep:
+            parent = stack[-1]
+            if type(parent) is dict:
+                parent[key] = item
+            else:
+                parent.append(item)
+            kept += 1
+        else:
+            complete = False
+        if kind != 'value':
+            depth += 1
+            if keep:
+                stack.append(item)
+    raise ValueError("Unexpected end of JSON document")
+
+
+def json_stream_difference(difference_type, path, events1=None, event1=None, events2=None, event2=None):
+    """A difference whose values are read from the event streams (cut short if they are large)"""
+    difference = {'type': difference_type, 'path': path}
+    for field, events, event in (('value1', events1, event1), ('value2', events2, event2)):
+        if events is not None:
+            difference[field], complete = read_json_event_value(events, event, JSON_STREAM_VALUE_EVENTS)
+            if not complete:
+                difference['truncated'] = True
+    return difference
+
+
+def hold_json_member(source):
+    """
+    Consume the object member value after the current key so it can be compared later: values
+    up to JSON_STREAM_HOLD_BYTES are kept, larger ones by file offset to be parsed again.
+    Returns (value, offset).
+    """
+    events = source['events']
+    event = next(events)
+    offset = source['marks'][0]  # set by the ':' parsed just before the value
+    if source['path'] is None:
+        return read_json_event_value(events, event)[0], None
+    kind, value = event
+    if kind == 'value':
+        if type(value) in JSON_CONTAINER_TYPES:
+            size = len(source['marks'][1])
+        else:
+            size = len(value) if type(value) is str else 0
+        if size <= JSON_STREAM_HOLD_BYTES:
+            return value, None
+    else:
+        # Streamed containers are larger than the read buffer: skip past without keeping anything
+        read_json_event_value(events, event, 0)
+    return None, offset
+
+
+def open_held_json_member(source, held):
+    value, offset = held
+    if offset is None:
+        return json_value_event_source(value)
+    return open_json_event_source(source['path'], offset)
+
+
+def iter_held_json_differences(source1, source2, held1, held2, path):
+    """Diff two held member values (either may instead be the live value on its side)"""
+    if held1 is not None and held2 is not None and held1[1] is None and held2[1] is None:
+        yield from iter_json_child_differences(build_json_merkle_tree(held1[0]), build_json_merkle_tree(held2[0]), path)
+        return
+    member1 = source1 if held1 is None else open_held_json_member(source1, held1)
+    member2 = source2 if held2 is None else open_held_json_member(source2, held2)
+    try:
+        yield from iter_streaming_json_differences(member1, member2, next(member1['events']),
+                                                   next(member2['events']), path)
+    finally:
+        if held1 is not None:
+            close_json_event_source(member1)
+        if held2 is not None:
+            close_json_event_source(member2)
+
+
+def iter_held_json_difference(difference_type, source, held, path):
+    """The added/removed difference for a member value that was held"""
+    member = open_held_json_member(source, held)
+    try:
+        events = member['events']
+        if difference_type == 'removed':
+            yield json_stream_difference('removed', path, events, next(events))
+        else:
+            yield json_stream_difference('added', path, events2=events, event2=next(events))
+    finally:
+        close_json_event_source(member)
+
+
+def iter_streaming_json_differences(source1, source2, event1, event2, path=''):
+    """
+    Diff the values starting with event1/event2 in lockstep, with findDifferences() semantics
+    (arrays index by index, objects key by key). Memory is the stack of open containers plus,
+    for each object member that appears in a different order on each side, its key and either
+    its value (up to JSON_STREAM_HOLD_BYTES) or its file offset, until they pair up.
+    """
+    kind1, kind2 = event1[0], event2[0]
+    if kind1 == 'value' and kind2 == 'value':
+        value1, value2 = event1[1], event2[1]
+        if type(value1) in JSON_CONTAINER_TYPES or type(value2) in JSON_CONTAINER_TYPES:
+            # Identical raw text needs no diff, anything else is small enough for the tree diff
+            if (type(value1) not in JSON_CONTAINER_TYPES or type(value2) not in JSON_CONTAINER_TYPES
+                    or source1['marks'][1] != source2['marks'][1]):
+                yield from iter_json_child_differences(build_json_merkle_tree(value1),
+                                                       build_json_merkle_tree(value2), path)
+        elif json_leaf_token(value1) != json_leaf_token(value2):
+            yield {'type': 'changed', 'path': path, 'value1': value1, 'value2': value2}
+        return
+
+    # A decoded container facing one that is streamed is replayed as events
+    if kind1 == 'value' and type(event1[1]) in JSON_CONTAINER_TYPES and kind2 != 'value':
+        source1 = json_value_event_source(event1[1])
+        event1 = next(source1['events'])
+        kind1 = event1[0]
+    if kind2 == 'value' and type(event2[1]) in JSON_CONTAINER_TYPES and kind1 != 'value':
+        source2 = json_value_event_source(event2[1])
+        event2 = next(source2['events'])
+        kind2 = event2[0]
+
+    if kind1 == 'start_map' and kind2 == 'start_map':
+        yield from iter_streaming_object_differences(source1, source2, path)
+    elif kind1 == 'start_array' and kind2 == 'start_array':
+        yield from iter_streaming_array_differences(source1, source2, path)
+    else:
+        yield json_stream_difference('changed', path, source1['events'], event1, source2['events'], event2)
+
+
+def iter_streaming_array_differences(source1, source2, path):
+    """Diff two open arrays element by element"""
+    events1, events2 = source1['events'], source2['events']
+    index = 0
+    event1, event2 = next(events1), next(events2)
+    while event1[0] != 'end_array' and event2[0] != 'end_array':
+        yield from iter_streaming_json_differences(source1, source2, event1, event2, f"{path}[{index}]")
+        index += 1
+        event1, event2 = next(events1), next(events2)
+    while event1[0] != 'end_array':
+        yield json_stream_difference('removed', f"{path}[{index}]", events1, event1)
+        index += 1
+        event1 = next(events1)
+    while event2[0] != 'end_array':
+        yield json_stream_difference('added', f"{path}[{index}]", events2=events2, event2=event2)
+        index += 1
+        event2 = next(events2)
+
+
+def iter_streaming_object_differences(source1, source2, path):
+    """
+    Diff two open objects member by member. Members in the same order are diffed as they
+    stream past; out-of-order members are held until their counterpart shows up.
+    """
+    events1, events2 = source1['events'], source2['events']
+    pending1, pending2 = {}, {}
+
+    event1, event2 = next(events1), next(events2)
+    while event1[0] == 'map_key' and event2[0] == 'map_key':
+        key1, key2 = event1[1], event2[1]
+        if key1 == key2:
+            yield from iter_streaming_json_differences(source1, source2, next(events1), next(events2),
+                                                       json_child_path(path, key1))
+        else:
+            held1, held2 = hold_json_member(source1), hold_json_member(source2)
+            if key1 in pending2:
+                yield from iter_held_json_differences(source1, source2, held1, pending2.pop(key1),
+                                                      json_child_path(path, key1))
+            else:
+                pending1[key1] = held1
+            if key2 in pending1:
+                yield from iter_held_json_differences(source1, source2, pending1.pop(key2), held2,
+                                                      json_child_path(path, key2))
+            else:
+                pending2[key2] = held2
+        event1, event2 = next(events1), next(events2)
+
+    # One side is done, so the other side's members either pair with a held one or are new
+    while event1[0] == 'map_key':
+        key = event1[1]
+        if key in pending2:
+            yield from iter_held_json_differences(source1, source2, None, pending2.pop(key),
+                                                  json_child_path(path, key))
+        else:
+            yield json_stream_difference('removed', json_child_path(path, key), events1, next(events1))
+        event1 = next(events1)
+    while event2[0] == 'map_key':
+        key = event2[1]
+        if key in pending1:
+            yield from iter_held_json_differences(source1, source2, pending1.pop(key), None,
+                                                  json_child_path(path, key))
+        else:
+            yield json_stream_difference('added', json_child_path(path, key), events2=events2, event2=next(events2))
+        event2 = next(events2)
+    for key, held in pending1.items():
+        yield from iter_held_json_difference('removed', source1, held, json_child_path(path, key))
+    for key, held in pending2.items():
+        yield from iter_held_json_difference('added', source2, held, json_child_path(path, key))
+
+
+def iter_streaming_json_diff_lines(path1, path2):
+    """
+    Stream the differences between two JSON files as NDJSON lines, followed by a summary line
+    with the added/removed/changed counts
+    """
+    stats = {'added': 0, 'removed': 0, 'changed': 0}
+    source1 = open_json_event_source(path1)
+    source2 = open_json_event_source(path2)
+    try:
+        try:
+            event1, event2 = next(source1['events']), next(source2['events'])
+        except StopIteration:
+            raise ValueError("Both files must contain a JSON document")
+        for difference in iter_streaming_json_differences(source1, source2, event1, event2):
+            stats[difference['type']] += 1
+            yield json.dumps(difference, ensure_ascii=False) + '\n'
+        for source in (source1, source2):
+            if next(source['events'], None) is not None:
+                raise ValueError("Unexpected data after the JSON document")
+    finally:
+        close_json_event_source(source1)
+        close_json_event_source(source2)
+    yield json.dumps({'type': 'summary', 'identical': not any(stats.values()), 'stats': stats}) + '\n'
+
+
+def parse_json_array_options(data):
+    """Validate the array_strategy/array_key options of a request body or form"""
+    array_strategy = data.get("array_strategy") or "index"
+    array_key = data.get("array_key") or None
+    if array_strategy not in JSON_ARRAY_STRATEGIES:
+        raise ValueError(f"array_strategy must be one of: {', '.join(JSON_ARRAY_STRATEGIES)}")
+    if array_strategy == "keyed" and not isinstance(array_key, str):
+        raise ValueError("array_key is required for keyed array matching")
+    return {"array_strategy": array_strategy, "array_key": array_key}
+
+
+def parse_json_compare_request():
+    """
+    Parse a {"json1": ..., "json2": ..., "array_strategy": ..., "array_key": ...} request body
+    into the two documents and the array diff options
+    """
+    try:
+        data = json.loads(request.get_data())
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {str(e)}")
+    if not isinstance(data, dict) or "json1" not in data or "json2" not in data:
+        raise ValueError("Both json1 and json2 are required")
+    return data["json1"], data["json2"], parse_json_array_options(data)
+
+
+def parse_json_batch_request():
+    """
+    Parse a batch comparison request into (name, document1, document2, raw) pairs and the array
+    diff options: either a {"pairs": [{"name", "json1", "json2"}, ...]} body, or a multipart
+    `archive` (see read_json_batch_archive()) with the options as form fields
+    """
+    if "archive" in request.files:
+        return read_json_batch_archive(request.files["archive"]), parse_json_array_options(request.form)
+
+    try:
+        data = json.loads(request.get_data())
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {str(e)}")
+    if not isinstance(data, dict) or not isinstance(data.get("pairs"), list) or not data["pairs"]:
+        raise ValueError("pairs (a list of {name, json1, json2}) or an archive upload is required")
+    pairs = []
+    for position, pair in enumerate(data["pairs"]):
+        if not isinstance(pair, dict) or "json1" not in pair or "json2" not in pair:
+            raise ValueError(f"Pair {position} needs both json1 and json2")
+        pairs.append((str(pair.get("name", position)), pair["json1"], pair["json2"], False))
+    return pairs, parse_json_array_options(data)
+
+
+@app.route("/api/json-compare/diff", methods=["POST"])
+@login_required
+def api_json_compare_diff():
+    """
+    Structural diff of two JSON documents.
+    The body is {"json1": <document>, "json2": <document>}, optionally with "array_strategy"
+    (index, lcs or keyed) and "array_key"; the browser splices the raw editor texts into it,
+    so large documents are never parsed client-side.
+    """
+    user_id = session["user_id"]
+    try:
+        document1, document2, options = parse_json_compare_request()
+        limit = min(max(int(request.args.get("limit", JSON_DIFF_MAX_DIFFERENCES)), 0), JSON_DIFF_MAX_DIFFERENCES)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        result = diff_json_documents(document1, document2, limit, **options)
+        log(f"User {user_id} compared JSON documents server-side: {result['stats']}")
+        return jsonify(dict(result, success=True))
+    except Exception as e:
+        log(f"Error comparing JSON documents for user {user_id}: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-def minify_code(code, language):
-    """Convert code to single line (minify)"""
-    import re
-
-    # Remove comments based on language
-    if language in ["javascript", "java", "c", "cpp", "csharp", "go", "rust", "swift", "kotlin", "typescript"]:
-        # Remove single-line comments
-        code = re.sub(r'//.*?$', '', code, flags=re.MULTILINE)
-        # Remove multi-line comments
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    elif language in ["python", "ruby", "bash", "shell"]:
-        # Remove single-line comments
-        code = re.sub(r'#.*?$', '', code, flags=re.MULTILINE)
-    elif language in ["sql"]:
-        # Remove SQL comments
-        code = re.sub(r'--.*?$', '', code, flags=re.MULTILINE)
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    elif language in ["html", "xml"]:
-        # Remove HTML/XML comments
-        code = re.sub(r'<!--.*?-->', '', code, flags=re.DOTALL)
-    elif language in ["css", "scss", "less"]:
-        # Remove CSS comments
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-
-    # Replace multiple spaces with single space
-    code = re.sub(r'[ \t]+', ' ', code)
-
-    # Remove all newlines and replace with space
-    code = re.sub(r'\n+', ' ', code)
-
-    # Remove spaces around operators and special characters (language-specific)
-    if language in ["javascript", "java", "c", "cpp", "csharp", "go", "rust", "swift", "kotlin", "typescript"]:
-        code = re.sub(r'\s*([{}();,:])\s*', r'\1', code)
-        code = re.sub(r'\s*([=+\-*/<>!&|])\s*', r'\1', code)
-    elif language == "python":
-        # Python needs spaces around operators
-        code = re.sub(r'\s*([{}();,:])\s*', r'\1', code)
-
-    # Clean up extra spaces
-    code = re.sub(r'\s+', ' ', code)
-    code = code.strip()
-
-    return code
+@app.route("/api/json-compare/stream-diff", methods=["POST"])
+@login_required
+def api_json_compare_stream_diff():
+    """
+    Streaming diff of two uploaded JSON files (fields file1 and file2, optionally gzip'd),
+    for documents too large to load. Differences are streamed back as NDJSON as they are
+    found, ending with a {"type": "summary"} line (or {"type": "error"} if a file is invalid).
+    Arrays are compared index by index.
+    """
+    user_id = session["user_id"]
+    if "file1" not in request.files or "file2" not in request.files:
+        return jsonify({"success": False, "error": "Both file1 and file2 are required"}), 400
 
+    work_dir = tempfile.mkdtemp(prefix="json-diff-")
+    try:
+        paths = []
+        for field in ("file1", "file2"):
+            path = os.path.join(work_dir, field)
+            request.files[field].save(path)
+            if is_gzip_file(path):
+                # The diff re-reads out-of-order members by offset, so it needs the plain file
+                with gzip.open(path, 'rb') as compressed, open(path + '.json', 'wb') as plain:
+                    written = 0
+                    while True:
+                        chunk = compressed.read(JSON_STREAM_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        if written > JSON_STREAM_MAX_GUNZIP_BYTES:
+                            raise ValueError(f"{field} exceeds {JSON_STREAM_MAX_GUNZIP_BYTES // (1024 * 1024)} MB "
+                                             f"uncompressed")
+                        plain.write(chunk)
+                os.remove(path)
+                path += '.json'
+            paths.append(path)
+    except (ValueError, gzip.BadGzipFile, EOFError) as e:
+        # Corrupt, truncated or too large once decompressed
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log(f"Error receiving JSON files for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    def generate():
+        try:
+            yield from iter_streaming_json_diff_lines(*paths)
+            log(f"User {user_id} compared JSON files server-side (streaming)")
+        except Exception as e:
+            log(f"Error streaming JSON diff for user {user_id}: {str(e)}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@app.route("/api/json-compare/batch", methods=["POST"])
+@login_required
+def api_json_compare_batch():
+    """
+    Diff many document pairs in parallel, e.g. recorded vs. current API responses in CI.
+    Takes a {"pairs": [{"name": ..., "json1": ..., "json2": ...}], "array_strategy": ...} body
+    or a zip/tar `archive` upload with recorded/ and current/ trees. Streams back NDJSON: one
+    line per pair as it finishes (summary counts plus an RFC 6902 patch), then a summary line.
+    """
+    user_id = session["user_id"]
+    try:
+        pairs, options = parse_json_batch_request()
+        if len(pairs) > JSON_BATCH_MAX_PAIRS:
+            raise ValueError(f"At most {JSON_BATCH_MAX_PAIRS} pairs can be compared per batch")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    def generate():
+        try:
+            yield from iter_json_batch_lines(pairs, options)
+            log(f"User {user_id} compared a batch of {len(pairs)} JSON pairs")
+        except Exception as e:
+            log(f"Error in batch JSON comparison for user {user_id}: {str(e)}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+# ==================== END JSON COMPARISON ENGINE ====================
+
+
+# ==================== WEBHOOK REQUEST DIFF ====================
+# Captured webhook requests are diffed server-side with the JSON comparison engine, so neither
+# payload has to be shipped to the browser. Stored rows never change, so results are cached per
+# (user, request pair) until evicted or one of the requests is deleted.
+
+# Diffs are cached within WEBHOOK_DIFF_CACHE_MAX_MB, charged by their serialized size
+WEBHOOK_DIFF_CACHE_ENTRY_OVERHEAD = 200  # bytes charged per entry on top of its JSON
+WEBHOOK_DIFF_FIELDS = ("headers", "query_params", "body")
+webhook_diff_cache = OrderedDict()  # (user_id, request_id1, request_id2) -> (result, charged bytes)
+webhook_diff_cache_usage = {'bytes': 0}
+webhook_diff_cache_lock = threading.Lock()
+
+
+def parse_webhook_request_field(text):
+    """
+    Decode a stored headers/query_params/body column. Raw text bodies (non-JSON content types)
+    that hold a JSON object or array are decoded as well, so their structure gets diffed.
+    """
+    if text is None:
+        return None
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def diff_webhook_requests(request1, request2):
+    """
+    Diff two webhook_responses rows field by field (headers, query params and body, with the
+    method compared as well). Each field gets the structural diff's differences and counts.
+    """
+    fields = {}
+    stats = {'added': 0, 'removed': 0, 'changed': 0}
+    for field in WEBHOOK_DIFF_FIELDS:
+        result = diff_json_documents(parse_webhook_request_field(request1[field]),
+                                     parse_webhook_request_field(request2[field]))
+        fields[field] = result
+        for difference_type, count in result['stats'].items():
+            stats[difference_type] += count
+    method_changed = request1['method'] != request2['method']
+    return {
+        'requests': [
+            {'id': row['id'], 'webhook_id': row['webhook_id'], 'method': row['method'],
+             'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None}
+            for row in (request1, request2)
+        ],
+        'identical': not method_changed and not any(stats.values()),
+        'method_changed': method_changed,
+        'stats': stats,
+        'fields': fields
+    }
+
+
+def cache_webhook_diff(key, result):
+    """Store a diff, evicting least recently used ones until the cache fits its budget"""
+    serialized = json.dumps(result, separators=(',', ':'), ensure_ascii=False)
+    charged = len(serialized.encode('utf-8', 'surrogatepass')) + WEBHOOK_DIFF_CACHE_ENTRY_OVERHEAD
+    max_bytes = WEBHOOK_DIFF_CACHE_MAX_MB * 1024 * 1024
+    if charged > max_bytes // 4:
+        return  # one huge diff would flush everything else
+    with webhook_diff_cache_lock:
+        previous = webhook_diff_cache.pop(key, None)
+        if previous is not None:
+            webhook_diff_cache_usage['bytes'] -= previous[1]
+        webhook_diff_cache[key] = (result, charged)
+        webhook_diff_cache_usage['bytes'] += charged
+        while webhook_diff_cache_usage['bytes'] > max_bytes:
+            webhook_diff_cache_usage['bytes'] -= webhook_diff_cache.popitem(last=False)[1][1]
+
+
+def forget_webhook_diffs(request_id):
+    """Drop cached diffs involving a deleted request"""
+    with webhook_diff_cache_lock:
+        for key in [key for key in webhook_diff_cache if request_id in key[1:]]:
+            webhook_diff_cache_usage['bytes'] -= webhook_diff_cache.pop(key)[1]
+
+
+@app.route("/diff_requests/<int:request_id1>/<int:request_id2>")
+@login_required
+def diff_requests(request_id1, request_id2):
+    """Structural diff of two captured requests of the logged-in user"""
+    user_id = session["user_id"]
+    cache_key = (user_id, request_id1, request_id2)
+    with webhook_diff_cache_lock:
+        entry = webhook_diff_cache.get(cache_key)
+        if entry is not None:
+            webhook_diff_cache.move_to_end(cache_key)
+    if entry is not None:
+        return jsonify(dict(entry[0], success=True, cached=True)), 200
+
+    conn = None
+    cursor = None
+    try:
+        conn = pymysql.connect(**db_config)
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute("""
+            SELECT id, webhook_id, method, headers, body, query_params, timestamp
+            FROM webhook_responses
+            WHERE user_id = %s AND id IN (%s, %s)
+        """, (user_id, request_id1, request_id2))
+        rows = {row['id']: row for row in cursor.fetchall()}
+    except pymysql.MySQLError as err:
+        log(f"Database error fetching requests to diff: {str(err)}")
+        return jsonify({"success": False, "error": str(err)}), 500
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None and conn.open:
+            conn.close()
+
+    if request_id1 not in rows or request_id2 not in rows:
+        return jsonify({"success": False, "error": "Request not found or unauthorized"}), 404
+
+    try:
+        result = diff_webhook_requests(rows[request_id1], rows[request_id2])
+    except Exception as e:
+        log(f"Error diffing requests {request_id1} and {request_id2} for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    cache_webhook_diff(cache_key, result)
+    log(f"User {user_id} diffed requests {request_id1} and {request_id2}: {result['stats']}")
+    return jsonify(dict(result, success=True, cached=False)), 200
+
+
+# ==================== END WEBHOOK REQUEST DIFF ====================
+
+
+# ==================== WEBHOOK TRAFFIC DRIFT ====================
+# Window-over-window drift of the bodies delivered to one webhook id, e.g. yesterday vs. today.
+# A background job streams both windows' rows from the database in one unbuffered pass, keeping
+# only aggregates per window: canonical body digests (set differences) and, per JSON path, how
+# often it is present, its types and how often it changes between consecutive deliveries.
+#
+# Jobs run in the server process that accepted them, from a bounded queue served by
+# WEBHOOK_DRIFT_WORKERS threads, so at most that many cursors are open per process. Their state
+# is kept in WEBHOOK_DRIFT_DIR, so any process on the host can answer a poll; the accepting
+# process holds a lock on the job until it finishes, which tells the others if it went away.
+
+WEBHOOK_DRIFT_FETCH_ROWS = 500  # rows fetched per round trip from the unbuffered cursor
+WEBHOOK_DRIFT_MAX_PATHS = 5000  # distinct paths tracked per window (dynamic keys can be unbounded)
+WEBHOOK_DRIFT_REPORT_PATHS = 200  # most drifted paths included in a report
+WEBHOOK_DRIFT_EXAMPLES = 10  # example request ids per body set difference
+WEBHOOK_DRIFT_JOB_TTL_HOURS = 24  # finished jobs are forgotten after this long
+WEBHOOK_DRIFT_MAX_QUEUED = 20  # jobs waiting per server process; further submissions are refused
+WEBHOOK_DRIFT_JOB_FINISHED = ("completed", "failed")
+JSON_ARRAY_INDEX_PATTERN = re.compile(r'\[\d+\]')
+webhook_drift_job_queue = Queue(maxsize=WEBHOOK_DRIFT_MAX_QUEUED)  # (job, lock file)
+webhook_drift_worker_lock = threading.Lock()
+webhook_drift_workers_started = False
+
+
+def json_type_name(value):
+    if value is None:
+        return 'null'
+    if value is True or value is False:
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    return 'object' if isinstance(value, dict) else 'array'
+
+
+def collect_json_path_types(value, path, paths):
+    """Add the paths of a document (array elements as [*]) and the JSON types seen at each"""
+    types = paths.get(path)
+    if types is None:
+        paths[path] = types = set()
+    types.add(json_type_name(value))
+    if isinstance(value, dict):
+        for key, child in value.items():
+            collect_json_path_types(child, json_child_path(path, key), paths)
+    elif isinstance(value, list):
+        for child in value:
+            collect_json_path_types(child, f"{path}[*]", paths)
+
+
+def canonical_json_digest(tree):
+    """Digest of a Merkle tree's document: equal for documents the structural diff calls identical"""
+    token = tree[0]
+    if type(token) is bytes and len(token) == 16:
+        return token
+    return hashlib.blake2b(marshal.dumps(token, 2), digest_size=16, person=b'$').digest()
+
+
+def new_webhook_drift_window(start, end):
+    return {'start': start, 'end': end, 'requests': 0, 'pairs': 0, 'previous': None,
+            'digests': {}, 'paths': {}, 'paths_truncated': False}
+
+
+def add_webhook_drift_body(window, request_id, body):
+    """Fold one delivered body into its window's aggregates"""
+    tree = build_json_merkle_tree(body)
+    digest = canonical_json_digest(tree)
+    entry = window['digests'].get(digest)
+    if entry is None:
+        window['digests'][digest] = [1, request_id]
+    else:
+        entry[0] += 1
+
+    body_paths = {}
+    collect_json_path_types(body, '', body_paths)
+    changed = set()
+    if window['previous'] is not None:
+        window['pairs'] += 1
+        for difference in iter_json_differences(window['previous'], tree):
+            changed.add(JSON_ARRAY_INDEX_PATTERN.sub('[*]', difference['path']))
+    window['previous'] = tree
+    window['requests'] += 1
+
+    paths = window['paths']
+    for path in body_paths.keys() | changed:
+        stats = paths.get(path)
+        if stats is None:
+            if len(paths) >= WEBHOOK_DRIFT_MAX_PATHS:
+                window['paths_truncated'] = True
+                continue
+            # [bodies containing the path, consecutive deliveries that changed it, type -> count]
+            paths[path] = stats = [0, 0, {}]
+        if path in body_paths:
+            stats[0] += 1
+            for type_name in body_paths[path]:
+                stats[2][type_name] = stats[2].get(type_name, 0) + 1
+        if path in changed:
+            stats[1] += 1
+
+
+def webhook_drift_set_difference(window, other):
+    """Distinct bodies of `window` never delivered in `other`, with a few example request ids"""
+    only = [entry for digest, entry in window['digests'].items() if digest not in other['digests']]
+    return {
+        'distinct_bodies': len(only),
+        'requests': sum(entry[0] for entry in only),
+        'example_request_ids': sorted(entry[1] for entry in only)[:WEBHOOK_DRIFT_EXAMPLES]
+    }
 
-def format_code_standard(code, language):
-    """Format code with Postman-style beautify (2-space indentation)"""
-    import re
-    import json
 
-    # Special handling for JSON
-    if language == "json":
+def build_webhook_drift_report(window1, window2):
+    """Aggregate drift between two windows: body set differences and the most drifted paths"""
+    def rate(count, total):
+        return round(count / total, 4) if total else 0.0
+
+    paths = []
+    for path in window1['paths'].keys() | window2['paths'].keys():
+        sides = []
+        for window in (window1, window2):
+            present, changed, types = window['paths'].get(path, (0, 0, {}))
+            sides.append({'presence': rate(present, window['requests']),
+                          'change_rate': rate(changed, window['pairs']), 'types': types})
+        side1, side2 = sides
+        if not side1['presence'] and side2['presence']:
+            status = 'added'
+        elif side1['presence'] and not side2['presence']:
+            status = 'removed'
+        elif side1['presence'] and side1['types'].keys() != side2['types'].keys():
+            status = 'type_changed'
+        else:
+            status = None
+        drift = (abs(side2['presence'] - side1['presence']) + abs(side2['change_rate'] - side1['change_rate'])
+                 + (1 if status else 0))
+        if drift:
+            paths.append({'path': path or '(body)', 'status': status, 'drift': round(drift, 4),
+                          'window1': side1, 'window2': side2})
+    paths.sort(key=lambda entry: (-entry['drift'], entry['path']))
+
+    return {
+        'windows': [
+            {'start': window['start'].isoformat(), 'end': window['end'].isoformat(),
+             'requests': window['requests'], 'distinct_bodies': len(window['digests']),
+             'paths_truncated': window['paths_truncated']}
+            for window in (window1, window2)
+        ],
+        'bodies': {
+            'common_distinct_bodies': sum(1 for digest in window1['digests'] if digest in window2['digests']),
+            'only_in_window1': webhook_drift_set_difference(window1, window2),
+            'only_in_window2': webhook_drift_set_difference(window2, window1)
+        },
+        'drifted_paths': len(paths),
+        'paths': paths[:WEBHOOK_DRIFT_REPORT_PATHS]
+    }
+
+
+def webhook_drift_job_path(job_id, extension='json'):
+    return os.path.join(WEBHOOK_DRIFT_DIR, f"{job_id}.{extension}")
+
+
+def load_webhook_drift_job(job_id, user_id=None):
+    """Load a drift job's state; with user_id, only if the job belongs to that user"""
+    if not COMPARISON_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(webhook_drift_job_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if user_id is not None and job.get('user_id') != user_id:
+        return None
+    return job
+
+
+def save_webhook_drift_job(job):
+    job['updated_at'] = datetime.now(timezone.utc).isoformat()
+    write_json_atomic(webhook_drift_job_path(job['job_id']), job)
+
+
+def cleanup_webhook_drift_jobs():
+    """Delete jobs (and their lock files) not updated for WEBHOOK_DRIFT_JOB_TTL_HOURS"""
+    if not os.path.isdir(WEBHOOK_DRIFT_DIR):
+        return
+    cutoff = time.time() - WEBHOOK_DRIFT_JOB_TTL_HOURS * 3600
+    for name in os.listdir(WEBHOOK_DRIFT_DIR):
+        job_id, extension = os.path.splitext(name)
+        if extension != '.json':
+            continue
         try:
-            parsed = json.loads(code)
-            return json.dumps(parsed, indent=2, ensure_ascii=False)
-        except:
-            pass  # Fall back to regular formatting if JSON parsing fails
-
-    # First, split code by common delimiters to ensure proper line breaks
-    if language in ["javascript", "java", "c", "cpp", "csharp", "go", "rust", "swift", "kotlin", "typescript", "css", "scss", "less", "php"]:
-        # Add line breaks after opening braces and before closing braces
-        code = re.sub(r'\{', '{\n', code)
-        code = re.sub(r'\}', '\n}\n', code)
-        code = re.sub(r';', ';\n', code)
-        # Clean up multiple newlines
-        code = re.sub(r'\n+', '\n', code)
-
-    lines = code.split('\n')
-    formatted_lines = []
-    indent_level = 0
-    indent_char = '  '  # 2 spaces (Postman/Beautify style)
-
-    for line in lines:
-        stripped = line.strip()
-
-        if not stripped:
+            # A running job's state is saved after every batch of rows, so it never looks stale
+            if os.path.getmtime(os.path.join(WEBHOOK_DRIFT_DIR, name)) < cutoff:
+                os.remove(webhook_drift_job_path(job_id))
+                os.remove(webhook_drift_job_path(job_id, 'lock'))
+        except OSError:
             continue
 
-        # Decrease indent for closing braces/brackets
-        if language in ["javascript", "java", "c", "cpp", "csharp", "go", "rust", "swift", "kotlin", "typescript", "css", "scss", "less", "php", "json"]:
-            if stripped.startswith('}') or stripped.startswith(']'):
-                indent_level = max(0, indent_level - 1)
-        elif language == "python":
-            # Python indentation based on dedent keywords
-            if stripped.startswith('elif ') or stripped.startswith('else:') or stripped.startswith('except') or stripped.startswith('finally:'):
-                indent_level = max(0, indent_level - 1)
-        elif language in ["html", "xml"]:
-            if stripped.startswith('</'):
-                indent_level = max(0, indent_level - 1)
-
-        # Add indented line
-        formatted_lines.append(indent_char * indent_level + stripped)
-
-        # Increase indent for opening braces/brackets
-        if language in ["javascript", "java", "c", "cpp", "csharp", "go", "rust", "swift", "kotlin", "typescript", "css", "scss", "less", "php", "json"]:
-            if stripped.endswith('{') or stripped.endswith('['):
-                indent_level += 1
-            # Handle closing and opening on same line like "}, {"
-            if re.search(r'\},\s*\{', stripped):
-                indent_level = max(0, indent_level - 1)
-        elif language == "python":
-            # Python indentation based on colon
-            if stripped.endswith(':'):
-                indent_level += 1
-        elif language in ["html", "xml"]:
-            # HTML/XML opening tags
-            if re.match(r'<[^/][^>]*>$', stripped) and not re.match(r'<[^>]*/>$', stripped):
-                indent_level += 1
-        elif language == "sql":
-            # SQL formatting - major keywords on new lines
-            if any(stripped.upper().startswith(keyword) for keyword in ['FROM', 'WHERE', 'JOIN', 'LEFT JOIN', 'RIGHT JOIN', 'INNER JOIN', 'GROUP BY', 'ORDER BY', 'HAVING']):
-                indent_level = 1
-
-    formatted_code = '\n'.join(formatted_lines)
-
-    # Clean up excessive blank lines
-    formatted_code = re.sub(r'\n{3,}', '\n\n', formatted_code)
-
-    return formatted_code
 
+def notify_webhook_drift_progress(job):
+    """Push a drift job's progress to the user's SSE connections"""
+    user_id = str(job['user_id'])
+    with queue_lock:
+        if user_id in user_event_queues:
+            for queue in user_event_queues[user_id]:
+                queue.put(json.dumps({
+                    'type': 'webhook_drift_progress',
+                    'job_id': job['job_id'],
+                    'status': job['status'],
+                    'progress': job['progress'],
+                    'error': job.get('error')
+                }))
+
+
+def update_webhook_drift_job(job):
+    save_webhook_drift_job(job)
+    notify_webhook_drift_progress(job)
+
+
+def run_webhook_drift_job(job):
+    """Stream both windows' rows once (oldest first) and build the drift report"""
+    bounds = [(datetime.fromisoformat(window['start']), datetime.fromisoformat(window['end']))
+              for window in job['windows']]
+    windows = [new_webhook_drift_window(start, end) for start, end in bounds]
+    conditions = """
+        user_id = %s AND webhook_id = %s
+        AND ((timestamp >= %s AND timestamp < %s) OR (timestamp >= %s AND timestamp < %s))
+    """
+    params = (job['user_id'], job['webhook_id']) + bounds[0] + bounds[1]
+    conn = None
+    cursor = None
+    try:
+        job['status'] = 'running'
+        conn = pymysql.connect(**db_config)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM webhook_responses WHERE" + conditions, params)
+        job['progress'] = {'rows': 0, 'total_rows': cursor.fetchone()[0]}
+        cursor.close()
+        update_webhook_drift_job(job)
+
+        # Unbuffered: rows arrive in batches instead of the whole result set at once
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        cursor.execute("SELECT id, timestamp, body FROM webhook_responses WHERE" + conditions
+                       + "ORDER BY timestamp, id", params)
+        while True:
+            rows = cursor.fetchmany(WEBHOOK_DRIFT_FETCH_ROWS)
+            if not rows:
+                break
+            for request_id, timestamp, body in rows:
+                # Overlapping windows both count a row
+                matching = [window for window in windows if window['start'] <= timestamp < window['end']]
+                if matching:
+                    body = parse_webhook_request_field(body)
+                    for window in matching:
+                        add_webhook_drift_body(window, request_id, body)
+            job['progress']['rows'] += len(rows)
+            update_webhook_drift_job(job)
+
+        job['report'] = build_webhook_drift_report(*windows)
+        job['status'] = 'completed'
+        log(f"Webhook drift job {job['job_id']} for user {job['user_id']} completed: "
+            f"{job['progress']['rows']} rows, {job['report']['drifted_paths']} drifted paths")
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        log(f"Webhook drift job {job['job_id']} failed: {str(e)}\nStack trace: {traceback.format_exc()}")
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None and conn.open:
+            conn.close()
+    update_webhook_drift_job(job)
+
+
+def webhook_drift_worker():
+    """Run queued drift jobs, releasing each job's lock once it has finished"""
+    while True:
+        job, lock_file = webhook_drift_job_queue.get()
+        try:
+            run_webhook_drift_job(job)
+        except Exception as e:
+            log(f"Error running webhook drift job {job['job_id']}: {str(e)}")
+        finally:
+            lock_file.close()
+
+
+def start_webhook_drift_workers():
+    """Start the drift job workers once"""
+    global webhook_drift_workers_started
+    with webhook_drift_worker_lock:
+        if webhook_drift_workers_started:
+            return
+        webhook_drift_workers_started = True
+        for _ in range(max(1, WEBHOOK_DRIFT_WORKERS)):
+            threading.Thread(target=webhook_drift_worker, daemon=True).start()
+
+
+def check_webhook_drift_job(job):
+    """
+    An unfinished job whose lock nobody holds was accepted by a server process that exited
+    before finishing it; mark it failed (after reloading it under the lock, as it may just have
+    finished). Returns the job's current state.
+    """
+    if job['status'] in WEBHOOK_DRIFT_JOB_FINISHED:
+        return job
+    lock_file = try_lock_file(webhook_drift_job_path(job['job_id'], 'lock'))
+    if lock_file is None:
+        return job
+    try:
+        job = load_webhook_drift_job(job['job_id']) or job
+        if job['status'] not in WEBHOOK_DRIFT_JOB_FINISHED:
+            job['status'] = 'failed'
+            job['error'] = 'Job was interrupted: the server process running it exited'
+            save_webhook_drift_job(job)
+    finally:
+        lock_file.close()
+    return job
+
+
+def parse_webhook_drift_window(window, name):
+    """A {"start": ..., "end": ...} window as naive UTC datetimes (how timestamps are stored)"""
+    if not isinstance(window, dict):
+        raise ValueError(f"{name} must be an object with start and end")
+    bounds = []
+    for field in ("start", "end"):
+        value = window.get(field)
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"{name}.{field} must be an ISO 8601 timestamp")
+        if parsed.tzinfo:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        bounds.append(parsed)
+    if bounds[0] >= bounds[1]:
+        raise ValueError(f"{name}.start must be before {name}.end")
+    return tuple(bounds)
+
+
+@app.route("/api/webhook-drift/jobs", methods=["POST"])
+@login_required
+def api_submit_webhook_drift_job():
+    """
+    Start a drift job comparing two time windows of one webhook id:
+    {"webhook_id": ..., "window1": {"start": ..., "end": ...}, "window2": {...}} (windows are
+    half-open). Progress is pushed as webhook_drift_progress events on /events/<user_id>.
+    """
+    user_id = session["user_id"]
+    data = request.get_json(silent=True) or {}
+    webhook_id = data.get("webhook_id")
+    try:
+        if not isinstance(webhook_id, str) or not webhook_id:
+            raise ValueError("webhook_id is required")
+        bounds = [parse_webhook_drift_window(data.get(name), name) for name in ("window1", "window2")]
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'webhook_id': webhook_id,
+        'status': 'queued',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'windows': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in bounds],
+        'progress': {'rows': 0}
+    }
+    try:
+        cleanup_webhook_drift_jobs()
+        os.makedirs(WEBHOOK_DRIFT_DIR, exist_ok=True)
+        # Held by this process until the job finishes; taken before the job is visible to polls
+        lock_file = try_lock_file(webhook_drift_job_path(job['job_id'], 'lock'))
+        if lock_file is None:
+            raise OSError("could not lock the job")
+        save_webhook_drift_job(job)
+    except Exception as e:
+        log(f"Error starting webhook drift job for user {user_id}: {str(e)}")
+        return jsonify({"success": False, "error": "Failed to start drift job"}), 500
+    try:
+        # The worker gets its own copy, so the response below never sees it half-updated
+        webhook_drift_job_queue.put_nowait((dict(job), lock_file))
+    except Full:
+        lock_file.close()
+        for extension in ('json', 'lock'):
+            os.remove(webhook_drift_job_path(job['job_id'], extension))
+        return jsonify({"success": False, "error": "Too many drift jobs are queued, try again later"}), 503
+    start_webhook_drift_workers()
+
+    log(f"User {user_id} started webhook drift job {job['job_id']} for webhook {webhook_id}")
+    return jsonify({"success": True, "job": job}), 202
+
+
+@app.route("/api/webhook-drift/jobs/<job_id>", methods=["GET"])
+@login_required
+def api_get_webhook_drift_job(job_id):
+    """Status and progress of a drift job, with its report once completed"""
+    user_id = session["user_id"]
+    job = load_webhook_drift_job(job_id, user_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": check_webhook_drift_job(job)})
+
+
+# ==================== END WEBHOOK TRAFFIC DRIFT ====================
+
+
+# ==================== MOCK SERVING LISTENER ====================
+# A bare WSGI app serving only the mock endpoints (/httpcode and /sequence-endpoint).
+# It skips Flask routing, sessions and request/response objects entirely and answers
+# /httpcode from tables precomputed for every code in 100-599. Run it alongside the main
+# app by setting MOCK_SERVER_PORT, on its own with `python app.py --mock-only`, or under
+# any WSGI server (e.g. `gunicorn -w 8 app:mock_app`).
+
+MOCK_METHODS = frozenset(["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"])
+MOCK_BODY_METHODS = frozenset(["POST", "PUT", "PATCH"])
+MOCK_JSON_HEADERS = [("Content-Type", "application/json")]
+
+
+def build_httpcode_response_table():
+    """Precompute the status line, headers and message for every /httpcode/<code> response"""
+    table = {}
+    for code in range(100, 600):
+        message = HTTPCODE_STATUS_MESSAGES.get(code, "Custom Status Code")
+        try:
+            reason = HTTPStatus(code).phrase
+        except ValueError:
+            reason = message
+        headers = [] if code == 204 else list(MOCK_JSON_HEADERS)
+        table[code] = (f"{code} {reason}", headers + STATUS_CODE_EXTRA_HEADERS.get(code, []), message)
+    return table
+
+
+HTTPCODE_RESPONSE_TABLE = build_httpcode_response_table()
 
-# ==================== END CODE FORMATTER ROUTES ====================
+
+def read_mock_request_data(environ):
+    """Decode the request body the same way the Flask mock routes do"""
+    try:
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    raw = environ["wsgi.input"].read(length) if length > 0 else b""
+    if not raw:
+        return None
+
+    content_type = environ.get("CONTENT_TYPE", "")
+    if "application/json" in content_type:
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+    if "application/x-www-form-urlencoded" in content_type:
+        return dict(parse_qsl(raw.decode("utf-8", errors="ignore")))
+    return raw.decode("utf-8", errors="ignore")
+
+
+def mock_json_response(start_response, status_line, headers, body, method):
+    """Send a pre-encoded JSON body (omitted for HEAD requests)"""
+    payload = b"" if method == "HEAD" else json.dumps(body).encode("utf-8")
+    start_response(status_line, headers + [("Content-Length", str(len(payload)))])
+    return [payload]
+
+
+def mock_httpcode(start_response, environ, method, path, code):
+    """Serve /httpcode/<code> from the precomputed response table"""
+    if code < 100 or code > 599:
+        return mock_json_response(start_response, "400 Bad Request", MOCK_JSON_HEADERS,
+                                  {"error": "Invalid status code. Must be between 100-599"}, method)
+
+    request_data = read_mock_request_data(environ) if method in MOCK_BODY_METHODS else None
+    status_line, headers, message = HTTPCODE_RESPONSE_TABLE[code]
+
+    if code == 204:
+        start_response(status_line, headers + [("Content-Length", "0")])
+        return [b""]
+
+    response_body = {
+        "status": code,
+        "message": message,
+        "method": method,
+        "path": path,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    if request_data:
+        response_body["received_data"] = request_data
+    return mock_json_response(start_response, status_line, headers, response_body, method)
+
+
+def mock_sequence(start_response, environ, method, path, user_id, endpoint_name):
+    """Serve /sequence-endpoint/<user_id>/<endpoint_name> without going through Flask"""
+    selection, error = select_sequence_step(user_id, endpoint_name)
+    if error:
+        return mock_json_response(start_response, "404 Not Found", MOCK_JSON_HEADERS, error, method)
+
+    http_code = selection["http_code"]
+    status_line, headers, _ = HTTPCODE_RESPONSE_TABLE[http_code]
+    if http_code == 204:
+        start_response(status_line, headers + [("Content-Length", "0")])
+        return [b""]
+
+    response_data = build_sequence_response_data(selection, user_id, endpoint_name, method, path)
+    if not (selection["payload"] and http_code == 200) and method in MOCK_BODY_METHODS:
+        request_data = read_mock_request_data(environ)
+        if request_data:
+            response_data["received_data"] = request_data
+    return mock_json_response(start_response, status_line, headers, response_data, method)
+
+
+def mock_app(environ, start_response):
+    """WSGI entry point of the lightweight mock-serving listener"""
+    method = environ.get("REQUEST_METHOD", "GET")
+    # WSGI hands PATH_INFO over as latin-1 decoded bytes
+    path = environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8", errors="replace")
+    parts = path.strip("/").split("/")
+
+    try:
+        if method not in MOCK_METHODS:
+            return mock_json_response(start_response, "405 Method Not Allowed", MOCK_JSON_HEADERS,
+                                      {"error": "Method not allowed"}, method)
+        if len(parts) == 2 and parts[0] == "httpcode" and parts[1].isdigit():
+            return mock_httpcode(start_response, environ, method, path, int(parts[1]))
+        if len(parts) == 3 and parts[0] == "sequence-endpoint" and parts[1].isdigit() and parts[2]:
+            return mock_sequence(start_response, environ, method, path, int(parts[1]), parts[2])
+        return mock_json_response(start_response, "404 Not Found", MOCK_JSON_HEADERS,
+                                  {"error": "Not found"}, method)
+    except Exception as e:
+        log(f"Error in mock listener for {path}: {str(e)}")
+        return mock_json_response(start_response, "500 Internal Server Error", MOCK_JSON_HEADERS,
+                                  {"error": "Internal server error", "details": str(e)}, method)
+
+
+def run_mock_server(ssl_context=None):
+    """Serve mock_app on MOCK_SERVER_HOST:MOCK_SERVER_PORT (blocking)"""
+    from werkzeug.serving import run_simple
+
+    log(f"Starting mock listener on {MOCK_SERVER_HOST}:{MOCK_SERVER_PORT}")
+    run_simple(MOCK_SERVER_HOST or "0.0.0.0", int(MOCK_SERVER_PORT), mock_app,
+               threaded=True, ssl_context=ssl_context)
+
+
+# ==================== END MOCK SERVING LISTENER ====================
 
 
 if __name__ == "__main__":
@@ -2811,4 +8124,18 @@ if __name__ == "__main__":
         log("SSL not configured - running without HTTPS")
         ssl_context = None
 
+    if "--mock-only" in sys.argv:
+        if not MOCK_SERVER_PORT:
+            sys.exit("MOCK_SERVER_PORT must be set to run the mock listener")
+        run_mock_server(ssl_context)
+        sys.exit(0)
+
+    # Start the mock listener, resume unfinished log comparison jobs and start NTP refreshes
+    # next to the main app (only once under the debug reloader)
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        if MOCK_SERVER_PORT:
+            threading.Thread(target=run_mock_server, args=(ssl_context,), daemon=True).start()
+        start_log_compare_worker()
+        start_ntp_refresher()
+
     app.run(host=RUNNING_HOST, port=RUNNING_PORT, debug=DEBUG, threaded=True, ssl_context=ssl_context)
@@ -0,0 +1,11 @@
+"""
+Imports app.py for the benchmark scripts (run as `python benchmarks/<name>.py` from anywhere).
+app.py reads its DB settings at import time; nothing benchmarked here touches the database.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_PORT", "3306")
+
+import app as webhook_app  # noqa: E402,F401
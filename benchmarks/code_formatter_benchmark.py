@@ -0,0 +1,87 @@
+"""
+Benchmark: throughput of the tokenizing code formatter and minifier on multi-MB inputs.
+
+Builds an input of about --size-mb per language by repeating a sample that mixes the cases
+a regex pipeline gets wrong (// inside strings and URLs, comment markers in literals, regex
+literals), then times format_code_standard() and minify_code() on it. JSON (as NDJSON) and XML
+go through the streaming event-based formatters.
+
+    python benchmarks/code_formatter_benchmark.py --size-mb 8 --languages javascript,python,sql,json,xml
+"""
+import argparse
+import time
+
+from benchmark_app import webhook_app
+
+SAMPLES = {
+    "javascript": """// Fetch and render item {i}
+const url{i} = "https://api.example.com/v1/items//{i}"; /* not a comment: "//" */
+async function load{i}(id, options = {{}}) {{
+  const pattern = /\\/items\\/(\\d+)/g;
+  for (let n = 0; n < 3; n++) {{ if (id > n) {{ total += id / 2 - -n; }} }}
+  return fetch(`${{url{i}}}?id=${{id}}`, {{ method: 'GET', headers: {{ 'X-Id': id }} }});
+}}
+""",
+    "python": """# Item {i}
+def handler_{i}(event, context=None):
+    url = "https://example.com/#anchor-{i}"  # trailing comment
+    items = [x for x in event.get("items", [])
+             if x and x["id"] != {i}]
+    if not items:
+        return {{"status": 404, "body": '''no # items'''}}
+    else:
+        return {{"status": 200, "count": len(items)}}
+""",
+    "sql": """-- report {i}
+select u.id, u.name, count(o.id) as orders from users u left join orders o on o.user_id = u.id
+where u.created_at between '2024-01-01' and '2024-12-31' and u.email not like '%--test%'
+or u.id in (select user_id from flags where flag = 'vip-{i}') group by u.id, u.name order by orders desc;
+""",
+    "json": """{{"id": {i}, "url": "https://example.com/items//{i}", "tags": ["a", "b"], "price": {i}.5,
+"owner": {{"name": "user-{i}", "active": true, "roles": [], "meta": null}}}}
+""",
+    "xml": """<item id="{i}"><!-- item {i} --><name>Item &amp; {i}</name><link href="https://x.com/{i}"/>
+  <price currency="EUR">{i}.50</price><![CDATA[ a < b ]]><tags><tag>a</tag><tag>b</tag></tags></item>
+""",
+    "css": """/* card {i} */
+.card-{i} > .title, .card-{i}:hover {{ background: url(https://cdn.example.com/bg-{i}.png); color: #333; }}
+@media (max-width: 600px) {{ .card-{i} {{ margin: 0 auto; content: "a // b"; }} }}
+""",
+}
+
+
+def build_input(language, size_mb):
+    sample = SAMPLES[language]
+    parts, size, i = [], 0, 0
+    while size < size_mb * 1024 * 1024:
+        part = sample.format(i=i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--languages", default=",".join(SAMPLES))
+    args = parser.parse_args()
+
+    print(f"{'language':>11} {'MB':>6} {'format':>11} {'minify':>11} {'minified':>9}")
+    for language in args.languages.split(","):
+        code = build_input(language, args.size_mb)
+        size_mb = len(code) / 1024 / 1024
+        _, format_seconds = timed(webhook_app.format_code_standard, code, language)
+        minified, minify_seconds = timed(webhook_app.minify_code, code, language)
+        print(f"{language:>11} {size_mb:>6.1f} {size_mb / format_seconds:>7.1f}MB/s "
+              f"{size_mb / minify_seconds:>7.1f}MB/s {len(minified) / len(code):>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: server-side log comparison time vs. number of worker processes.
+
+Generates a pair of CSV exports (about 10% of rows modified, 2% added and 2% removed)
+and runs run_log_comparison() once per worker count. Roughly 12.5M rows gives ~1 GB
+of input per side.
+
+    python benchmarks/log_compare_benchmark.py --rows 12500000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmark_app import webhook_app
+
+HEADER = "requestId,timestamp,status,latency,path,message\n"
+
+
+def write_exports(directory, rows, seed=7):
+    rng = random.Random(seed)
+    old_path = os.path.join(directory, "original.csv")
+    new_path = os.path.join(directory, "new.csv")
+    with open(old_path, "w") as old, open(new_path, "w") as new:
+        old.write(HEADER)
+        new.write(HEADER)
+        for i in range(rows):
+            line = (f"req-{i:010d},2024-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}Z,"
+                    f"200,{rng.randint(1, 2000)},/api/items/{rng.randint(1, 99999)},\"request {i} handled\"\n")
+            roll = rng.random()
+            if roll >= 0.02:
+                old.write(line)
+            if roll < 0.02 or roll >= 0.04:
+                if roll >= 0.9:
+                    line = line.replace(",200,", ",500,", 1)
+                new.write(line)
+    return old_path, new_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        old_path, new_path = write_exports(directory, args.rows)
+        size_mb = os.path.getsize(old_path) / 1024 / 1024
+        print(f"{args.rows} rows, {size_mb:.0f} MB per side, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+
+        worker_counts = [int(count) for count in args.workers.split(",")]
+        # The shared worker pool is sized once, when it first starts
+        webhook_app.PROCESS_POOL_WORKERS = max(worker_counts)
+        baseline = None
+        for workers in worker_counts:
+            webhook_app.LOG_COMPARE_WORKERS = workers
+            started = time.perf_counter()
+            summary = webhook_app.run_log_comparison(0, old_path, new_path, "requestId")
+            seconds = time.perf_counter() - started
+            shutil.rmtree(webhook_app.log_result_dir(summary["comparison_id"]), ignore_errors=True)
+            baseline = baseline or seconds
+            print(f"{workers:>8} {seconds:>8.1f}s {baseline / seconds:>7.2f}x")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
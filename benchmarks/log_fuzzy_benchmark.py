@@ -0,0 +1,95 @@
+"""
+Benchmark: indexed fuzzy log-row matching vs. the O(n*m) all-pairs scan used in the browser.
+
+Generates N unmatched original rows and N unmatched new rows, half of which are slightly
+edited copies (new key, small typos) of original rows, then runs fuzzy_match_log_records().
+The all-pairs cost is extrapolated from a sample, and recall is checked against an exact
+all-pairs search on that sample.
+
+    python benchmarks/log_fuzzy_benchmark.py --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+import string
+import time
+
+from benchmark_app import webhook_app
+
+COLUMNS = ["requestId", "timestamp", "level", "path", "latency", "message"]
+SAMPLE_SIZE = 10
+
+
+def random_word(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def make_row(rng, i):
+    return {
+        "requestId": f"req-{rng.getrandbits(48):012x}",
+        "timestamp": f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}Z",
+        "level": rng.choice(["INFO", "WARN", "ERROR"]),
+        "path": f"/api/{random_word(rng, 6)}/{rng.randint(1, 9999)}",
+        "latency": str(rng.randint(1, 2000)),
+        "message": " ".join(random_word(rng, rng.randint(3, 9)) for _ in range(6)),
+    }
+
+
+def perturb(rng, row):
+    row = dict(row)
+    row["requestId"] = row["requestId"][:-2] + random_word(rng, 2)
+    message = list(row["message"])
+    for _ in range(2):
+        message[rng.randrange(len(message))] = rng.choice(string.ascii_lowercase)
+    row["message"] = "".join(message)
+    return row
+
+
+def generate(n, seed=7):
+    rng = random.Random(seed)
+    old_records = [{"key": str(i), "row": make_row(rng, i)} for i in range(n)]
+    new_records = []
+    for i, record in enumerate(old_records):
+        row = perturb(rng, record["row"]) if i % 2 == 0 else make_row(rng, n + i)
+        new_records.append({"key": f"n{i}", "row": row})
+    rng.shuffle(new_records)
+    return old_records, new_records
+
+
+def all_pairs_best(old_row, new_records):
+    best, best_similarity = None, 0.0
+    for position, record in enumerate(new_records):
+        similarity = webhook_app.log_row_similarity(old_row, record["row"], COLUMNS)
+        if similarity >= webhook_app.LOG_FUZZY_THRESHOLD and similarity > best_similarity:
+            best, best_similarity = position, similarity
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'indexed':>10} {'matches':>9} {'all-pairs (est.)':>17} {'speedup':>9} {'recall':>7}")
+    for n in (int(size) for size in args.sizes.split(",")):
+        old_records, new_records = generate(n)
+
+        started = time.perf_counter()
+        outcomes = list(webhook_app.fuzzy_match_log_records(old_records, new_records, COLUMNS))
+        indexed_seconds = time.perf_counter() - started
+        matches = {id(o[1]): o[2] for o in outcomes if o[0] == "fuzzy_matched"}
+
+        # Estimate the all-pairs scan from a sample and check recall of the candidate index on it
+        sample = old_records[:SAMPLE_SIZE * 2:2]
+        started = time.perf_counter()
+        expected = [all_pairs_best(record["row"], new_records) for record in sample]
+        all_pairs_seconds = (time.perf_counter() - started) / len(sample) * n
+        found = sum(1 for record, best in zip(sample, expected)
+                    if best is not None and matches.get(id(record)) is new_records[best])
+        wanted = sum(1 for best in expected if best is not None)
+
+        print(f"{n:>9} {indexed_seconds:>9.1f}s {len(matches):>9} {all_pairs_seconds:>16.0f}s "
+              f"{all_pairs_seconds / indexed_seconds:>8.0f}x {found / max(wanted, 1):>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
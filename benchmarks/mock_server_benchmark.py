@@ -0,0 +1,103 @@
+"""
+Benchmark: requests/sec of the lightweight mock listener vs. the Flask /httpcode route.
+
+In-process mode (default) drives both WSGI apps directly, which isolates framework
+overhead from network and server effects:
+
+    python benchmarks/mock_server_benchmark.py --requests 20000
+
+Live mode hits two running servers over HTTP with concurrent clients:
+
+    python benchmarks/mock_server_benchmark.py --live \\
+        --flask-url http://localhost:5000 --mock-url http://localhost:5001 --concurrency 16
+"""
+import argparse
+import io
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_app import webhook_app
+
+CODES = [200, 201, 204, 301, 404, 429, 500, 503, 599]
+BODY = b'{"hello": "world"}'
+
+
+def make_environ(method, path, body=b""):
+    return {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "CONTENT_TYPE": "application/json" if body else "",
+        "CONTENT_LENGTH": str(len(body)) if body else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+
+def run_in_process(wsgi_app, requests):
+    def start_response(status, headers, exc_info=None):
+        return None
+
+    started = time.perf_counter()
+    for i in range(requests):
+        code = CODES[i % len(CODES)]
+        method, body = ("POST", BODY) if i % 2 else ("GET", b"")
+        result = wsgi_app(make_environ(method, f"/httpcode/{code}", body), start_response)
+        for _ in result:
+            pass
+        if hasattr(result, "close"):
+            result.close()
+    return requests / (time.perf_counter() - started)
+
+
+def run_live(base_url, requests, concurrency):
+    def hit(i):
+        code = CODES[i % len(CODES)]
+        try:
+            with urllib.request.urlopen(f"{base_url}/httpcode/{code}") as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            e.read()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(hit, range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--flask-url", default="http://localhost:5000")
+    parser.add_argument("--mock-url", default="http://localhost:5001")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.live:
+        flask_rps = run_live(args.flask_url, args.requests, args.concurrency)
+        mock_rps = run_live(args.mock_url, args.requests, args.concurrency)
+    else:
+        # Warm up both paths before measuring
+        run_in_process(webhook_app.app.wsgi_app, 500)
+        run_in_process(webhook_app.mock_app, 500)
+        flask_rps = run_in_process(webhook_app.app.wsgi_app, args.requests)
+        mock_rps = run_in_process(webhook_app.mock_app, args.requests)
+
+    print(f"Flask /httpcode route : {flask_rps:10.0f} req/s")
+    print(f"Mock listener         : {mock_rps:10.0f} req/s")
+    print(f"Speedup               : {mock_rps / flask_rps:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
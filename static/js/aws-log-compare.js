@@ -6,6 +6,14 @@ let comparisonResults = null;
 let keyColumnIndex = null;
 let intelligentInsights = null;
 
+// Files too large to diff in the browser are compared on the server and paged from there
+const SERVER_COMPARE_THRESHOLD_BYTES = 20 * 1024 * 1024;
+const SERVER_PAGE_SIZE = 100;
+let fileUploads = { 1: null, 2: null };
+let serverComparison = null;
+let serverPageCursors = [null];
+let serverPageIndex = 0;
+
 // Initialize event listeners when DOM is ready
 document.addEventListener('DOMContentLoaded', function() {
     // File upload handlers
@@ -23,6 +31,12 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('results').style.display = 'none';
         document.getElementById('stats').style.display = 'none';
 
+        if (useServerComparison()) {
+            runServerComparison();
+            return;
+        }
+
+        serverComparison = null;
         setTimeout(() => {
             compareLogs();
             document.getElementById('loading').style.display = 'none';
@@ -36,21 +50,13 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('exportBtn').addEventListener('click', exportResults);
 
     // Filter change handlers
-    document.getElementById('showAdded').addEventListener('change', () => {
-        if (comparisonResults) displayResults(comparisonResults);
-    });
+    document.getElementById('showAdded').addEventListener('change', refreshResults);
 
-    document.getElementById('showRemoved').addEventListener('change', () => {
-        if (comparisonResults) displayResults(comparisonResults);
-    });
+    document.getElementById('showRemoved').addEventListener('change', refreshResults);
 
-    document.getElementById('showModified').addEventListener('change', () => {
-        if (comparisonResults) displayResults(comparisonResults);
-    });
+    document.getElementById('showModified').addEventListener('change', refreshResults);
 
-    document.getElementById('showUnchanged').addEventListener('change', () => {
-        if (comparisonResults) displayResults(comparisonResults);
-    });
+    document.getElementById('showUnchanged').addEventListener('change', refreshResults);
 
     // Keyboard shortcuts for paste areas
     document.getElementById('pasteText1').addEventListener('keydown', function(e) {
@@ -102,6 +108,7 @@ function applyPastedData(fileNum) {
             showAlert('Error', 'No valid data rows found in the pasted content');
             return;
         }
+        fileUploads[fileNum] = null;
 
         if (fileNum === 1) {
             file1Data = data;
@@ -126,6 +133,11 @@ function applyPastedData(fileNum) {
 // Handle file upload
 function handleFileUpload(e, fileNum) {
     const file = e.target.files[0];
+    fileUploads[fileNum] = file || null;
+    if (file && isServerSideFile(file)) {
+        prepareServerSideFile(file, fileNum);
+        return;
+    }
     if (file) {
         const reader = new FileReader();
         reader.onload = function(event) {
@@ -153,6 +165,41 @@ function handleFileUpload(e, fileNum) {
     }
 }
 
+// Large or gzip'd exports are never read into the page
+function isServerSideFile(file) {
+    return file.size > SERVER_COMPARE_THRESHOLD_BYTES || file.name.endsWith('.gz');
+}
+
+// Register a file that will be compared on the server; only its header line is read locally
+async function prepareServerSideFile(file, fileNum) {
+    let headers = [];
+    if (!file.name.endsWith('.gz')) {
+        const head = await file.slice(0, 64 * 1024).text();
+        const firstLine = head.split('\n')[0];
+        if (!firstLine.trim().startsWith('{')) {
+            headers = parseCSVLine(firstLine.replace(/\r$/, ''), detectDelimiter(firstLine));
+        }
+    }
+
+    const data = { headers, rows: [], serverSide: true };
+    const label = `${file.name} (${(file.size / 1024 / 1024).toFixed(1)} MB, compared on the server)`;
+    if (fileNum === 1) {
+        file1Data = data;
+        document.getElementById('fileName1').textContent = label;
+        document.getElementById('upload1').classList.add('active');
+        updateKeyColumnOptions(headers);
+    } else {
+        file2Data = data;
+        document.getElementById('fileName2').textContent = label;
+        document.getElementById('upload2').classList.add('active');
+    }
+    checkCompareButton();
+}
+
+function useServerComparison() {
+    return Boolean(file1Data?.serverSide || file2Data?.serverSide);
+}
+
 // Update key column dropdown options
 function updateKeyColumnOptions(headers) {
     const select = document.getElementById('keyColumn');
@@ -778,10 +825,21 @@ function displayInsights(insights) {
 
 // Update statistics display
 function updateStats(results) {
-    document.getElementById('addedCount').textContent = results.added.length;
-    document.getElementById('removedCount').textContent = results.removed.length;
-    document.getElementById('modifiedCount').textContent = results.modified.length + (results.fuzzyMatched?.length || 0);
-    document.getElementById('unchangedCount').textContent = results.unchanged.length;
+    updateStatCounts({
+        added: results.added.length,
+        removed: results.removed.length,
+        modified: results.modified.length,
+        fuzzy_matched: results.fuzzyMatched?.length || 0,
+        unchanged: results.unchanged.length
+    });
+}
+
+// Update statistics display from per-change-type counts
+function updateStatCounts(counts) {
+    document.getElementById('addedCount').textContent = counts.added;
+    document.getElementById('removedCount').textContent = counts.removed;
+    document.getElementById('modifiedCount').textContent = counts.modified + counts.fuzzy_matched;
+    document.getElementById('unchangedCount').textContent = counts.unchanged;
     document.getElementById('stats').style.display = 'flex';
 }
 
@@ -814,88 +872,24 @@ function displayResults(results) {
 
         html += '</tr></thead><tbody>';
 
-        // Display added rows
         if (showAdded) {
-            results.added.forEach(row => {
-                html += '<tr class="row-added">';
-                html += '<td><span class="change-badge badge-added">➕ Added</span></td>';
-                allHeaders.forEach(header => {
-                    html += `<td>${escapeHtml(row[header] || '')}</td>`;
-                });
-                html += '</tr>';
-            });
+            results.added.forEach(row => { html += buildResultRowHtml('added', row, allHeaders); });
         }
 
-        // Display removed rows
         if (showRemoved) {
-            results.removed.forEach(row => {
-                html += '<tr class="row-removed">';
-                html += '<td><span class="change-badge badge-removed">➖ Removed</span></td>';
-                allHeaders.forEach(header => {
-                    html += `<td>${escapeHtml(row[header] || '')}</td>`;
-                });
-                html += '</tr>';
-            });
+            results.removed.forEach(row => { html += buildResultRowHtml('removed', row, allHeaders); });
         }
 
-        // Display modified rows with enhanced change details
         if (showModified) {
-            results.modified.forEach(item => {
-                html += '<tr class="row-modified">';
-                html += '<td><span class="change-badge badge-modified">✏️ Modified</span></td>';
-                allHeaders.forEach(header => {
-                    const change = item.changes.find(c => c.column === header);
-                    if (change) {
-                        html += '<td><div class="cell-diff">';
-                        html += `<span class="old-value">❌ ${escapeHtml(change.oldValue)}</span>`;
-                        html += `<span class="new-value">✅ ${escapeHtml(change.newValue)}</span>`;
-
-                        // Show change detail if available (e.g., +10%, +5 hours)
-                        if (change.changeDetail) {
-                            html += `<span class="change-detail">${escapeHtml(change.changeDetail)}</span>`;
-                        }
-                        html += '</div></td>';
-                    } else {
-                        html += `<td>${escapeHtml(item.new[header] || '')}</td>`;
-                    }
-                });
-                html += '</tr>';
-            });
+            results.modified.forEach(item => { html += buildResultRowHtml('modified', item, allHeaders); });
 
-            // Display fuzzy matched rows
             if (hasFuzzyMatches) {
-                results.fuzzyMatched.forEach(item => {
-                    html += '<tr class="row-fuzzy">';
-                    html += `<td><span class="change-badge badge-fuzzy">🔍 Fuzzy Match (${(item.similarity * 100).toFixed(0)}%)</span></td>`;
-                    allHeaders.forEach(header => {
-                        const change = item.changes.find(c => c.column === header);
-                        if (change) {
-                            html += '<td><div class="cell-diff">';
-                            html += `<span class="old-value">❌ ${escapeHtml(change.oldValue)}</span>`;
-                            html += `<span class="new-value">✅ ${escapeHtml(change.newValue)}</span>`;
-                            if (change.changeDetail) {
-                                html += `<span class="change-detail">${escapeHtml(change.changeDetail)}</span>`;
-                            }
-                            html += '</div></td>';
-                        } else {
-                            html += `<td>${escapeHtml(item.new[header] || '')}</td>`;
-                        }
-                    });
-                    html += '</tr>';
-                });
+                results.fuzzyMatched.forEach(item => { html += buildResultRowHtml('fuzzy_matched', item, allHeaders); });
             }
         }
 
-        // Display unchanged rows
         if (showUnchanged) {
-            results.unchanged.forEach(row => {
-                html += '<tr>';
-                html += '<td><span class="change-badge badge-unchanged">⚪ Unchanged</span></td>';
-                allHeaders.forEach(header => {
-                    html += `<td>${escapeHtml(row[header] || '')}</td>`;
-                });
-                html += '</tr>';
-            });
+            results.unchanged.forEach(row => { html += buildResultRowHtml('unchanged', row, allHeaders); });
         }
 
         html += '</tbody></table></div>';
@@ -906,6 +900,52 @@ function displayResults(results) {
     document.getElementById('exportSection').style.display = hasChanges ? 'block' : 'none';
 }
 
+// Build one result table row. `item` is the row itself for added/removed/unchanged,
+// or {old, new, changes[, similarity]} for modified and fuzzy matched records.
+function buildResultRowHtml(changeType, item, allHeaders) {
+    const badges = {
+        added: ['row-added', 'badge-added', '➕ Added'],
+        removed: ['row-removed', 'badge-removed', '➖ Removed'],
+        modified: ['row-modified', 'badge-modified', '✏️ Modified'],
+        unchanged: ['', 'badge-unchanged', '⚪ Unchanged']
+    };
+
+    let html;
+    if (changeType === 'fuzzy_matched') {
+        html = '<tr class="row-fuzzy">';
+        html += `<td><span class="change-badge badge-fuzzy">🔍 Fuzzy Match (${(item.similarity * 100).toFixed(0)}%)</span></td>`;
+    } else {
+        const [rowClass, badgeClass, label] = badges[changeType];
+        html = rowClass ? `<tr class="${rowClass}">` : '<tr>';
+        html += `<td><span class="change-badge ${badgeClass}">${label}</span></td>`;
+    }
+
+    if (changeType === 'modified' || changeType === 'fuzzy_matched') {
+        allHeaders.forEach(header => {
+            const change = item.changes.find(c => c.column === header);
+            if (change) {
+                html += '<td><div class="cell-diff">';
+                html += `<span class="old-value">❌ ${escapeHtml(change.oldValue)}</span>`;
+                html += `<span class="new-value">✅ ${escapeHtml(change.newValue)}</span>`;
+
+                // Show change detail if available (e.g., +10%, +5 hours)
+                if (change.changeDetail) {
+                    html += `<span class="change-detail">${escapeHtml(change.changeDetail)}</span>`;
+                }
+                html += '</div></td>';
+            } else {
+                html += `<td>${escapeHtml(item.new[header] || '')}</td>`;
+            }
+        });
+    } else {
+        allHeaders.forEach(header => {
+            html += `<td>${escapeHtml(item[header] || '')}</td>`;
+        });
+    }
+
+    return html + '</tr>';
+}
+
 // Escape HTML to prevent XSS
 function escapeHtml(text) {
     const div = document.createElement('div');
@@ -918,6 +958,8 @@ function clearAll() {
     file1Data = null;
     file2Data = null;
     comparisonResults = null;
+    fileUploads = { 1: null, 2: null };
+    serverComparison = null;
 
     document.getElementById('file1').value = '';
     document.getElementById('file2').value = '';
@@ -942,6 +984,12 @@ function clearAll() {
 
 // Export comparison results to CSV
 function exportResults() {
+    if (serverComparison) {
+        // Streamed by the server straight to a download, never through page memory
+        window.location.href = `/api/aws-log-compare/results/${serverComparison.id}/export.csv?` +
+            new URLSearchParams({ type: selectedServerTypes(false).join(',') });
+        return;
+    }
     if (!comparisonResults) return;
 
     const allHeaders = [...new Set([...file1Data.headers, ...file2Data.headers])];
@@ -1158,6 +1206,163 @@ function parseCSVLine(line, delimiter = ',') {
     return result;
 }
 
+// Re-render results after a filter change
+function refreshResults() {
+    if (serverComparison) {
+        loadServerPage(0, true);
+    } else if (comparisonResults) {
+        displayResults(comparisonResults);
+    }
+}
+
+// ==================== Server-side comparison ====================
+
+// Submit both files as a background comparison job and follow its progress
+async function runServerComparison() {
+    if (!fileUploads[1] || !fileUploads[2]) {
+        document.getElementById('loading').style.display = 'none';
+        showAlert('Error', 'Large files are compared on the server, so both sides must be uploaded as files (not pasted).');
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('file1', fileUploads[1]);
+    formData.append('file2', fileUploads[2]);
+    formData.append('key_column', document.getElementById('keyColumn').value);
+    formData.append('fuzzy', document.getElementById('useFuzzyMatching')?.checked ? 'true' : 'false');
+
+    setLoadingMessage('Uploading log files...');
+    try {
+        const response = await fetch('/api/aws-log-compare/jobs', { method: 'POST', body: formData });
+        const data = await response.json();
+        if (!data.success) throw new Error(data.error);
+        await waitForServerJob(data.job);
+    } catch (error) {
+        document.getElementById('loading').style.display = 'none';
+        showAlert('Error', 'Server-side comparison failed: ' + error.message);
+    } finally {
+        setLoadingMessage('Comparing log files...');
+    }
+}
+
+async function waitForServerJob(job) {
+    while (job.status !== 'completed') {
+        if (job.status === 'failed') throw new Error(job.error || 'Comparison failed');
+        setLoadingMessage(describeJobProgress(job.progress || {}));
+
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/api/aws-log-compare/jobs/${job.job_id}`);
+        const data = await response.json();
+        if (!data.success) throw new Error(data.error);
+        job = data.job;
+    }
+
+    // A job served from the cache points at the earlier comparison's results
+    serverComparison = { id: job.comparison_id || job.job_id };
+    comparisonResults = null;
+    if (job.insights) {
+        // Computed by the server while it diffed, so no result rows need to be downloaded for them
+        displayInsights(job.insights);
+    } else {
+        document.getElementById('insights').style.display = 'none';
+    }
+    await loadServerPage(0, true);
+    document.getElementById('loading').style.display = 'none';
+}
+
+function describeJobProgress(progress) {
+    if (progress.stage === 'diffing' && progress.partitions_total) {
+        const eta = progress.eta_seconds != null ? `, about ${Math.ceil(progress.eta_seconds)}s left` : '';
+        return `Comparing partitions ${progress.partitions_done}/${progress.partitions_total}${eta}...`;
+    }
+    const stages = {
+        queued: 'Waiting for the server...',
+        partitioning: 'Reading and partitioning log files...',
+        merging: 'Collecting results...',
+        fuzzy_matching: 'Fuzzy matching unmatched rows...',
+        indexing: 'Indexing results...'
+    };
+    return stages[progress.stage] || 'Comparing log files...';
+}
+
+function setLoadingMessage(message) {
+    document.querySelector('#loading p').textContent = message;
+}
+
+// Change types selected by the filter checkboxes
+function selectedServerTypes(includeUnchanged = true) {
+    const types = [];
+    if (document.getElementById('showAdded').checked) types.push('added');
+    if (document.getElementById('showRemoved').checked) types.push('removed');
+    if (document.getElementById('showModified').checked) types.push('modified', 'fuzzy_matched');
+    if (includeUnchanged && document.getElementById('showUnchanged').checked) types.push('unchanged');
+    return types;
+}
+
+// Fetch and render one page of server-side results (keyset paging: cursors of visited pages are kept)
+async function loadServerPage(pageIndex, reset = false) {
+    if (reset) {
+        serverPageCursors = [null];
+    }
+    const container = document.getElementById('results');
+    const types = selectedServerTypes();
+    if (types.length === 0) {
+        container.innerHTML = '<div class="no-changes">Select at least one change type.</div>';
+        container.style.display = 'block';
+        return;
+    }
+
+    const params = new URLSearchParams({ type: types.join(','), limit: SERVER_PAGE_SIZE });
+    if (serverPageCursors[pageIndex]) params.set('cursor', serverPageCursors[pageIndex]);
+
+    try {
+        const response = await fetch(`/api/aws-log-compare/results/${serverComparison.id}/rows?${params}`);
+        const data = await response.json();
+        if (!data.success) throw new Error(data.error);
+
+        serverPageIndex = pageIndex;
+        serverPageCursors[pageIndex + 1] = data.next_cursor;
+        displayServerPage(data);
+        updateStatCounts(data.counts);
+    } catch (error) {
+        showAlert('Error', 'Error loading results: ' + error.message);
+    }
+}
+
+function displayServerPage(data) {
+    const container = document.getElementById('results');
+    if (data.total === 0) {
+        container.innerHTML = '<div class="no-changes">No changes found between the log files.</div>';
+        container.style.display = 'block';
+        document.getElementById('exportSection').style.display = 'none';
+        return;
+    }
+
+    let html = '<div style="overflow-x: auto; max-height: 600px; overflow-y: auto;"><table class="result-table"><thead><tr>';
+    html += '<th>Status</th>';
+    data.headers.forEach(header => {
+        html += `<th>${escapeHtml(header)}</th>`;
+    });
+    html += '</tr></thead><tbody>';
+    data.rows.forEach(({ type, record }) => {
+        const item = (type === 'modified' || type === 'fuzzy_matched') ? record : record.row;
+        html += buildResultRowHtml(type, item, data.headers);
+    });
+    html += '</tbody></table></div>';
+
+    const first = serverPageIndex * SERVER_PAGE_SIZE + 1;
+    const last = serverPageIndex * SERVER_PAGE_SIZE + data.rows.length;
+    html += '<div class="server-pagination">';
+    html += `<button class="btn-secondary" onclick="loadServerPage(${serverPageIndex - 1})" ${serverPageIndex === 0 ? 'disabled' : ''}>Previous</button>`;
+    html += `<span>Rows ${first.toLocaleString()}–${last.toLocaleString()} of ${data.total.toLocaleString()}</span>`;
+    html += `<button class="btn-secondary" onclick="loadServerPage(${serverPageIndex + 1})" ${data.next_cursor ? '' : 'disabled'}>Next</button>`;
+    html += '</div>';
+
+    container.innerHTML = html;
+    container.style.display = 'block';
+    document.getElementById('exportSection').style.display = 'block';
+}
+
 // Show alert modal (using global showModal function from base.html)
 function showAlert(title, message) {
     showModal(title, message);
@@ -277,9 +277,12 @@ function displaySequenceEndpoints(endpoints) {
 
     tbody.innerHTML = endpoints.map(endpoint => {
         const hasChanged = changedEndpoints.has(endpoint.id);
-        const sequence = typeof endpoint.sequence_config === 'string'
+        const config = typeof endpoint.sequence_config === 'string'
             ? JSON.parse(endpoint.sequence_config)
             : endpoint.sequence_config;
+        // Weighted endpoints store {mode, steps}; round-robin endpoints store the plain step array
+        const isWeighted = !Array.isArray(config) && config.mode === 'weighted';
+        const sequence = Array.isArray(config) ? config : config.steps;
 
         // Remove animation class after animation completes
         if (hasChanged) {
@@ -291,16 +294,19 @@ function displaySequenceEndpoints(endpoints) {
 
         // Build sequence display with better formatting
         const sequenceDisplay = sequence.map((step, idx) => {
-            const isNext = idx === endpoint.current_index;
+            const isNext = !isWeighted && idx === endpoint.current_index;
             const code = step.http_code;
-            const delay = step.delay_ms > 0 ? `+${step.delay_ms}ms` : '';
-            const stepText = delay ? `${code}<span class="delay-text">${delay}</span>` : code;
+            const delay = step.latency ? `~${step.latency.distribution}` : (step.delay_ms > 0 ? `+${step.delay_ms}ms` : '');
+            const weight = isWeighted ? ` ×${step.weight ?? 1}` : '';
+            const stepText = delay ? `${code}${weight}<span class="delay-text">${delay}</span>` : `${code}${weight}`;
             return isNext ? `<span class="step-current">${stepText}</span>` : `<span class="step-normal">${stepText}</span>`;
-        }).join('<span class="step-arrow">→</span>');
+        }).join(isWeighted ? '<span class="step-arrow">|</span>' : '<span class="step-arrow">→</span>');
 
-        const currentStep = sequence[endpoint.current_index];
-        const stepInfo = `Step ${endpoint.current_index + 1}/${sequence.length}: ${currentStep.http_code}`;
-        const delayInfo = currentStep.delay_ms > 0 ? ` (+${currentStep.delay_ms}ms)` : '';
+        const currentStep = sequence[endpoint.current_index % sequence.length];
+        const stepInfo = isWeighted
+            ? `Weighted random: ${sequence.length} steps`
+            : `Step ${endpoint.current_index + 1}/${sequence.length}: ${currentStep.http_code}`;
+        const delayInfo = !isWeighted && currentStep.delay_ms > 0 ? ` (+${currentStep.delay_ms}ms)` : '';
 
         const statusIcon = endpoint.is_active ? '●' : '○';
         const statusClass = endpoint.is_active ? 'status-active' : 'status-inactive';
@@ -1,5 +1,10 @@
 // JSON Comparison Tool JavaScript
 
+// Inputs larger than this are diffed on the server and only the differences are rendered
+const SERVER_DIFF_THRESHOLD = 1024 * 1024;
+// Streamed file diffs keep counting past this many differences but stop adding them to the page
+const MAX_STREAMED_DIFF_LINES = 10000;
+
 function getPlainText(id) {
     const element = document.getElementById(id);
     return element.textContent || element.innerText || '';
@@ -20,6 +25,13 @@ function compareJSON() {
             return;
         }
 
+        // Only the server matches arrays by inserts/deletes or by key
+        const arrayStrategy = document.getElementById('arrayStrategy').value;
+        if (json1Text.length + json2Text.length > SERVER_DIFF_THRESHOLD || arrayStrategy !== 'index') {
+            compareJSONOnServer(json1Text, json2Text, arrayStrategy);
+            return;
+        }
+
         const obj1 = JSON.parse(json1Text);
         const obj2 = JSON.parse(json2Text);
 
@@ -44,38 +56,156 @@ function compareJSON() {
         document.getElementById('json1').innerHTML = highlightedJSON1;
         document.getElementById('json2').innerHTML = highlightedJSON2;
 
-        // Display detailed differences
-        const diffContainer = document.getElementById('diffContainer');
-        diffContainer.innerHTML = '';
+        displayDifferences(differences);
 
-        if (differences.length === 0) {
-            diffContainer.innerHTML = '<div class="diff-line diff-equal">No differences found - JSON objects are identical!</div>';
-        } else {
-            differences.forEach(diff => {
-                const diffLine = document.createElement('div');
-                diffLine.className = 'diff-line';
-
-                if (diff.type === 'added') {
-                    diffLine.classList.add('diff-added');
-                    diffLine.textContent = `+ ${diff.path}: ${JSON.stringify(diff.value2)}`;
-                } else if (diff.type === 'removed') {
-                    diffLine.classList.add('diff-removed');
-                    diffLine.textContent = `- ${diff.path}: ${JSON.stringify(diff.value1)}`;
-                } else if (diff.type === 'changed') {
-                    diffLine.classList.add('diff-changed');
-                    diffLine.textContent = `± ${diff.path}: ${JSON.stringify(diff.value1)} → ${JSON.stringify(diff.value2)}`;
-                }
-
-                diffContainer.appendChild(diffLine);
-            });
+    } catch (e) {
+        showModal('Error', 'Error parsing JSON: ' + e.message);
+    }
+}
+
+// Diff large documents on the server. The editor texts are spliced into the request body
+// as-is, so the browser never parses (or re-renders) the documents themselves.
+async function compareJSONOnServer(json1Text, json2Text, arrayStrategy = 'index') {
+    const arrayKey = document.getElementById('arrayKey').value.trim();
+    if (arrayStrategy === 'keyed' && !arrayKey) {
+        showModal('Error', 'Please enter the key field used to match array elements');
+        return;
+    }
+
+    try {
+        const options = JSON.stringify({ array_strategy: arrayStrategy, array_key: arrayKey || null });
+        const response = await fetch('/api/json-compare/diff', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: `{"json1":${json1Text},"json2":${json2Text},${options.slice(1)}`
+        });
+        const data = await response.json();
+        if (!data.success) {
+            showModal('Error', 'Error comparing JSON: ' + data.error);
+            return;
+        }
+
+        document.getElementById('addedCount').textContent = data.stats.added;
+        document.getElementById('removedCount').textContent = data.stats.removed;
+        document.getElementById('changedCount').textContent = data.stats.changed;
+        displayDifferences(data.differences, data.truncated);
+    } catch (e) {
+        showModal('Error', 'Error comparing JSON: ' + e.message);
+    }
+}
+
+// Diff two uploaded files on the server without loading them in the browser. Differences
+// arrive as NDJSON while the server walks both documents, so they are shown as they come.
+async function compareJSONFiles() {
+    const file1 = document.getElementById('jsonFile1').files[0];
+    const file2 = document.getElementById('jsonFile2').files[0];
+    if (!file1 || !file2) {
+        showModal('Error', 'Please choose both JSON files');
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('file1', file1);
+    formData.append('file2', file2);
+
+    const diffContainer = document.getElementById('diffContainer');
+    const counts = { added: 0, removed: 0, changed: 0 };
+    let shown = 0;
+    diffContainer.innerHTML = '';
+    ['addedCount', 'removedCount', 'changedCount'].forEach(id => document.getElementById(id).textContent = 0);
+    document.getElementById('results').style.display = 'block';
+
+    const handleLine = line => {
+        const message = JSON.parse(line);
+        if (message.type === 'error') throw new Error(message.error);
+        if (message.type === 'summary') {
+            if (message.identical) {
+                diffContainer.innerHTML = '<div class="diff-line diff-equal">No differences found - JSON objects are identical!</div>';
+            } else if (shown < counts.added + counts.removed + counts.changed) {
+                const note = document.createElement('div');
+                note.className = 'diff-line diff-equal';
+                note.textContent = `Showing the first ${shown} differences.`;
+                diffContainer.appendChild(note);
+            }
+            return;
+        }
+        counts[message.type]++;
+        document.getElementById(`${message.type}Count`).textContent = counts[message.type];
+        if (shown < MAX_STREAMED_DIFF_LINES) {
+            diffContainer.appendChild(createDiffLine(message));
+            shown++;
         }
+    };
 
-        document.getElementById('results').style.display = 'block';
-        document.getElementById('results').scrollIntoView({ behavior: 'smooth' });
+    try {
+        const response = await fetch('/api/json-compare/stream-diff', { method: 'POST', body: formData });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error);
+        }
 
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let pending = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            pending += decoder.decode(value, { stream: true });
+            const lines = pending.split('\n');
+            pending = lines.pop();
+            lines.filter(line => line).forEach(handleLine);
+        }
+        if (pending) handleLine(pending);
     } catch (e) {
-        showModal('Error', 'Error parsing JSON: ' + e.message);
+        showModal('Error', 'Error comparing JSON files: ' + e.message);
+    }
+}
+
+// Show the key field input only for keyed array matching
+function updateArrayOptions() {
+    const keyed = document.getElementById('arrayStrategy').value === 'keyed';
+    document.getElementById('arrayKey').style.display = keyed ? 'inline-block' : 'none';
+}
+
+// Display the detailed list of differences
+function displayDifferences(differences, truncated = false) {
+    const diffContainer = document.getElementById('diffContainer');
+    diffContainer.innerHTML = '';
+
+    if (differences.length === 0) {
+        diffContainer.innerHTML = '<div class="diff-line diff-equal">No differences found - JSON objects are identical!</div>';
+    } else {
+        differences.forEach(diff => diffContainer.appendChild(createDiffLine(diff)));
+
+        if (truncated) {
+            const note = document.createElement('div');
+            note.className = 'diff-line diff-equal';
+            note.textContent = `Showing the first ${differences.length} differences.`;
+            diffContainer.appendChild(note);
+        }
+    }
+
+    document.getElementById('results').style.display = 'block';
+    document.getElementById('results').scrollIntoView({ behavior: 'smooth' });
+}
+
+function createDiffLine(diff) {
+    const diffLine = document.createElement('div');
+    diffLine.className = 'diff-line';
+    // Values of very large added/removed/changed subtrees are cut short by the server
+    const cut = diff.truncated ? ' …' : '';
+
+    if (diff.type === 'added') {
+        diffLine.classList.add('diff-added');
+        diffLine.textContent = `+ ${diff.path}: ${JSON.stringify(diff.value2)}${cut}`;
+    } else if (diff.type === 'removed') {
+        diffLine.classList.add('diff-removed');
+        diffLine.textContent = `- ${diff.path}: ${JSON.stringify(diff.value1)}${cut}`;
+    } else if (diff.type === 'changed') {
+        diffLine.classList.add('diff-changed');
+        diffLine.textContent = `± ${diff.path}: ${JSON.stringify(diff.value1)} → ${JSON.stringify(diff.value2)}${cut}`;
     }
+    return diffLine;
 }
 
 function highlightJSONWithTracking(obj, diffMap, side, path = '', indent = 0) {
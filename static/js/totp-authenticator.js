@@ -8,7 +8,8 @@ let currentEditId = null;
 let currentDeleteId = null;
 
 // TOTP code cache - stores codes fetched from backend
-let totpCodeCache = {};  // { account_id: { code: '123456', time_remaining: 25, fetched_at: timestamp } }
+let totpCodeCache = {};  // { account_id: { code: '123456', next_code: '654321', counter: 56789, time_remaining: 25, fetched_at: timestamp } }
+let totpCodesRequest = null;  // In-flight /api/totp/codes request, shared by concurrent callers
 
 // NTP time synchronization
 let ntpTimeOffset = 0;  // Offset in milliseconds between local time and NTP time
@@ -72,45 +73,65 @@ function getNTPTime() {
 // ===============================================
 // TOTP Code Generation (Backend API)
 // ===============================================
-async function fetchTOTPCode(accountId) {
+async function fetchAllTOTPCodes() {
     /**
-     * Fetch TOTP code from backend using pyotp with NTP time.
-     * This ensures the code matches standard authenticators.
+     * Fetch current and next-window TOTP codes for all accounts in one request
+     * (generated by the backend with pyotp and NTP time). Callers arriving while
+     * a request is in flight share it, so timers rolling over together cost one call.
      */
-    try {
-        const response = await fetch(`/api/totp/generate/${accountId}`);
+    if (!totpCodesRequest) {
+        totpCodesRequest = (async () => {
+            try {
+                const response = await fetch('/api/totp/codes');
 
-        if (!response.ok) {
-            throw new Error('Failed to fetch TOTP code');
-        }
+                if (!response.ok) {
+                    throw new Error('Failed to fetch TOTP codes');
+                }
 
-        const data = await response.json();
+                const data = await response.json();
 
-        if (data.success) {
-            // Cache the code
-            totpCodeCache[accountId] = {
-                code: data.code,
-                time_remaining: data.time_remaining,
-                period: data.period,
-                fetched_at: Date.now()
-            };
-            return data.code;
-        } else {
-            console.error('TOTP generation failed:', data.message);
-            return '000000';
-        }
-    } catch (error) {
-        console.error('Error fetching TOTP code:', error);
-        return '000000';
+                if (data.success) {
+                    totpCodeCache = {};
+                    data.codes.forEach(entry => {
+                        if (entry.error) {
+                            // Only this account shows the placeholder
+                            console.error(`TOTP generation failed for account ${entry.account_id}:`, entry.error);
+                            return;
+                        }
+                        totpCodeCache[entry.account_id] = {
+                            code: entry.code,
+                            next_code: entry.next_code,
+                            counter: entry.counter,
+                            time_remaining: entry.time_remaining,
+                            period: entry.period,
+                            fetched_at: Date.now()
+                        };
+                    });
+                } else {
+                    console.error('TOTP generation failed:', data.message);
+                }
+            } catch (error) {
+                console.error('Error fetching TOTP codes:', error);
+            } finally {
+                totpCodesRequest = null;
+            }
+        })();
     }
+    return totpCodesRequest;
 }
 
-async function fetchAllTOTPCodes() {
+function advanceCachedTOTPCode(accountId, period) {
     /**
-     * Fetch TOTP codes for all accounts in parallel
+     * At a period boundary, switch to the next-window code fetched with the
+     * current one, so the new code shows without waiting for the backend
      */
-    const promises = accounts.map(account => fetchTOTPCode(account.id));
-    await Promise.all(promises);
+    const cached = totpCodeCache[accountId];
+    const counter = Math.floor(getNTPTime() / 1000 / period);
+    if (cached && cached.next_code && cached.counter + 1 === counter) {
+        cached.code = cached.next_code;
+        cached.next_code = null;
+        cached.counter = counter;
+    }
 }
 
 function getCachedTOTPCode(accountId, digits = 6) {
@@ -553,12 +574,22 @@ async function updateAccountTimer(accountId) {
         progressElement.className = `progress-bar ${getProgressClass(progress)}`;
     }
 
-    // Regenerate code when period expires (fetch from backend)
+    // Regenerate code when period expires: show the prefetched next code, then
+    // refresh all codes from the backend (one request shared by every account)
     if (timeRemaining === account.period) {
-        const code = await fetchTOTPCode(accountId);
-        const codeElement = document.getElementById(`code-${accountId}`);
-        if (codeElement) {
-            codeElement.textContent = formatCode(code, account.digits);
+        advanceCachedTOTPCode(accountId, account.period);
+        showCachedTOTPCode(account);
+        await fetchAllTOTPCodes();
+        showCachedTOTPCode(account);
+    }
+}
+
+function showCachedTOTPCode(account) {
+    const codeElement = document.getElementById(`code-${account.id}`);
+    if (codeElement) {
+        const code = formatCode(getCachedTOTPCode(account.id, account.digits), account.digits);
+        if (codeElement.textContent !== code) {
+            codeElement.textContent = code;
             codeElement.classList.remove('copied');
         }
     }
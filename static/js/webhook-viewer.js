@@ -1767,14 +1767,25 @@ class WebhookViewer {
             const headers = JSON.parse(request.headers || "{}");
             const timestamp = new Date(request.timestamp);
             const clientIp = request.client_ip || 'Unknown';
+            // Requests are listed newest first, so the previous delivery is the next one down
+            const index = this.currentRequests.findIndex(r => r.id === request.id);
+            const previous = index >= 0 ? this.currentRequests[index + 1] : null;
 
             const detailsContainer = document.getElementById("requestDetails");
             detailsContainer.innerHTML = `
                         <div class="details-card">
                             <div class="details-header">
                                 <h3>Request Details</h3>
-                                <div style="font-size: 0.9rem; color: var(--text-secondary);">
-                                    ID: ${request.id}
+                                <div class="details-actions">
+                                    ${previous ? `
+                                        <button class="btn-secondary copy-btn" title="Diff against the previous request to this webhook"
+                                                onclick="webhookViewer.compareRequests(${previous.id}, ${request.id})">
+                                            Compare with previous
+                                        </button>
+                                    ` : ''}
+                                    <div style="font-size: 0.9rem; color: var(--text-secondary);">
+                                        ID: ${request.id}
+                                    </div>
                                 </div>
                             </div>
 
@@ -1823,6 +1834,7 @@ class WebhookViewer {
             </table>
         </div>
     ` : ''}
+    <div id="requestDiff"></div>
                         </div>
                     `;
 
@@ -1850,6 +1862,64 @@ class WebhookViewer {
         }
     }
 
+    // The diff is computed server-side, so neither full payload is fetched for it
+    async compareRequests(olderId, newerId) {
+        try {
+            const response = await fetch(`/diff_requests/${olderId}/${newerId}`);
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error);
+            }
+
+            const container = document.getElementById('requestDiff');
+            if (!container) return;
+            container.innerHTML = this.renderRequestDiff(data);
+            container.scrollIntoView({ behavior: 'smooth' });
+        } catch (error) {
+            console.error("Error comparing requests:", error);
+            this.showError("Failed to compare requests");
+        }
+    }
+
+    renderRequestDiff(diff) {
+        const labels = { headers: 'Headers', query_params: 'Query', body: 'Body' };
+        const [older, newer] = diff.requests;
+        const format = value => this.escapeHtml(JSON.stringify(value));
+        const lines = [];
+
+        if (diff.method_changed) {
+            lines.push(`<div class="diff-line diff-changed">± Method: ${this.escapeHtml(older.method)} → ${this.escapeHtml(newer.method)}</div>`);
+        }
+        Object.entries(labels).forEach(([field, label]) => {
+            const result = diff.fields[field];
+            result.differences.forEach(difference => {
+                const path = this.escapeHtml(difference.path ? `${label}: ${difference.path}` : label);
+                if (difference.type === 'added') {
+                    lines.push(`<div class="diff-line diff-added">+ ${path}: ${format(difference.value2)}</div>`);
+                } else if (difference.type === 'removed') {
+                    lines.push(`<div class="diff-line diff-removed">- ${path}: ${format(difference.value1)}</div>`);
+                } else {
+                    lines.push(`<div class="diff-line diff-changed">± ${path}: ${format(difference.value1)} → ${format(difference.value2)}</div>`);
+                }
+            });
+            if (result.truncated) {
+                lines.push(`<div class="diff-line">${label}: showing the first ${result.differences.length} differences</div>`);
+            }
+        });
+
+        return `
+            <div class="json-section">
+                <div class="section-header">
+                    <div class="section-title">
+                        Changes since request ${older.id}
+                        (+${diff.stats.added} −${diff.stats.removed} ±${diff.stats.changed})
+                    </div>
+                </div>
+                ${diff.identical ? '<div class="diff-line">No differences</div>' : lines.join('')}
+            </div>
+        `;
+    }
+
     async copyToClipboard(text, button) {
         try {
             await navigator.clipboard.writeText(text);
@@ -0,0 +1,93 @@
+"""
+Shared test setup. app.py reads its DB settings at import time, so it is imported here with a
+placeholder port; tests that reach the database get the fake_db fixture instead.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DB_PORT", "3306")
+
+import app as webhook_app  # noqa: E402
+
+
+class FakeCursor:
+    """Cursor over the database's rows: COUNT(*) queries get their number, other queries the rows"""
+
+    def __init__(self, database):
+        self.database = database
+        self.rows = [dict(row) if isinstance(row, dict) else row for row in database.rows]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.database.queries.append(sql)
+
+    def fetchone(self):
+        return (len(self.rows),)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    open = True
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Stands in for MySQL: every connection serves `rows` and records the SQL it runs in `queries`"""
+
+    def __init__(self):
+        self.rows = []
+        self.queries = []
+
+    def connect(self, **config):
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(webhook_app.pymysql, "connect", database.connect)
+    return database
+
+
+@pytest.fixture
+def client():
+    """Test client logged in as user 1"""
+    webhook_app.app.config["TESTING"] = True
+    webhook_app.app.secret_key = webhook_app.app.secret_key or "test"
+    with webhook_app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+            session["username"] = "tester"
+        yield client
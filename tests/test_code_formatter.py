@@ -0,0 +1,73 @@
+"""JSON formatting must never change what a document means"""
+import io
+import json
+from collections import OrderedDict
+
+import pytest
+
+import app as webhook_app
+
+MALFORMED_JSON = ['[1 2 3]', '{"a" "b"}', '{"a":1,}', '[1,,2]', '{"a" 1 "b" 2}', '{"a":1} x']
+
+
+@pytest.mark.parametrize("code", MALFORMED_JSON)
+def test_malformed_json_is_not_repaired(code):
+    for formatted in (webhook_app.format_code_standard(code, 'json'), webhook_app.minify_code(code, 'json')):
+        with pytest.raises(ValueError):
+            json.loads(formatted)
+
+
+@pytest.mark.parametrize("code", MALFORMED_JSON)
+def test_malformed_json_falls_back_to_token_formatting(code):
+    assert webhook_app.format_code_in_memory(code, 'json') is None
+    assert webhook_app.format_code_standard(code, 'json') == webhook_app.format_c_like_code(code, 'json')
+
+
+def test_valid_json_is_pretty_printed():
+    code = '{"a": [1, 2.5, {"b": null}], "c": "é", "d": {}}'
+    assert webhook_app.format_code_standard(code, 'json') == json.dumps(json.loads(code), indent=2, ensure_ascii=False)
+    assert webhook_app.minify_code(code, 'json') == json.dumps(json.loads(code), separators=(',', ':'), ensure_ascii=False)
+
+
+def test_stream_reports_malformed_json(client):
+    response = client.post("/api/code-formatter/stream", data={
+        "language": "json", "file": (io.BytesIO(b'{"a": [1 2]}'), "bad.json"),
+    })
+    assert response.status_code == 200
+    assert "ERROR: Expected ',' or ']'" in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("item", [{"code": "a", "language": ["json"]}, {"code": "a", "mode": {"x": 1}}])
+def test_batch_rejects_non_string_options(client, item):
+    response = client.post("/api/code-formatter/batch", json={"items": [{"code": "{}"}, item]})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Item 1: language and mode must be strings"
+
+
+def test_cache_charges_encoded_bytes(monkeypatch):
+    monkeypatch.setattr(webhook_app, "code_format_cache", OrderedDict())
+    monkeypatch.setattr(webhook_app, "code_format_cache_usage", {'bytes': 0, 'hits': 0, 'misses': 0})
+    webhook_app.cache_code_format(("key", "json", "standard"), "é" * 100)
+    assert webhook_app.code_format_cache_usage['bytes'] == 200 + webhook_app.CODE_FORMAT_CACHE_ENTRY_OVERHEAD
+
+
+def stream_markup(code, language="xml", minify=False):
+    return ''.join(webhook_app.iter_formatted_chunks(io.BytesIO(code.encode()), language, minify))
+
+
+def test_long_comments_and_cdata_are_passed_on_in_pieces(monkeypatch):
+    monkeypatch.setattr(webhook_app, "CODE_STREAM_CHUNK_CHARS", 8)
+    code = '<a><!-- one - -- two --><![CDATA[ x ]] ]]]></a>'
+    events = list(webhook_app.iter_markup_events(io.StringIO(code)))
+    assert events[1] == ('comment', '<!--') and ('cdata', '<![CDATA[') in events
+    assert ''.join(text for _, text in events) == code
+    assert stream_markup(code) == '<a>\n  <!-- one - -- two -->\n  <![CDATA[ x ]] ]]]>\n</a>'
+    assert stream_markup(code, minify=True) == '<a><![CDATA[ x ]] ]]]></a>'
+
+
+def test_oversized_tag_is_rejected(monkeypatch):
+    monkeypatch.setattr(webhook_app, "CODE_STREAM_CHUNK_CHARS", 8)
+    monkeypatch.setattr(webhook_app, "MARKUP_TAG_MAX_CHARS", 32)
+    assert stream_markup('<a b="' + 'x' * 20 + '"/>') == '<a b="' + 'x' * 20 + '"/>'
+    with pytest.raises(ValueError, match="Tag longer than 32 characters"):
+        stream_markup('<a b="' + 'x' * 40 + '"/>')
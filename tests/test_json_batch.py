@@ -0,0 +1,68 @@
+"""Archive uploads of the batch JSON comparison (read_json_batch_archive)"""
+import io
+import tarfile
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app as webhook_app
+
+
+def zip_upload(files):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return FileStorage(io.BytesIO(data.getvalue()), "batch.zip")
+
+
+def tar_upload(files):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return FileStorage(io.BytesIO(data.getvalue()), "batch.tar.gz")
+
+
+@pytest.mark.parametrize("upload", [zip_upload, tar_upload])
+def test_pairs_files_by_relative_path(upload):
+    pairs = webhook_app.read_json_batch_archive(upload({
+        "suite/recorded/a.json": b'{"x": 1}',
+        "suite/current/a.json": b'{"x": 2}',
+        "suite/recorded/b.json": b'[]',
+        "README": b'ignored',
+    }))
+    assert pairs == [("a.json", b'{"x": 1}', b'{"x": 2}', True), ("b.json", b'[]', None, True)]
+
+
+def test_rejects_oversized_archive_before_extracting(monkeypatch):
+    monkeypatch.setattr(webhook_app, "JSON_BATCH_MAX_ARCHIVE_BYTES", 1024 * 1024)
+    reads = []
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda self, name, pwd=None: reads.append(name))
+    # 2 MB of zeros deflates to a couple of KB
+    upload = zip_upload({"recorded/a.json": b"0" * (2 * 1024 * 1024), "current/a.json": b"0"})
+    with pytest.raises(ValueError, match="exceed 1 MB uncompressed"):
+        webhook_app.read_json_batch_archive(upload)
+    assert reads == []
+
+
+def test_extraction_stops_at_declared_size(monkeypatch):
+    # A header that understates the size cannot make extraction read more than it declares
+    monkeypatch.setattr(webhook_app, "JSON_BATCH_MAX_ARCHIVE_BYTES", 1024 * 1024)
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("recorded/a.json", b"0" * (8 * 1024 * 1024))
+    raw = data.getvalue().replace((8 * 1024 * 1024).to_bytes(4, "little"), (16).to_bytes(4, "little"))
+    with pytest.raises(ValueError, match="Invalid zip archive"):
+        webhook_app.read_json_batch_archive(FileStorage(io.BytesIO(raw), "batch.zip"))
+
+
+@pytest.mark.parametrize("upload", [zip_upload, tar_upload])
+def test_rejects_too_many_files(monkeypatch, upload):
+    monkeypatch.setattr(webhook_app, "JSON_BATCH_MAX_ARCHIVE_FILES", 4)
+    files = {f"recorded/{i}.json": b"1" for i in range(5)}
+    with pytest.raises(ValueError, match="more than 4 files"):
+        webhook_app.read_json_batch_archive(upload(files))
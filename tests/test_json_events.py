@@ -0,0 +1,136 @@
+"""Syntax checking of the streaming JSON event parser (iter_json_events)"""
+import gzip
+import io
+import json
+
+import pytest
+
+import app as webhook_app
+
+MALFORMED = [
+    '[1 2 3]',
+    '{"a":1,,,}',
+    '{"a" 1 "b" 2}',
+    '{"a":1 "b":2}',
+    '[1,]',
+    '{"a":1,}',
+    '[,1]',
+    '{,}',
+    '{"a":}',
+    '{"a"::1}',
+    '{1:2}',
+    '["a":1]',
+    '[1}',
+    '{"a":1]',
+    '[01]',
+    '1,2',
+    ']',
+    '[',
+    '{"a"',
+]
+
+
+def parse(text, chunk_bytes=None, monkeypatch=None):
+    if chunk_bytes:
+        monkeypatch.setattr(webhook_app, "JSON_STREAM_CHUNK_BYTES", chunk_bytes)
+    return list(webhook_app.iter_json_events(io.BytesIO(text.encode())))
+
+
+@pytest.mark.parametrize("text", MALFORMED)
+def test_malformed_documents_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+@pytest.mark.parametrize("text", [text for text in MALFORMED if text[0] in '[{'])
+def test_malformed_large_containers_are_rejected(text, monkeypatch):
+    # Containers larger than the read buffer are streamed event by event instead of decoded whole
+    with pytest.raises(ValueError):
+        parse('["' + 'x' * 300 + '", ' + text + ']', chunk_bytes=80, monkeypatch=monkeypatch)
+
+
+def test_error_reports_byte_offset():
+    with pytest.raises(ValueError, match="Expected ',' or '\\]' at byte 3"):
+        parse('[1 2 3]')
+    with pytest.raises(ValueError, match="Expected ':' at byte 5"):
+        parse('{"a" 1 "b" 2}')
+
+
+@pytest.mark.parametrize("text, events", [
+    ('[1,2,3]', [('value', [1, 2, 3])]),
+    ('{"a": {"b": [true, null]}}', [('value', {'a': {'b': [True, None]}})]),
+    ('1 "x"\n{}', [('value', 1), ('value', 'x'), ('value', {})]),
+    ('', []),
+])
+def test_valid_documents(text, events):
+    assert parse(text) == events
+
+
+def test_streamed_containers_match_decoded(monkeypatch):
+    text = '{"a": [1, {"b": "' + 'x' * 300 + '"}, []], "c": {}}'
+    events = parse(text, chunk_bytes=80, monkeypatch=monkeypatch)
+    assert events[0] == ('start_map', None)
+    value = webhook_app.read_json_event_value(iter(events[1:]), events[0])[0]
+    assert value == {'a': [1, {'b': 'x' * 300}, []], 'c': {}}
+
+
+def test_streaming_diff_rejects_malformed_document(tmp_path):
+    path1, path2 = tmp_path / "a.json", tmp_path / "b.json"
+    path1.write_text('[1 2 3]')
+    path2.write_text('[1,2,3]')
+    with pytest.raises(ValueError):
+        list(webhook_app.iter_streaming_json_diff_lines(str(path1), str(path2)))
+
+
+def test_streaming_diff_reordered_members(tmp_path, monkeypatch):
+    # Members larger than JSON_STREAM_HOLD_BYTES are held by file offset and parsed again later
+    monkeypatch.setattr(webhook_app, "JSON_STREAM_CHUNK_BYTES", 4096)
+    big = {"rows": list(range(2000))}
+    document1 = {"a": big, "b": "x" * 5000, "c": 1, "d": {"rows": [1]}}
+    document2 = {"d": {"rows": [2]}, "c": 1, "b": "x" * 5000, "a": big, "e": True}
+    path1, path2 = tmp_path / "a.json", tmp_path / "b.json"
+    path1.write_text(json.dumps(document1))
+    path2.write_text(json.dumps(document2))
+    lines = [json.loads(line) for line in webhook_app.iter_streaming_json_diff_lines(str(path1), str(path2))]
+    assert lines[:-1] == [
+        {'type': 'changed', 'path': 'd.rows[0]', 'value1': 1, 'value2': 2},
+        {'type': 'added', 'path': 'e', 'value2': True},
+    ]
+    assert lines[-1]['stats'] == {'added': 1, 'removed': 0, 'changed': 1}
+
+
+def test_control_character_fails_without_reading_on(monkeypatch):
+    monkeypatch.setattr(webhook_app, "JSON_STREAM_CHUNK_BYTES", 1024)
+    f = io.BytesIO(b'["ab\ncd", "' + b'x' * (1024 * 1024) + b'"]')
+    with pytest.raises(ValueError, match="Invalid control character in string at byte 4"):
+        list(webhook_app.iter_json_events(f))
+    assert f.tell() <= 2048
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 7])
+def test_long_strings_span_chunks(monkeypatch, chunk_bytes):
+    monkeypatch.setattr(webhook_app, "JSON_STREAM_LOOKAHEAD", 0)
+    text = 'a\\"b\\\\' * 20 + '\\u00e9é\\n'
+    events = parse('["' + text + '", "' + text + '"]', chunk_bytes=chunk_bytes, monkeypatch=monkeypatch)
+    assert events[1:3] == [('value', json.loads('"' + text + '"'))] * 2
+    with pytest.raises(ValueError, match="Unterminated string"):
+        parse('["' + text, chunk_bytes=chunk_bytes, monkeypatch=monkeypatch)
+    with pytest.raises(ValueError, match="Invalid string"):
+        parse('["' + text + '\\q"]', chunk_bytes=chunk_bytes, monkeypatch=monkeypatch)
+
+
+def test_streaming_diff_caps_decompressed_uploads(client, monkeypatch):
+    monkeypatch.setattr(webhook_app, "JSON_STREAM_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(webhook_app, "JSON_STREAM_MAX_GUNZIP_BYTES", 4096)
+
+    def post(document):
+        return client.post("/api/json-compare/stream-diff", data={
+            "file1": (io.BytesIO(gzip.compress(document.encode())), "a.json.gz"),
+            "file2": (io.BytesIO(b'[1]'), "b.json"),
+        })
+
+    response = post('[1, 2]')
+    assert response.status_code == 200 and '"summary"' in response.get_data(as_text=True)
+    response = post('["' + 'x' * 5000 + '"]')
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("file1 exceeds")
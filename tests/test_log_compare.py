@@ -0,0 +1,138 @@
+"""Format detection and header discovery of the log comparison engine"""
+import csv
+import json
+import os
+
+import pytest
+
+import app as webhook_app
+
+HEADERS = ['id', 'name', 'amount', 'note']
+ROWS = [[str(i), f'n{i}', str(i % 50), 'hello, "world"\nline2' if i % 7 == 0 else f'note {i}'] for i in range(300)]
+
+
+def write_delimited(path, delimiter):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(HEADERS)
+        writer.writerows(ROWS)
+    return str(path)
+
+
+def write_ndjson(path, extra=None):
+    with open(path, 'w') as f:
+        for i, row in enumerate(ROWS):
+            record = dict(zip(HEADERS, row))
+            if extra and i >= len(ROWS) - 10:
+                record[extra] = 'x'
+            f.write(json.dumps(record) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize("delimiter", ['\t', ',', ';', '|'])
+def test_delimiter_ignores_quoted_multiline_fields(tmp_path, delimiter):
+    path = write_delimited(tmp_path / "a.log", delimiter)
+    assert webhook_app.detect_log_format(path) == ('csv', delimiter)
+    assert webhook_app.read_log_headers(path) == HEADERS
+
+
+def test_formats_compare_equal(tmp_path):
+    tsv = write_delimited(tmp_path / "a.tsv", '\t')
+    for other in (write_delimited(tmp_path / "b.csv", ','), write_ndjson(tmp_path / "c.ndjson")):
+        summary = webhook_app.run_log_comparison(1, tsv, other, 'id')
+        assert summary['counts']['unchanged'] == len(ROWS)
+        assert summary['headers'] == HEADERS
+
+
+def test_ndjson_headers_include_late_fields(tmp_path, monkeypatch):
+    # Fields first seen after the key scan window are still collected while partitioning
+    monkeypatch.setattr(webhook_app, "LOG_KEY_SCAN_ROWS", 100)
+    old, new = write_ndjson(tmp_path / "a.ndjson"), write_ndjson(tmp_path / "b.ndjson", extra='late')
+    assert webhook_app.read_log_headers(new) == HEADERS
+    summary = webhook_app.run_log_comparison(1, old, new, 'id')
+    assert summary['headers'] == HEADERS + ['late']
+    assert summary['counts']['modified'] == 10
+    with pytest.raises(ValueError, match="not found: nope"):
+        webhook_app.run_log_comparison(1, old, new, 'id', columns=['nope'])
+
+
+def test_results_span_partition_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_DIR", str(tmp_path / "work"))
+    monkeypatch.setattr(webhook_app, "LOG_RESULT_INDEX_STRIDE", 7)
+    summary = webhook_app.run_log_comparison(1, write_delimited(tmp_path / "a.csv", ','),
+                                             write_ndjson(tmp_path / "b.ndjson"), 'id')
+    comparison_id = summary['comparison_id']
+    segments = webhook_app.load_log_result_segments(webhook_app.log_result_dir(comparison_id), 'unchanged')
+    assert len(segments) == summary['partitions']
+    assert sum(segment['count'] for segment in segments) == len(ROWS)
+
+    lines = list(webhook_app.iter_log_results(comparison_id, 'unchanged'))
+    assert len(lines) == len(ROWS)
+    for offset in (1, 7, 40, 299, 300):
+        assert list(webhook_app.iter_log_results(comparison_id, 'unchanged', offset)) == lines[offset:]
+
+    monkeypatch.setattr(webhook_app, "LOG_RESULT_OPEN_FILES", 2)
+    total, rows = webhook_app.query_log_results(comparison_id, ['unchanged'], sort='key')
+    keys = [record['key'] for _, _, record in rows]
+    assert total == len(ROWS) and keys == sorted(keys)
+
+
+def test_pooled_comparison_matches_inline(tmp_path, monkeypatch):
+    old, new = write_delimited(tmp_path / "a.csv", ','), write_ndjson(tmp_path / "b.ndjson", extra='late')
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_DIR", str(tmp_path / "work"))
+    inline = webhook_app.run_log_comparison(1, old, new, 'id', fuzzy=True)
+
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_WORKERS", 2)
+    monkeypatch.setattr(webhook_app, "PROCESS_POOL_WORKERS", 2)
+    monkeypatch.setattr(webhook_app, "process_pool", None)
+    try:
+        pooled = webhook_app.run_log_comparison(1, old, new, 'id', fuzzy=True)
+    finally:
+        webhook_app.get_process_pool().shutdown()
+    assert pooled['counts'] == inline['counts']
+    for change_type in webhook_app.LOG_COMPARE_CHANGE_TYPES:
+        assert list(webhook_app.iter_log_results(pooled['comparison_id'], change_type)) == \
+            list(webhook_app.iter_log_results(inline['comparison_id'], change_type))
+
+
+def test_fuzzy_stage_reads_new_rows_from_disk(tmp_path):
+    old_rows = [{'key': 'a1', 'row': {'id': 'a1', 'msg': 'disk full on volume seven'}},
+                {'key': 'a2', 'row': {'id': 'a2', 'msg': 'nothing alike'}}]
+    new_rows = [{'key': 'b9', 'row': {'id': 'b9', 'msg': 'completely different text'}},
+                {'key': 'b1', 'row': {'id': 'b1', 'msg': 'disk full on volume seven!'}}]
+    paths = {}
+    for side, records in (('old', old_rows), ('new', new_rows)):
+        paths[side] = tmp_path / f"unmatched-{side}.ndjson"
+        paths[side].write_text(''.join(json.dumps(record) + '\n' for record in records))
+    writers = webhook_app.open_log_result_writers(str(tmp_path), 'fuzzy')
+    webhook_app.run_log_fuzzy_stage(str(paths['old']), str(paths['new']), ['msg'], writers, {})
+    segments = webhook_app.close_log_result_writers(writers)
+    assert {change_type: stats['count'] for change_type, stats in segments.items() if stats['count']} == \
+        {'fuzzy_matched': 1, 'removed': 1, 'added': 1}
+    matched = json.loads((tmp_path / "fuzzy_matched-fuzzy.ndjson").read_text())
+    assert (matched['key'], matched['new_key']) == ('a1', 'b1')
+    assert json.loads((tmp_path / "added-fuzzy.ndjson").read_text()) == new_rows[0]
+
+
+def test_blocking_keys_are_stable_across_processes():
+    # hash() is salted per process; the keys (and so the fuzzy matches) must not be
+    assert webhook_app.log_blocking_keys({'msg': 'Disk full', 'path': '/a'}, ['msg', 'path']) == \
+        [345087423, 540506737, 1714797400, 2325093660, 1886079517]
+
+
+def test_oversized_partitions_are_split_again(tmp_path, monkeypatch):
+    old, new = write_delimited(tmp_path / "a.csv", ','), write_ndjson(tmp_path / "b.ndjson", extra='late')
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_DIR", str(tmp_path / "work"))
+    whole = webhook_app.run_log_comparison(1, old, new, 'id', fuzzy=True)
+
+    loaded = []
+    load_log_partition = webhook_app.load_log_partition
+    monkeypatch.setattr(webhook_app, "load_log_partition", lambda path: loaded.append(path) or load_log_partition(path))
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_SPLIT_BYTES", 1000)
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_PARTITION_BYTES", 500)
+    split = webhook_app.run_log_comparison(1, old, new, 'id', fuzzy=True)
+    assert any(os.path.basename(path).count('-') == 2 for path in loaded)  # parts like old-3-1.tsv
+    assert split['counts'] == whole['counts'] and split['counts']['modified'] == 10
+    for change_type in webhook_app.LOG_COMPARE_CHANGE_TYPES:
+        assert sorted(webhook_app.iter_log_results(split['comparison_id'], change_type)) == \
+            sorted(webhook_app.iter_log_results(whole['comparison_id'], change_type))
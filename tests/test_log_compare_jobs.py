@@ -0,0 +1,35 @@
+"""Claiming background log comparison jobs across workers"""
+import json
+import os
+
+import app as webhook_app
+
+
+def write_job(job_id, status, created_at):
+    os.makedirs(webhook_app.log_job_dir(job_id))
+    with open(os.path.join(webhook_app.log_job_dir(job_id), "job.json"), "w") as f:
+        json.dump({"job_id": job_id, "status": status, "created_at": created_at}, f)
+
+
+def test_claimed_jobs_are_not_listed_or_run_twice(tmp_path, monkeypatch):
+    monkeypatch.setattr(webhook_app, "LOG_COMPARE_DIR", str(tmp_path))
+    running, queued, done = "a" * 32, "b" * 32, "c" * 32
+    write_job(running, "running", "2024-01-01T00:00:02")
+    write_job(queued, "queued", "2024-01-01T00:00:01")
+    write_job(done, "completed", "2024-01-01T00:00:00")
+
+    lock_file = webhook_app.claim_log_compare_job(running)
+    assert lock_file is not None
+    assert webhook_app.claim_log_compare_job(running) is None
+    assert webhook_app.list_unclaimed_log_compare_jobs() == [queued]
+
+    ran = []
+    monkeypatch.setattr(webhook_app, "execute_log_compare_job", ran.append)
+    webhook_app.run_log_compare_job(running)
+    assert ran == []
+
+    # A worker that exits (or dies) releases its claim
+    lock_file.close()
+    assert webhook_app.list_unclaimed_log_compare_jobs() == [queued, running]
+    webhook_app.run_log_compare_job(running)
+    assert ran == [running]
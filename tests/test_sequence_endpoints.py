@@ -0,0 +1,44 @@
+"""Validation of sequence endpoint configs before they are saved or imported"""
+import pytest
+
+import app as webhook_app
+
+
+def weighted(*weights):
+    return {"mode": "weighted", "steps": [{"http_code": 200, "delay_ms": 0, "weight": w} for w in weights]}
+
+
+@pytest.mark.parametrize("weight", [float("nan"), float("inf"), "1e999", "-Infinity"])
+def test_non_finite_weights_are_rejected(weight):
+    assert webhook_app.validate_sequence_config(weighted(1, weight)) == "Step 2: Weight must be a finite number"
+
+
+@pytest.mark.parametrize("weights", [(0, 0), (1e308, 1e308)])
+def test_weights_must_add_up_to_a_drawable_total(weights):
+    assert webhook_app.validate_sequence_config(weighted(*weights)) == \
+        "Step weights must add up to a positive, finite number"
+
+
+def test_weighted_step_choice():
+    assert webhook_app.validate_sequence_config(weighted(0, 2.5)) is None
+    assert webhook_app.choose_weighted_step(weighted(0, 2.5)["steps"]) == 1
+    # Stored before weights were checked: picked uniformly instead of failing the request
+    assert webhook_app.choose_weighted_step(weighted(0, float("nan"))["steps"]) in (0, 1)
+
+
+def test_import_checks_description_and_is_active():
+    config = weighted(1)
+    endpoints = [
+        {"endpoint_name": "ok", "sequence_config": config, "description": None, "is_active": True},
+        {"endpoint_name": "exported", "sequence_config": config, "description": "d", "is_active": 0},
+        {"endpoint_name": "a", "sequence_config": config, "description": ["x"]},
+        {"endpoint_name": "b", "sequence_config": config, "description": "x" * 65536},
+        {"endpoint_name": "c", "sequence_config": config, "is_active": "yes"},
+        {"endpoint_name": "d", "sequence_config": config, "is_active": 2},
+    ]
+    assert [(error["index"], error["error"]) for error in webhook_app.validate_sequence_import(endpoints)] == [
+        (2, "Description must be a string"),
+        (3, "Description must be at most 65535 bytes"),
+        (4, "is_active must be true, false, 1 or 0"),
+        (5, "is_active must be true, false, 1 or 0"),
+    ]
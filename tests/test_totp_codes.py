@@ -0,0 +1,41 @@
+"""Batched TOTP code generation (/api/totp/codes)"""
+import pyotp
+import pytest
+
+import app as webhook_app
+
+NOW = 1_700_000_015.0
+ROWS = [
+    {'id': 1, 'secret_key': 'JBSWY3DPEHPK3PXP', 'digits': 6, 'period': 30},
+    {'id': 2, 'secret_key': 'not base32!', 'digits': 6, 'period': 30},
+    {'id': 3, 'secret_key': 'KRSXG5CTMVRXEZLU', 'digits': 8, 'period': 60},
+]
+
+
+@pytest.fixture
+def client(client, fake_db, monkeypatch):
+    fake_db.rows = ROWS
+    monkeypatch.setattr(webhook_app, "get_ntp_time", lambda: NOW)
+    webhook_app.forget_totp_accounts(1)
+    yield client
+    webhook_app.forget_totp_accounts(1)
+
+
+def test_codes_for_all_accounts_in_one_query(client, fake_db):
+    data = client.get("/api/totp/codes").get_json()
+    codes = {entry['account_id']: entry for entry in data['codes']}
+    totp = pyotp.TOTP('JBSWY3DPEHPK3PXP')
+    assert codes[1]['code'] == totp.at(NOW)
+    assert codes[1]['next_code'] == totp.at(NOW, counter_offset=1)
+    assert codes[3]['code'] == pyotp.TOTP('KRSXG5CTMVRXEZLU', digits=8, interval=60).at(NOW)
+
+    client.get("/api/totp/codes")
+    assert len(fake_db.queries) == 1
+
+
+def test_invalid_secret_fails_only_its_account(client):
+    response = client.get("/api/totp/codes")
+    assert response.status_code == 200
+    codes = {entry['account_id']: entry for entry in response.get_json()['codes']}
+    assert codes[2] == {'account_id': 2, 'error': 'Failed to generate code', 'period': 30}
+    assert 'code' in codes[1] and 'code' in codes[3]
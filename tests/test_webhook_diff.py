@@ -0,0 +1,26 @@
+"""Cached webhook request diffs stay within their memory budget"""
+import json
+from collections import OrderedDict
+
+import app as webhook_app
+
+
+def test_cache_is_bounded_by_serialized_size(monkeypatch):
+    monkeypatch.setattr(webhook_app, "webhook_diff_cache", OrderedDict())
+    monkeypatch.setattr(webhook_app, "webhook_diff_cache_usage", {'bytes': 0})
+    monkeypatch.setattr(webhook_app, "WEBHOOK_DIFF_CACHE_MAX_MB", 1)
+    result = {"fields": {"body": "é" * 50000}}
+    serialized = json.dumps(result, separators=(',', ':'), ensure_ascii=False)
+    charged = len(serialized.encode()) + webhook_app.WEBHOOK_DIFF_CACHE_ENTRY_OVERHEAD
+    for request_id in range(20):
+        webhook_app.cache_webhook_diff((1, request_id, request_id + 1), result)
+    assert len(webhook_app.webhook_diff_cache) == 1024 * 1024 // charged
+    assert webhook_app.webhook_diff_cache_usage['bytes'] == len(webhook_app.webhook_diff_cache) * charged
+    assert (1, 19, 20) in webhook_app.webhook_diff_cache and (1, 0, 1) not in webhook_app.webhook_diff_cache
+
+    webhook_app.forget_webhook_diffs(20)
+    assert (1, 19, 20) not in webhook_app.webhook_diff_cache
+    assert webhook_app.webhook_diff_cache_usage['bytes'] == len(webhook_app.webhook_diff_cache) * charged
+
+    webhook_app.cache_webhook_diff((1, 1, 2), {"fields": {"body": "x" * (1024 * 1024)}})  # over a quarter
+    assert (1, 1, 2) not in webhook_app.webhook_diff_cache
@@ -0,0 +1,73 @@
+"""Webhook drift jobs: bounded queue, state shared through WEBHOOK_DRIFT_DIR"""
+import json
+import os
+import time
+from datetime import datetime
+from queue import Queue
+
+import pytest
+
+import app as webhook_app
+
+ROWS = [
+    (1, datetime(2024, 5, 1, 1), json.dumps({"id": 1, "status": "paid"})),
+    (2, datetime(2024, 5, 1, 2), json.dumps({"id": 2, "status": "paid"})),
+    (3, datetime(2024, 5, 2, 1), json.dumps({"id": 3, "status": 4, "extra": True})),
+]
+WINDOWS = {
+    "webhook_id": "orders",
+    "window1": {"start": "2024-05-01T00:00:00Z", "end": "2024-05-02T00:00:00Z"},
+    "window2": {"start": "2024-05-02T00:00:00Z", "end": "2024-05-03T00:00:00Z"},
+}
+
+
+@pytest.fixture
+def client(client, fake_db, tmp_path, monkeypatch):
+    fake_db.rows = ROWS
+    monkeypatch.setattr(webhook_app, "WEBHOOK_DRIFT_DIR", str(tmp_path))
+    return client
+
+
+def wait_for_job(client, job_id):
+    for _ in range(200):
+        job = client.get(f"/api/webhook-drift/jobs/{job_id}").get_json()["job"]
+        if job["status"] in webhook_app.WEBHOOK_DRIFT_JOB_FINISHED:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("drift job did not finish")
+
+
+def test_job_state_is_read_from_disk(client):
+    response = client.post("/api/webhook-drift/jobs", json=WINDOWS)
+    assert response.status_code == 202
+    job = wait_for_job(client, response.get_json()["job"]["job_id"])
+    assert job["status"] == "completed"
+    assert job["progress"] == {"rows": 3, "total_rows": 3}
+    paths = {entry["path"]: entry["status"] for entry in job["report"]["paths"]}
+    assert paths["extra"] == "added" and paths["status"] == "type_changed"
+    # Another server process polling the job only has the state file to go on
+    assert webhook_app.load_webhook_drift_job(job["job_id"], 1)["report"] == job["report"]
+    assert webhook_app.load_webhook_drift_job(job["job_id"], 2) is None
+
+
+def test_full_queue_refuses_jobs(client, monkeypatch):
+    monkeypatch.setattr(webhook_app, "webhook_drift_job_queue", Queue(maxsize=1))
+    monkeypatch.setattr(webhook_app, "webhook_drift_workers_started", True)  # nothing drains the queue
+    assert client.post("/api/webhook-drift/jobs", json=WINDOWS).status_code == 202
+    response = client.post("/api/webhook-drift/jobs", json=WINDOWS)
+    assert response.status_code == 503
+    assert len(os.listdir(webhook_app.WEBHOOK_DRIFT_DIR)) == 2  # the queued job's state and lock only
+
+    job, lock_file = webhook_app.webhook_drift_job_queue.get_nowait()
+    # Still held by this process: the job is reported as queued, not interrupted
+    assert client.get(f"/api/webhook-drift/jobs/{job['job_id']}").get_json()["job"]["status"] == "queued"
+    lock_file.close()
+
+
+def test_job_of_exited_process_is_reported_failed(client):
+    job = {"job_id": "d" * 32, "user_id": 1, "webhook_id": "orders", "status": "running",
+           "created_at": "2024-05-03T00:00:00", "windows": [], "progress": {"rows": 10}}
+    webhook_app.save_webhook_drift_job(job)
+    job = client.get(f"/api/webhook-drift/jobs/{job['job_id']}").get_json()["job"]
+    assert job["status"] == "failed"
+    assert "interrupted" in job["error"]